@@ -0,0 +1,15 @@
+import importlib.util
+import os
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "К1_5_UI_DEV.py")
+
+
+@pytest.fixture(scope="session")
+def ui():
+    """Модуль редактора без запуска окна (Tk нужен только при создании OuroMasterEditor)"""
+    spec = importlib.util.spec_from_file_location("ouro_ui", SRC)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+
+def glyphs(count, w, pages, seed=1):
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(count):
+        g = bytearray(w * pages)
+        for i in range(len(g)):
+            g[i] = rnd.choice((0, 0, 0xFF, rnd.randrange(256)))  # серии и литералы вперемешку
+        out.append(bytes(g))
+    return out
+
+
+@pytest.mark.parametrize("w,pages", [(8, 1), (10, 2), (16, 3), (128, 8)])
+@pytest.mark.parametrize("mode", ["crle", "prle"])
+def test_packed_roundtrip(ui, mode, w, pages):
+    for data in glyphs(4, w, pages) + [bytes(w * pages), b"\xff" * (w * pages)]:
+        code = ui.format_packed(data, mode, "glyph", w, pages)
+        assert ui.unpack_code(code) == [(data, w, pages * 8)]
+
+
+def test_crle_prle_direct(ui):
+    data = glyphs(1, 300, 2)[0]  # серии длиннее 255 столбцов
+    assert ui.crle_unpack(ui.crle_pack(data, 300, 2), 300, 2) == data
+    assert ui.prle_unpack(ui.prle_pack(data, 300), len(data)) == data
+
+
+@pytest.mark.parametrize("w,pages", [(5, 1), (12, 2)])
+def test_dict_roundtrip(ui, w, pages):
+    font = glyphs(40, w, pages) + glyphs(10, w, pages)[:5]  # повторы столбцов
+    unpacked = ui.unpack_code(ui.format_dict(font, "font", w, pages))
+    assert [g for g, _, _ in unpacked] == font
+    assert {(gw, gh) for _, gw, gh in unpacked} == {(w, pages * 8)}
+
+
+def test_dict_wide_index(ui):
+    rnd = random.Random(7)
+    font = [bytes(rnd.randrange(256) for _ in range(32)) for _ in range(30)]  # > 256 уникальных столбцов -> индекс uint16_t
+    code = ui.format_dict(font, "font", 16, 2)
+    assert "uint16_t font_index" in code
+    assert [g for g, _, _ in ui.unpack_code(code)] == font
+
+
+def test_anim_roundtrip(ui):
+    w, pages = 24, 2
+    base = glyphs(1, w, pages)[0]
+    frames = [base]
+    for k in range(6):
+        f = bytearray(frames[-1])
+        f[k * 3:k * 3 + 2] = bytes((k, 0xAA))  # мелкие правки -> дельты
+        frames.append(bytes(f))
+    frames.append(glyphs(1, w, pages, seed=9)[0])  # полная смена -> кадр целиком
+    frames.append(frames[-1])  # пустая дельта
+    stream, kinds = ui.anim_pack(frames)
+    assert ui.anim_unpack(bytes(stream), w * pages) == frames
+    assert kinds[0][0] == "full" and "delta" in [k for k, _ in kinds]
+    assert [f for f, _, _ in ui.unpack_code(ui.format_anim(frames, "anim", w, pages))] == frames
+
+
+def test_unpack_code_without_header(ui):
+    assert ui.unpack_code("const uint8_t a[] = {0x01, 0x02};") is None
+
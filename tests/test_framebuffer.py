@@ -0,0 +1,15 @@
+def test_clips_to_height(ui):
+    fb = ui.FrameBuffer(10, 13)
+    fb.insert(0, 8, 10, 8, b"\xff" * 10)
+    assert fb.bbox() == (0, 8, 9, 12)
+    assert fb.extract(0, 8, 10, 8) == b"\x1f" * 10
+    fb.write(0, b"\xff" * 20)
+    assert fb.bbox() == (0, 0, 9, 12) and fb.lit_count == 130
+
+
+def test_load_and_set_column_clip(ui):
+    fb = ui.FrameBuffer(10, 13, b"\xff" * 20)
+    assert fb.lit_count == 130 and fb.row_count[13:] == [0, 0, 0]
+    fb.clear()
+    fb.set_column(3, -1)
+    assert fb.column(3) == (1 << 13) - 1 and fb.bbox() == (3, 0, 3, 12)
@@ -0,0 +1,97 @@
+import random
+import struct
+import zlib
+
+import pytest
+
+
+def chunk(tag, body):
+    return struct.pack(">I", len(body)) + tag + body + struct.pack(">I", zlib.crc32(tag + body))
+
+
+def paeth(a, b, c):
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    return a if pa <= pb and pa <= pc else b if pb <= pc else c
+
+
+def encode(rows, bpp, filters):
+    """Эталонный кодер фильтров PNG (побайтно, как в спецификации)"""
+    out, prev = bytearray(), bytes(len(rows[0]))
+    for y, line in enumerate(rows):
+        ft = filters[y % len(filters)]
+        enc = bytearray()
+        for i, x in enumerate(line):
+            a = line[i - bpp] if i >= bpp else 0
+            b, c = prev[i], prev[i - bpp] if i >= bpp else 0
+            pred = (0, a, b, (a + b) >> 1, paeth(a, b, c))[ft]
+            enc.append((x - pred) & 0xFF)
+        out += bytes([ft]) + enc
+        prev = line
+    return bytes(out)
+
+
+def pack_samples(samples, depth):
+    if depth == 8: return bytes(samples)
+    if depth == 16: return b"".join(struct.pack(">H", v) for v in samples)
+    per = 8 // depth
+    out = bytearray()
+    for i in range(0, len(samples), per):
+        byte = 0
+        for k, v in enumerate(samples[i:i + per]): byte |= v << (8 - depth * (k + 1))
+        out.append(byte)
+    return bytes(out)
+
+
+def make_png(path, w, h, depth, ctype, rows_samples, palette=b"", filters=(0, 1, 2, 3, 4)):
+    channels = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}[ctype]
+    rows = [pack_samples(r, depth) for r in rows_samples]
+    body = encode(rows, max(1, channels * depth // 8), filters)
+    data = b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, depth, ctype, 0, 0, 0))
+    if palette: data += chunk(b"PLTE", palette)
+    data += chunk(b"IDAT", zlib.compress(body)) + chunk(b"IEND", b"")
+    path.write_bytes(data)
+
+
+@pytest.mark.parametrize("depth", [1, 2, 4, 8, 16])
+def test_gray_depths(ui, tmp_path, depth):
+    rnd, w, h = random.Random(depth), 13, 9
+    top = (1 << depth) - 1
+    samples = [[rnd.randrange(top + 1) for _ in range(w)] for _ in range(h)]
+    make_png(tmp_path / "g.png", w, h, depth, 0, samples)
+    scale = (lambda v: v >> 8) if depth == 16 else (lambda v: v * 255 // top)
+    assert ui.read_png(str(tmp_path / "g.png")) == (w, h, [bytes(scale(v) for v in r) for r in samples])
+
+
+@pytest.mark.parametrize("depth", [1, 2, 4, 8])
+def test_palette_depths(ui, tmp_path, depth):
+    rnd, w, h = random.Random(10 + depth), 11, 7
+    n = 1 << depth
+    palette = bytes(rnd.randrange(256) for _ in range(3 * n))
+    samples = [[rnd.randrange(n) for _ in range(w)] for _ in range(h)]
+    make_png(tmp_path / "p.png", w, h, depth, 3, samples, palette)
+    gray = [sum(palette[3 * i:3 * i + 3]) // 3 for i in range(n)]
+    assert ui.read_png(str(tmp_path / "p.png"))[2] == [bytes(gray[v] for v in r) for r in samples]
+
+
+@pytest.mark.parametrize("ctype", [2, 4, 6])
+def test_color_and_alpha(ui, tmp_path, ctype):
+    rnd, w, h = random.Random(ctype), 10, 6
+    channels = {2: 3, 4: 2, 6: 4}[ctype]
+    samples = [[rnd.randrange(256) for _ in range(w * channels)] for _ in range(h)]
+    make_png(tmp_path / "c.png", w, h, 8, ctype, samples)
+    if ctype == 4: expect = [bytes(r[0::2]) for r in samples]
+    else: expect = [bytes((r[i] + r[i + 1] + r[i + 2]) // 3 for i in range(0, len(r), channels)) for r in samples]
+    assert ui.read_png(str(tmp_path / "c.png"))[2] == expect
+
+
+def test_write_png_roundtrip(ui, tmp_path):
+    rows = [bytes((x * 7 + y * 3) & 0xFF for x in range(20)) for y in range(5)]
+    ui.write_png(str(tmp_path / "w.png"), 20, 5, rows)
+    assert ui.read_png(str(tmp_path / "w.png")) == (20, 5, rows)
+
+
+def test_missing_ihdr(ui, tmp_path):
+    (tmp_path / "x.png").write_bytes(b"\x89PNG\r\n\x1a\n" + chunk(b"IEND", b""))
+    with pytest.raises(ValueError, match="no IHDR"):
+        ui.read_png(str(tmp_path / "x.png"))
@@ -0,0 +1,96 @@
+import os
+
+import pytest
+
+
+def make(ui, tmp_path):
+    return ui.Project(str(tmp_path / "game.ouro"))
+
+
+def test_save_reopen(ui, tmp_path):
+    p = make(ui, tmp_path)
+    font = bytes(range(256)) * 3
+    p.save("font8", "font", font, 8, 8, 96, format="8x8 msb")
+    p.save("icon", "glyph", b"\x00" * 16, 8, 16)
+    p.save_session(theme="G", scale=6)
+    p.close()
+    q = make(ui, tmp_path)
+    assert q.names() == ["font8", "icon"] and q.session == {"theme": "G", "scale": 6}
+    data, entry = q.load("font8")
+    assert data == font and entry["meta"] == {"format": "8x8 msb"} and entry["count"] == 96
+    assert entry["z"] and entry["size"] < len(font)  # повторы сжались
+    assert ui.asset_glyphs(data, entry)[1] == font[8:16]
+    q.close()
+
+
+def test_open_reads_only_index(ui, tmp_path):
+    p = make(ui, tmp_path)
+    p.save("screen", "screen", os.urandom(1024), 128, 64)
+    p.close()
+    q = make(ui, tmp_path)
+    assert q._mm is None  # байты активов ещё не читались
+    q.load("screen")
+    q.close()
+
+
+def test_versions_and_append_only(ui, tmp_path):
+    p = make(ui, tmp_path)
+    p.save("icon", "glyph", b"\x01" * 16, 8, 16)
+    size = os.path.getsize(p.path)
+    p.save("icon", "glyph", b"\x02" * 16, 8, 16)
+    assert os.path.getsize(p.path) > size  # новая версия дописана в конец
+    size = os.path.getsize(p.path)
+    p.save("icon", "glyph", b"\x02" * 16, 8, 16, note="same bytes")
+    assert os.path.getsize(p.path) == size and p.assets["icon"]["meta"] == {"note": "same bytes"}
+    assert p.load("icon")[0] == b"\x02" * 16 and p.load("icon", 1)[0] == b"\x01" * 16
+    for k in range(ui.PROJECT_KEEP + 3):
+        p.save("icon", "glyph", bytes([k + 10]) * 16, 8, 16)
+    assert len(p.assets["icon"]["history"]) == ui.PROJECT_KEEP
+    p.close()
+
+
+def test_compact_and_index_growth(ui, tmp_path):
+    p = make(ui, tmp_path)
+    for k in range(300):  # индекс перерастает начальный слот
+        p.save(f"g{k}", "glyph", bytes([k % 256]) * 8, 8, 8)
+    assert p.capacity > ui.PROJECT_SLOT
+    p.save("g0", "glyph", b"\xff" * 8, 8, 8)
+    for k in range(1, 100): p.delete(f"g{k}")
+    assert p.garbage() > 0
+    p.compact(keep=0)
+    assert p.garbage() == 0 and p.assets["g0"]["history"] == []
+    p.close()
+    q = make(ui, tmp_path)
+    assert len(q.names()) == 201 and q.load("g0")[0] == b"\xff" * 8 and q.load("g299")[0] == bytes([299 % 256]) * 8
+    q.close()
+
+
+def test_torn_index_falls_back(ui, tmp_path):
+    p = make(ui, tmp_path)
+    p.save("a", "glyph", b"\x01" * 8, 8, 8)
+    p.save("b", "glyph", b"\x02" * 8, 8, 8)
+    slot, capacity = p.slot, p.capacity
+    p.close()
+    with open(p.path, "r+b") as f:  # оборванная запись активного слота
+        f.seek(ui.PROJECT_HEAD.size + slot * capacity + ui.PROJECT_SLOT_HEAD.size + 5)
+        f.write(b"##")
+    q = make(ui, tmp_path)
+    assert q.names() == ["a"] and q.load("a")[0] == b"\x01" * 8
+    q.close()
+
+
+def test_damaged_data_and_foreign_file(ui, tmp_path):
+    p = make(ui, tmp_path)
+    entry = p.save("a", "glyph", os.urandom(64), 64, 8)
+    p.close()
+    with open(p.path, "r+b") as f:
+        f.seek(entry["offset"])
+        f.write(b"\x00\x00\x00")
+    q = make(ui, tmp_path)
+    with pytest.raises(ValueError):
+        q.load("a")
+    q.close()
+    other = tmp_path / "font.c"
+    other.write_bytes(b"const uint8_t a[] = {0};" + bytes(64))
+    with pytest.raises(ValueError):
+        ui.Project(str(other))
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+SRC = "const uint8_t icons[2][8] = {\r\n    {0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x07, 0x08},\r\n" \
+      "    {0x11, 0x12, 0x13, 0x14, 0x15, 0x16, 0x17, 0x18}\r\n};\r\n"
+
+
+def touch_later(path, text):
+    with open(path, "w", encoding="utf-8", newline="") as f: f.write(text)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))  # отметка точно сменилась
+
+
+def test_write_keeps_crlf_and_other_blocks(ui, tmp_path):
+    path = tmp_path / "icons.c"
+    path.write_bytes(SRC.encode())
+    link = ui.SourceLink(str(path))
+    assert link.write_glyph(1, b"\xff" * 8, expected=link.chunks[1])
+    text = path.read_bytes().decode()
+    assert "\r\n" in text and "0x01, 0x02" in text and text.count("0xFF") == 8
+
+
+def test_write_rereads_external_edit(ui, tmp_path):
+    path = tmp_path / "icons.c"
+    path.write_bytes(SRC.encode())
+    link = ui.SourceLink(str(path))
+    touch_later(str(path), SRC.replace("0x01, 0x02", "0xAA, 0xBB"))  # правка снаружи до опроса
+    link.write_glyph(1, b"\xff" * 8)
+    assert "0xAA, 0xBB" in path.read_text()
+
+
+def test_write_refuses_shifted_block(ui, tmp_path):
+    path = tmp_path / "icons.c"
+    path.write_bytes(SRC.encode())
+    link = ui.SourceLink(str(path))
+    loaded = link.chunks[0]
+    shifted = SRC.replace("    {0x01", "    {0x21, 0x22, 0x23, 0x24, 0x25, 0x26, 0x27, 0x28},\r\n    {0x01")
+    touch_later(str(path), shifted)  # глиф вставлен выше открытого
+    with pytest.raises(ValueError, match="changed on disk"):
+        link.write_glyph(0, b"\xff" * 8, expected=loaded)
+    assert path.read_bytes().decode() == shifted
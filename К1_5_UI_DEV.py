@@ -1,6 +1,2326 @@
 import tkinter as tk
 import re
-from tkinter import colorchooser
+import os
+import sys
+import time
+import struct
+import zlib
+import argparse
+import json
+import concurrent.futures
+import queue
+import threading
+import tempfile
+import mmap
+from tkinter import colorchooser, filedialog, messagebox
+
+# --- КАДРОВЫЙ БУФЕР (ФОРМАТ ST7565) ---
+BIT_TABLES = [bytes((v >> b) & 1 for v in range(256)) for b in range(8)]  # байт -> значение бита b
+
+class FrameBuffer:
+    """Холст в том же виде, что и память дисплея: страницы по 8 строк, 1 байт = колонка из 8 пикселей (LSB сверху).
+    Байт колонки x страницы p лежит по индексу p * width + x.
+    Попутно ведутся счётчики включённых пикселей по колонкам/строкам, рамка (bbox) и маска изменённых страниц."""
+
+    def __init__(self, width=128, height=64, data=None):
+        self.width, self.height = width, height
+        self.pages = (height + 7) // 8
+        self.col_mask = (1 << height) - 1  # колонка целиком; биты от height и ниже в последней странице всегда 0
+        self.buf = bytearray(self.pages * width)
+        self.col_count = [0] * width
+        self.row_count = [0] * (self.pages * 8)
+        self.lit_count = 0
+        self.dirty = 0            # бит p = страница p менялась с последнего take_dirty()
+        self._bbox, self._bbox_valid = None, True
+        if data is not None: self.load(data)
+
+    def get(self, x, y):
+        return (self.buf[(y >> 3) * self.width + x] >> (y & 7)) & 1
+
+    def set(self, x, y, v=1):
+        """Ставит/стирает пиксель, возвращает True если что-то изменилось"""
+        i, bit = (y >> 3) * self.width + x, 1 << (y & 7)
+        old = self.buf[i]
+        new = (old | bit) if v else (old & ~bit)
+        if new == old: return False
+        self.buf[i] = new
+        d = 1 if v else -1
+        self.col_count[x] += d; self.row_count[y] += d; self.lit_count += d
+        self.dirty |= 1 << (y >> 3)
+        if v: self._grow(x, y, x, y)
+        elif self.col_count[x] == 0 or self.row_count[y] == 0: self._bbox_valid = False
+        return True
+
+    def get_col(self, page, x): return self.buf[page * self.width + x]
+
+    def set_col(self, page, x, byte):
+        old = self.column(x)
+        self.buf[page * self.width + x] = byte & (self.col_mask >> (page * 8)) & 0xFF
+        self._track(x, old, self.column(x))
+
+    def column(self, x):
+        """Вся колонка x одним целым: бит y = пиксель (x, y)"""
+        return int.from_bytes(self.buf[x::self.width], 'little')
+
+    def set_column(self, x, value):
+        old = self.column(x)
+        value &= self.col_mask
+        self.buf[x::self.width] = value.to_bytes(self.pages, 'little')
+        self._track(x, old, value)
+
+    def write(self, offset, data):
+        """Запись сырых байтов страниц с учётом счётчиков (затронутые колонки пересчитываются)"""
+        n = len(data)
+        if n >= self.width: cols = range(self.width)
+        else: cols = sorted({(offset + i) % self.width for i in range(n)})
+        olds = [(x, self.column(x)) for x in cols]
+        self.buf[offset:offset + n] = data
+        self._clip_tail()
+        for x, old in olds: self._track(x, old, self.column(x))
+
+    def _clip_tail(self):
+        """Высота не кратна 8: строки ниже height в последней странице гасятся"""
+        if self.height % 8:
+            t = (self.pages - 1) * self.width
+            self.buf[t:] = self.buf[t:].translate(MASK_TABLES[self.height % 8])
+
+    # --- УЧЁТ ЗАНЯТОСТИ: рамка, колонки, строки, грязные страницы ---
+    def _grow(self, x0, y0, x1, y1):
+        if not self._bbox_valid: return
+        b = self._bbox
+        self._bbox = (x0, y0, x1, y1) if b is None else (min(b[0], x0), min(b[1], y0), max(b[2], x1), max(b[3], y1))
+
+    def _track(self, x, old, new):
+        diff = old ^ new
+        if not diff: return
+        c = bin(new).count('1')
+        self.lit_count += c - self.col_count[x]; self.col_count[x] = c
+        rc, d = self.row_count, diff
+        while d:
+            low = d & -d; d ^= low
+            y = low.bit_length() - 1
+            if new & low: rc[y] += 1
+            else:
+                rc[y] -= 1
+                if rc[y] == 0: self._bbox_valid = False
+        if c == 0: self._bbox_valid = False
+        p = 0
+        while diff:
+            if diff & 0xFF: self.dirty |= 1 << p
+            diff >>= 8; p += 1
+        added = new & ~old
+        if added: self._grow(x, (added & -added).bit_length() - 1, x, added.bit_length() - 1)
+
+    def _rebuild(self):
+        """Полный пересчёт счётчиков после массовой замены буфера"""
+        w = self.width
+        self.col_count = [bin(self.column(x)).count('1') for x in range(w)]
+        for p in range(self.pages):
+            page = bytes(self.buf[p * w:(p + 1) * w])
+            for b in range(8): self.row_count[p * 8 + b] = page.translate(BIT_TABLES[b]).count(1)
+        self.lit_count = sum(self.col_count)
+        self.dirty = (1 << self.pages) - 1
+        self._bbox_valid = False
+
+    def bbox(self):
+        """Рамка включённых пикселей (x0, y0, x1, y1) включительно, или None; пересчёт только после стирания края"""
+        if not self._bbox_valid:
+            xs = [x for x, c in enumerate(self.col_count) if c]
+            ys = [y for y, c in enumerate(self.row_count) if c]
+            self._bbox = (xs[0], ys[0], xs[-1], ys[-1]) if xs else None
+            self._bbox_valid = True
+        return self._bbox
+
+    def take_dirty(self):
+        """Маска страниц, изменённых с прошлого вызова (для частичной перерисовки)"""
+        d, self.dirty = self.dirty, 0
+        return d
+
+    def clear(self):
+        self.buf[:] = bytes(len(self.buf))
+        self.col_count = [0] * self.width
+        self.row_count = [0] * (self.pages * 8)
+        self.lit_count = 0
+        self.dirty = (1 << self.pages) - 1
+        self._bbox, self._bbox_valid = None, True
+
+    def load(self, data):
+        data = bytes(data)[:len(self.buf)]
+        self.buf[:len(data)] = data
+        self.buf[len(data):] = bytes(len(self.buf) - len(data))
+        self._clip_tail()
+        self._rebuild()
+
+    def to_bytes(self): return bytes(self.buf)
+    def copy(self): return FrameBuffer(self.width, self.height, self.buf)
+
+    def lit(self):
+        """Перебор включённых пикселей (x, y) без обхода пустых байтов"""
+        w = self.width
+        for i, byte in enumerate(self.buf):
+            if byte:
+                p, x = divmod(i, w)
+                for b in range(8):
+                    if (byte >> b) & 1: yield x, p * 8 + b
+
+    def extract(self, x, y, w, h):
+        """Вырезает прямоугольник в формате глифа: ceil(h/8) страниц по w байт. Всё за пределами холста = 0"""
+        pages = (h + 7) // 8
+        if y >= 0 and y % 8 == 0 and h % 8 == 0 and x >= 0 and x + w <= self.width and y + h <= self.pages * 8:
+            p0 = y >> 3
+            return b''.join(bytes(self.buf[(p0 + p) * self.width + x:(p0 + p) * self.width + x + w]) for p in range(pages))
+        mask, out = (1 << h) - 1, bytearray(pages * w)
+        for c in range(w):
+            cx = x + c
+            if not 0 <= cx < self.width: continue
+            col = self.column(cx)
+            v = ((col >> y) if y >= 0 else (col << -y)) & mask
+            for p in range(pages):
+                out[p * w + c] = (v >> (p * 8)) & 0xFF
+        return bytes(out)
+
+    def insert(self, x, y, w, h, data, op='set'):
+        """Вставляет глиф (ceil(h/8) страниц по w байт) в точку x, y с обрезкой по краям.
+        op: 'set' — заменить, 'or' — наложить, 'xor' — инвертировать, 'andnot' — стереть по маске"""
+        pages = (h + 7) // 8
+        data = bytes(data)[:pages * w].ljust(pages * w, b'\x00')
+        if op == 'set' and y >= 0 and y % 8 == 0 and h % 8 == 0 and x >= 0 and x + w <= self.width and y + h <= self.height:
+            p0 = y >> 3
+            olds = [self.column(cx) for cx in range(x, x + w)]
+            for p in range(pages):
+                i = (p0 + p) * self.width + x
+                self.buf[i:i + w] = data[p * w:(p + 1) * w]
+            for c, old in enumerate(olds): self._track(x + c, old, self.column(x + c))
+            return
+        full = self.col_mask
+        mask = (1 << h) - 1
+        mask = ((mask << y) if y >= 0 else (mask >> -y)) & full
+        for c in range(w):
+            cx = x + c
+            if not 0 <= cx < self.width: continue
+            src = int.from_bytes(data[c::w], 'little') & ((1 << h) - 1)
+            src = ((src << y) if y >= 0 else (src >> -y)) & full
+            col = self.column(cx)
+            if op == 'or': col |= src
+            elif op == 'xor': col ^= src
+            elif op == 'andnot': col &= ~src
+            else: col = (col & ~mask) | src
+            self.set_column(cx, col)
+
+# --- РАСТР РАБОЧЕЙ ОБЛАСТИ (ОДНА КАРТИНКА ВМЕСТО ТЫСЯЧ ПРЯМОУГОЛЬНИКОВ) ---
+def hex_to_rgb(color):
+    return bytes.fromhex(color.lstrip('#'))
+
+# Индексная картинка: точка цвета i = байты (3i, 3i+1, 3i+2); 0 фон, 1 пиксель, 2 сетка, 3 линии страниц,
+# 4 — «луковая калька» (пиксель соседнего кадра анимации).
+# Смена палитры — один bytes.translate по таблице palette_table, без пересборки строк
+INDEX_RGB = [bytes((3 * i, 3 * i + 1, 3 * i + 2)) for i in range(5)]
+PALETTE_KEYS = ("bg", "px", "grid", "lgrid", "onion")
+GHOST_TABLES = [bytes(((v >> b) & 1) << 1 for v in range(256)) for b in range(8)]  # байт -> 2 * бит b (индекс кальки)
+
+def palette_table(colors):
+    table = bytearray(256)
+    for i, key in enumerate(PALETTE_KEYS): table[3 * i:3 * i + 3] = hex_to_rgb(colors[key])
+    return bytes(table)
+
+class PixelRaster:
+    """Геометрия картинки рабочей области w x h при масштабе scale/stretch: сетка запечена прямо в пиксели.
+    Строки картинки размечены заранее, поэтому кадр собирается из готовых байтовых строк"""
+
+    def __init__(self, w, h, scale, stretch, grid=True, line_grid=False):
+        self.w, self.h, self.scale = w, h, scale
+        self.g = 1 if grid and scale >= 4 else 0
+        self.ys = [int(j * scale * stretch) for j in range(h + 1)]
+        self.width, self.height = w * scale + self.g, self.ys[h] + self.g
+        # kinds[r]: номер строки пикселей, либо -1 (линия сетки), -2 (линия страниц)
+        self.kinds = [0] * self.height
+        for j in range(h):
+            for r in range(self.ys[j], self.ys[j + 1]): self.kinds[r] = j
+        if self.g:
+            for y in self.ys: self.kinds[y] = -1
+        if line_grid:
+            for j in range(0, h + 1, 8):
+                for r in (self.ys[j] - 1, self.ys[j]):
+                    if 0 <= r < self.height: self.kinds[r] = -2
+
+    def cell_box(self, i, j):
+        """Внутренность клетки (i, j) без линий сетки: x1, y1, x2, y2 (правая/нижняя граница не включена)"""
+        rows = [r for r in range(self.ys[j], self.ys[j + 1]) if self.kinds[r] == j]
+        if not rows: return None
+        return i * self.scale + self.g, rows[0], (i + 1) * self.scale, rows[-1] + 1
+
+    def rows(self, fb, x0, y0, ghost=None):
+        """Строки картинки в индексах палитры (3 байта на точку, см. INDEX_RGB); одинаковые строки — один объект.
+        ghost — буфер соседнего кадра: его пиксели под пустыми клетками fb рисуются цветом onion"""
+        bg, px, gc, lc, on = INDEX_RGB
+        lead = gc if self.g else b''
+        seg = (lead + bg * (self.scale - self.g), lead + px * (self.scale - self.g),
+               lead + on * (self.scale - self.g), lead + px * (self.scale - self.g))
+        grid_row = gc * self.width
+        lgrid_row = lc * self.width
+        cache, out = {}, []
+        for k in self.kinds:
+            if k == -1: out.append(grid_row); continue
+            if k == -2: out.append(lgrid_row); continue
+            row = cache.get(k)
+            if row is None:
+                y = y0 + k
+                if 0 <= y < fb.height:
+                    # Строка пикселей = страница через таблицу бита: по байту-индексу на столбец, без цикла по точкам
+                    base, bit = (y >> 3) * fb.width, y & 7
+                    a, b = max(0, x0), max(0, min(fb.width, x0 + self.w))
+                    bits = fb.buf[base + a:base + b].translate(BIT_TABLES[bit])
+                    if ghost is not None: bits = or_rows(bits, ghost.buf[base + a:base + b].translate(GHOST_TABLES[bit]))
+                    bits = (bytes(min(self.w, a - x0)) + bits).ljust(self.w, b'\x00')
+                else: bits = bytes(self.w)
+                row = cache[k] = b''.join(map(seg.__getitem__, bits)) + lead
+            out.append(row)
+        return out
+
+    def body(self, fb, x0, y0, ghost=None):
+        """Индексная картинка целиком (изменяемая: refresh_px патчит в ней клетки)"""
+        return bytearray(b''.join(self.rows(fb, x0, y0, ghost)))
+
+    def patch(self, body, i, j, lit, ghost=False):
+        """Перекрашивает клетку (i, j) индексной картинки в фон/пиксель/кальку"""
+        box = self.cell_box(i, j)
+        if not box: return
+        x1, y1, x2, y2 = box
+        code, stride = INDEX_RGB[1 if lit else 4 if ghost else 0] * (x2 - x1), self.width * 3
+        for r in range(y1, y2): body[r * stride + x1 * 3:r * stride + x2 * 3] = code
+
+    def header(self):
+        return b'P6\n%d %d\n255\n' % (self.width, self.height)
+
+    def ppm(self, fb, x0, y0, colors, body=None, ghost=None):
+        """PPM для PhotoImage: индексы переводятся в цвета одной операцией bytes.translate"""
+        if body is None: body = self.body(fb, x0, y0, ghost)
+        return self.header() + body.translate(colors["table"] if "table" in colors else palette_table(colors))
+
+# --- ЖУРНАЛ ОТМЕНЫ (XOR-ДЕЛЬТЫ ПО БАЙТАМ СТРАНИЦ) ---
+class UndoJournal:
+    """Каждая запись — список участков (смещение, XOR-маска) между состоянием до и после операции.
+    Одна и та же маска откатывает и повторяет операцию. Глубина ограничена не числом шагов, а памятью."""
+    RUN_OVERHEAD = 16  # примерная цена одного участка в байтах сверх самой маски
+
+    def __init__(self, budget=512 * 1024):
+        self.budget = budget
+        self.undo_stack, self.redo_stack = [], []
+        self.used = 0
+        self._base = None
+
+    @property
+    def active(self): return self._base is not None
+
+    def begin(self, fb):
+        """Открывает запись; повторный вызов внутри открытой записи ничего не делает (штрих = одна запись)"""
+        if self._base is None: self._base = fb.to_bytes()
+
+    def commit(self, fb):
+        """Закрывает запись; пустые операции в журнал не попадают"""
+        if self._base is None: return False
+        base, self._base = self._base, None
+        cur = fb.to_bytes()
+        if cur == base: return False
+        xored = (int.from_bytes(base, 'little') ^ int.from_bytes(cur, 'little')).to_bytes(len(cur), 'little')
+        runs = [(m.start(), m.group()) for m in re.finditer(rb'[^\x00]+', xored)]
+        self._push(self.undo_stack, runs)
+        for runs_ in self.redo_stack: self.used -= self.cost(runs_)
+        self.redo_stack.clear()
+        self._trim()
+        return True
+
+    def cost(self, runs):
+        return sum(len(xs) + self.RUN_OVERHEAD for _, xs in runs)
+
+    def _push(self, stack, runs):
+        stack.append(runs); self.used += self.cost(runs)
+
+    def _trim(self):
+        while self.used > self.budget and len(self.undo_stack) > 1:
+            self.used -= self.cost(self.undo_stack.pop(0))
+
+    @staticmethod
+    def apply(fb, runs):
+        for off, xs in runs:
+            n = len(xs)
+            seg = int.from_bytes(fb.buf[off:off + n], 'little') ^ int.from_bytes(xs, 'little')
+            fb.write(off, seg.to_bytes(n, 'little'))
+
+    def undo(self, fb):
+        self.commit(fb)
+        if not self.undo_stack: return False
+        runs = self.undo_stack.pop()
+        self.apply(fb, runs); self.redo_stack.append(runs)
+        return True
+
+    def redo(self, fb):
+        self.commit(fb)
+        if not self.redo_stack: return False
+        runs = self.redo_stack.pop()
+        self.apply(fb, runs); self.undo_stack.append(runs)
+        return True
+
+    def clear(self):
+        self.undo_stack.clear(); self.redo_stack.clear(); self.used = 0; self._base = None
+
+# --- РАЗБОР И КОДИРОВАНИЕ C-МАССИВОВ (ОБЩЕЕ ДЛЯ GUI И CLI) ---
+COMMENT_RE = re.compile(r'/\*.*?\*/|//[^\n]*', re.S)
+BAD_LITERAL_RE = re.compile(r'\b0[xX](?![0-9A-Fa-f]{2}\b)[0-9A-Fa-f]+\b|\b0[bB](?![01]{8}\b)[01]+\b')
+ARRAY_RE = re.compile(r'([A-Za-z_]\w*)\s*((?:\[[^\]]*\]\s*)+)=\s*\{')
+STATUS_RE = re.compile(r'gStatusLine\[\s*([A-Za-z_0-9]+)\s*(?:\+\s*(\d+)\s*)?\]\s*\|=\s*(0x[0-9A-Fa-f]{2}|0b[01]{8})\s*;')
+
+def strip_comments(text):
+    return COMMENT_RE.sub('', text)
+
+# --- ОДНОПРОХОДНЫЙ ТОКЕНИЗАТОР С КЭШЕМ ПО БЛОКАМ ---
+# Все ветви начинаются с '/', '[', '{' или '}' — regex быстро проскакивает байтовые литералы
+STRUCT_RE = re.compile(r'/\*.*?\*/|//[^\n]*|/\s*(?P<sl>\w+)\s*/(?![*/])|(?P<sq>\[)|(?P<br>[{}])', re.S)
+NAME_BEFORE_RE = re.compile(r'(\w+)\s*\Z')
+NAME_AFTER_RE = re.compile(r'\s*(\w+)')
+LITERAL_RE = re.compile(r'/\*.*?\*/|//[^\n]*|(?P<hex>0x[0-9A-Fa-f]{2})|(?P<bin>0b[01]{8})', re.S)
+
+class BitmapBlock:
+    """Блок байтов: содержимое {...} (braced=True) либо текст между блоками. Позиции литералов — абсолютные"""
+    __slots__ = ('name', 'index', 'start', 'end', 'braced', 'hex', 'bin', '_lit')
+
+    def __init__(self, name, index, start, end, braced, lit):
+        self.name, self.index, self.start, self.end, self.braced = name, index, start, end, braced
+        self._lit = lit
+        self.hex, self.bin = lit[0], lit[2]
+
+    @property
+    def values(self):
+        """Байты блока: HEX в приоритете, иначе BINARY"""
+        return self.hex or self.bin
+
+    def spans(self, kind):
+        rel = self._lit[1] if kind == 'hex' else self._lit[3]
+        return [(a + self.start, b + self.start) for a, b in rel]
+
+class BitmapTokenizer:
+    """Один проход по структуре текста (комментарии, имена, скобки) + разбор литералов каждого блока.
+    Литералы кэшируются по тексту блока: правка одного глифа заново разбирает только его блок"""
+
+    def __init__(self, cache_size=4096):
+        self.cache_size = cache_size
+        self._cache = {}
+        self._last = (None, None)
+        self._lock = threading.Lock()  # разбор идёт и из фонового потока редактора
+
+    def _structure(self, text):
+        if self._last[0] == text: return self._last[1]
+        var = {}
+        segs, stack, last_end = [], [], 0
+        name, index = None, 0
+        for m in STRUCT_RE.finditer(text):
+            br = m.group('br')
+            if br == '{':
+                if stack: stack[-1][1] = True
+                stack.append([m.end(), False, name])
+            elif br == '}':
+                if not stack: continue
+                start, has_child, b_name = stack.pop()
+                if has_child: continue
+                segs.append((last_end, start - 1, False, name, 0))
+                segs.append((start, m.start(), True, b_name, index))
+                index += 1; last_end = m.end()
+            elif m.group('sq'):
+                # Имя перед '[': массив name[...] или gStatusLine[name ...]
+                nm = NAME_BEFORE_RE.search(text, max(0, m.start() - 64), m.start())
+                if not nm: continue
+                key, val = 'nm', nm.group(1)
+                if val == 'gStatusLine':
+                    st = NAME_AFTER_RE.match(text, m.end())
+                    if not st: continue
+                    key, val = 'st', st.group(1)
+                var.setdefault(key, val)
+                if val != name: name, index = val, 0
+            else:
+                var.setdefault('sl', m.group('sl'))
+        segs.append((last_end, len(text), False, name, 0))
+        var_name = var.get('sl') or var.get('st') or var.get('nm')
+        self._last = (text, (var_name, segs))
+        return var_name, segs
+
+    def _literals(self, chunk):
+        lit = self._cache.get(chunk)
+        if lit is None:
+            hx, hs, bn, bs = [], [], [], []
+            for m in LITERAL_RE.finditer(chunk):
+                if m.group('hex'): hx.append(int(m.group('hex'), 16)); hs.append(m.span())
+                elif m.group('bin'): bn.append(int(m.group('bin'), 2)); bs.append(m.span())
+            lit = (tuple(hx), tuple(hs), tuple(bn), tuple(bs))
+            if len(self._cache) >= self.cache_size: self._cache.pop(next(iter(self._cache)))
+            self._cache[chunk] = lit
+        return lit
+
+    def var_name(self, text):
+        with self._lock: return self._structure(text)[0]
+
+    def blocks(self, text, braced_only=False):
+        """Лениво выдаёт BitmapBlock по порядку текста (пустые промежутки пропускаются)"""
+        with self._lock: segs = self._structure(text)[1]
+        for start, end, braced, name, index in segs:
+            if braced_only and not braced: continue
+            if end <= start: continue
+            with self._lock: lit = self._literals(text[start:end])
+            if braced or lit[0] or lit[2]: yield BitmapBlock(name, index, start, end, braced, lit)
+
+    def values(self, text):
+        """Все байты текста по правилу всего ввода: если есть хоть один HEX — только HEX, иначе BINARY"""
+        hx, bn = [], []
+        for b in self.blocks(text):
+            hx += b.hex; bn += b.bin
+        return hx or bn
+
+    def spans(self, text, kind):
+        out = []
+        for b in self.blocks(text): out += b.spans(kind)
+        return out
+
+TOKENIZER = BitmapTokenizer()
+
+def byte_values(text):
+    """Байты блока: HEX в приоритете, иначе BINARY (комментарии не учитываются)"""
+    return TOKENIZER.values(text)
+
+def guess_var_name(text):
+    return TOKENIZER.var_name(text)
+
+KNOWN_DIMS = {14: (7, 16), 20: (10, 16), 6: (6, 8)}  # число байтов -> размер для частых глифов прошивки
+
+def guess_dims(total):
+    """Размер картинки по числу байтов (правила parse_and_draw); выше 16 px — только через формат (detect_format)"""
+    if total in KNOWN_DIMS: return KNOWN_DIMS[total]
+    return (total, 8) if total <= 12 else (total // 2, 16)
+
+def guess_template_dims(total):
+    """Размер по шаблону во вводе (правила crop_and_generate)"""
+    if total in KNOWN_DIMS: return KNOWN_DIMS[total]
+    return (total, 8) if total < 10 else (total // 2, 16)
+
+HEX_LITERALS = ["0x{:02X}".format(i) for i in range(256)]
+BIN_LITERALS = ["0b{:08b}".format(i) for i in range(256)]
+
+def format_code(data, mode, v_name, template=""):
+    """Вывод в формате HEX / BIN / STATUS; если во вводе был массив — байты подставляются прямо в него"""
+    if mode == "STATUS":
+        return "\n".join(f"gStatusLine[{v_name} + {i}] |= 0x{b:02X};" for i, b in enumerate(data))
+    fmt = "0x{:02X}" if mode == "HEX" else "0b{:08b}"
+    spans = TOKENIZER.spans(template, "hex" if mode == "HEX" else "bin")
+    if spans and "gStatusLine" not in template:
+        # Склейка по позициям литералов: комментарии и форматирование шаблона не трогаются
+        table = HEX_LITERALS if mode == "HEX" else BIN_LITERALS
+        return splice_spans(template, [(a, b, table[v]) for (a, b), v in zip(spans, data)])
+    if mode == "HEX": return "{" + ", ".join([fmt.format(b) for b in data]) + "}"
+    return ", ".join([fmt.format(b) for b in data])
+
+def find_bitmap_arrays(source):
+    """Все растровые таблицы файла: [(имя, [(байты глифа, ошибка или None), ...])].
+    Вложенные {...} — отдельные глифы; блоки gStatusLine[X + i] |= ... собираются в один массив X"""
+    found = []
+    pos = 0
+    while True:
+        m = ARRAY_RE.search(source, pos)
+        if not m: break
+        depth, i = 0, m.end() - 1
+        while i < len(source):
+            c = source[i]
+            if source.startswith('/*', i): j = source.find('*/', i + 2); i = len(source) if j < 0 else j + 1
+            elif source.startswith('//', i): j = source.find('\n', i); i = len(source) if j < 0 else j
+            elif c == '{': depth += 1
+            elif c == '}':
+                depth -= 1
+                if depth == 0: break
+            i += 1
+        body = source[m.end():i]
+        pos = i + 1
+        clean = strip_comments(body)
+        blocks = re.findall(r'\{([^{}]*)\}', clean) or [clean]
+        dims = [int(d) for d in re.findall(r'\[\s*(\d+)\s*\]', m.group(2))]
+        glyphs = []
+        for block in blocks:
+            vals, err = byte_values(block), None
+            bad = BAD_LITERAL_RE.search(block)
+            if bad: err = f"bad literal {bad.group()!r}"
+            elif not vals: err = "no byte literals"
+            elif dims and len(dims) > 1 and len(vals) != dims[-1]: err = f"{len(vals)} bytes, declared {dims[-1]}"
+            glyphs.append((vals, err))
+        if any(vals or err for vals, err in glyphs): found.append((m.group(1), glyphs))
+    status = {}
+    for m in STATUS_RE.finditer(strip_comments(source)):
+        v = m.group(3)
+        status.setdefault(m.group(1), {})[int(m.group(2) or 0)] = int(v, 16) if v.startswith('0x') else int(v, 2)
+    for name, cols in status.items():
+        vals = [cols.get(i, 0) for i in range(max(cols) + 1)]
+        found.append((name, [(vals, None if len(cols) == len(vals) else "gaps in gStatusLine offsets")]))
+    return found
+
+# --- СВЯЗЬ С ФАЙЛОМ ИСХОДНИКА (СЛЕЖЕНИЕ И ЗАПИСЬ НА МЕСТО) ---
+def splice_spans(text, edits):
+    """Замена участков текста: edits = [(начало, конец, строка)] по возрастанию, без пересечений"""
+    parts, pos = [], 0
+    for a, b, new in edits:
+        parts.append(text[pos:a]); parts.append(new); pos = b
+    parts.append(text[pos:])
+    return "".join(parts)
+
+def block_edits(block, data):
+    """Правки литералов блока под новые байты; вид литерала (HEX/BINARY) остаётся как в файле"""
+    kind, table = ("hex", HEX_LITERALS) if block.hex else ("bin", BIN_LITERALS)
+    return [(a, b, table[v]) for (a, b), v in zip(block.spans(kind), data)]
+
+def atomic_write(path, text):
+    """Запись через временный файл рядом + os.replace: читатель видит либо старый файл, либо новый целиком.
+    text — str (UTF-8, переводы строк как есть) или bytes"""
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix="." + os.path.basename(path) + ".", suffix=".tmp", dir=folder)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(text if isinstance(text, bytes) else text.encode("utf-8", "surrogateescape"))
+            f.flush(); os.fsync(f.fileno())
+        try: os.chmod(tmp, os.stat(path).st_mode & 0o7777)
+        except OSError: pass
+        os.replace(tmp, path)
+    except BaseException:
+        try: os.unlink(tmp)
+        except OSError: pass
+        raise
+
+class SourceLink:
+    """Открытый .c/.h: текст с диска, отметка (mtime, размер) и тексты блоков {...}.
+    Внешняя правка сравнивается по блокам; запись меняет только литералы одного блока"""
+
+    def __init__(self, path):
+        self.path = path
+        self.text, self.stamp, self.chunks = "", None, []
+        self.reload()
+
+    def _stamp(self):
+        st = os.stat(self.path)
+        return st.st_mtime_ns, st.st_size
+
+    def changed(self):
+        try: return self._stamp() != self.stamp
+        except OSError: return False  # файл как раз подменяют — проверим в следующий раз
+
+    def _index(self):
+        self.chunks = [self.text[b.start:b.end] for b in TOKENIZER.blocks(self.text, braced_only=True)]
+
+    def reload(self):
+        """Перечитывает файл; возвращает номера блоков, текст которых изменился или появился"""
+        stamp = self._stamp()
+        with open(self.path, encoding="utf-8", errors="surrogateescape", newline="") as f: text = f.read()
+        old = self.chunks
+        self.text, self.stamp = text, stamp
+        self._index()
+        return [i for i, c in enumerate(self.chunks) if i >= len(old) or old[i] != c]
+
+    def write_glyph(self, block_no, data, override=None, expected=None):
+        """Байты глифа (как в редакторе) -> литералы блока block_no в формате файла; False, если писать нечего.
+        expected — текст блока, из которого глиф был открыт: если на диске блок уже другой, ValueError вместо записи"""
+        if self.changed(): self.reload()  # внешняя правка, которую опрос ещё не увидел, не затирается
+        block = next((b for i, b in enumerate(TOKENIZER.blocks(self.text, braced_only=True)) if i == block_no), None)
+        if block is None: raise IndexError(f"no block {block_no} in {os.path.basename(self.path)}")
+        if expected is not None and (self.text[block.start:block.end].replace("\r\n", "\n")
+                                     != expected.replace("\r\n", "\n")):
+            raise ValueError(f"block {block_no} of {os.path.basename(self.path)} changed on disk; reload before saving")
+        fmt = detect_format(len(block.values), self.text, override)
+        text = splice_spans(self.text, block_edits(block, fmt.encode(data)))
+        if text == self.text: return False
+        atomic_write(self.path, text)
+        self.text, self.stamp = text, self._stamp()
+        self._index()
+        return True
+
+# --- ФАЙЛ ПРОЕКТА (.ouro): ИНДЕКС В НАЧАЛЕ, АКТИВЫ ДОПИСЫВАЮТСЯ В КОНЕЦ ---
+# [заголовок][слот индекса 0][слот индекса 1][данные активов...]
+# Заголовок: сигнатура, версия, активный слот, ёмкость слота. Слот: длина и crc32 JSON-индекса, сам индекс.
+# Сохранение актива = дописать его байты в конец + записать индекс в неактивный слот + переключить слот в заголовке:
+# файл не переписывается, а оборванная запись оставляет целым прежний индекс
+PROJECT_MAGIC, PROJECT_VERSION = b"OURO", 1
+PROJECT_HEAD = struct.Struct('<4sHHI')
+PROJECT_SLOT_HEAD = struct.Struct('<II')
+PROJECT_SLOT = 8 * 1024  # начальная ёмкость слота; индекс не влез — compact с удвоенной
+PROJECT_KEEP = 8  # прошлых версий актива в файле (история между сессиями; лишнее убирает compact)
+ASSET_KINDS = ("glyph", "font", "screen", "anim")
+
+class Project:
+    """Проект из именованных активов: байты страниц (count глифов/кадров w x h) + метаданные.
+    Открытие читает только заголовок и индекс; байты актива берутся из mmap по запросу"""
+
+    def __init__(self, path):
+        self.path = path
+        self.assets, self.session = {}, {}  # имя -> запись индекса; состояние редактора (тема, имя, размеры)
+        self.slot, self.capacity = 0, PROJECT_SLOT
+        self._mm = None
+        if os.path.exists(path): self._read_index()
+        else: self._rewrite({})
+
+    @property
+    def data_start(self):
+        return PROJECT_HEAD.size + 2 * self.capacity
+
+    # --- индекс ---
+    def _read_slot(self, f, slot):
+        f.seek(PROJECT_HEAD.size + slot * self.capacity)
+        n, crc = PROJECT_SLOT_HEAD.unpack(f.read(PROJECT_SLOT_HEAD.size))
+        blob = f.read(n) if n <= self.capacity - PROJECT_SLOT_HEAD.size else b''
+        if not n or len(blob) != n or zlib.crc32(blob) != crc: return None  # пустой слот (после compact) или оборванный
+        return json.loads(blob.decode("utf-8"))
+
+    def _read_index(self):
+        with open(self.path, "rb") as f:
+            magic, version, self.slot, self.capacity = PROJECT_HEAD.unpack(f.read(PROJECT_HEAD.size))
+            if magic != PROJECT_MAGIC: raise ValueError(f"{self.path}: not a project file")
+            if version > PROJECT_VERSION: raise ValueError(f"{self.path}: project version {version} is newer than this editor")
+            index = self._read_slot(f, self.slot)
+            if index is None: index = self._read_slot(f, 1 - self.slot)  # запись индекса оборвалась — прежний слот цел
+            if index is None: raise ValueError(f"{self.path}: project index is damaged")
+        self.assets, self.session = index["assets"], index.get("session", {})
+
+    def _index_blob(self):
+        return json.dumps({"assets": self.assets, "session": self.session}, separators=(",", ":")).encode("utf-8")
+
+    def _write_index(self):
+        blob = self._index_blob()
+        if len(blob) + PROJECT_SLOT_HEAD.size > self.capacity:
+            self.compact(self.capacity * 2); return
+        slot = 1 - self.slot
+        with open(self.path, "r+b") as f:
+            f.seek(PROJECT_HEAD.size + slot * self.capacity)
+            f.write(PROJECT_SLOT_HEAD.pack(len(blob), zlib.crc32(blob)) + blob)
+            f.flush(); os.fsync(f.fileno())
+            f.seek(0)
+            f.write(PROJECT_HEAD.pack(PROJECT_MAGIC, PROJECT_VERSION, slot, self.capacity))
+            f.flush(); os.fsync(f.fileno())
+        self.slot = slot
+
+    # --- данные ---
+    def _view(self, offset, size):
+        if self._mm is None or offset + size > len(self._mm):
+            self.close()
+            with open(self.path, "rb") as f: self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mm[offset:offset + size]
+
+    def close(self):
+        if self._mm is not None: self._mm.close(); self._mm = None
+
+    def names(self):
+        return list(self.assets)
+
+    def load(self, name, rev=0):
+        """Байты актива (rev = 0 — текущая версия, 1 — предыдущая...) и его запись индекса"""
+        entry = self.assets[name]
+        offset, size, crc, packed = ([entry["offset"], entry["size"], entry["crc"], entry["z"]] if rev == 0
+                                     else entry["history"][rev - 1])
+        data = self._view(offset, size)
+        if zlib.crc32(data) != crc: raise ValueError(f"{name}: asset data is damaged")
+        return (zlib.decompress(data) if packed else data), entry
+
+    def save(self, name, kind, data, w, h, count=1, **meta):
+        """Новая версия актива: байты дописываются в конец файла, прежняя версия уходит в историю"""
+        data = bytes(data)
+        packed = zlib.compress(data, 9)
+        z = len(packed) < len(data)
+        blob = packed if z else data
+        old = self.assets.get(name)
+        if old is not None and (old["crc"], old["size"]) == (zlib.crc32(blob), len(blob)):
+            # байты те же — новая версия не нужна, меняются только метаданные
+            old.update(kind=kind, w=w, h=h, count=count, meta=meta)
+            self._write_index()
+            return old
+        with open(self.path, "ab") as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(blob); f.flush(); os.fsync(f.fileno())
+        history = ([[old["offset"], old["size"], old["crc"], old["z"]]] + old["history"])[:PROJECT_KEEP] if old else []
+        self.assets[name] = {"kind": kind, "w": w, "h": h, "count": count, "offset": offset, "size": len(blob),
+                             "crc": zlib.crc32(blob), "z": z, "raw": len(data), "history": history, "meta": meta}
+        self._write_index()
+        return self.assets[name]
+
+    def delete(self, name):
+        if self.assets.pop(name, None) is not None: self._write_index()
+
+    def save_session(self, **session):
+        self.session = session
+        self._write_index()
+
+    def garbage(self):
+        """Байт в файле, которые не нужны ни одной версии ни одного актива (уберёт compact)"""
+        live = sum(e["size"] + sum(h[1] for h in e["history"]) for e in self.assets.values())
+        return os.path.getsize(self.path) - self.data_start - live
+
+    def compact(self, capacity=None, keep=PROJECT_KEEP):
+        """Переписывает файл целиком (через временный файл): только живые версии, слот индекса нужной ёмкости"""
+        self._rewrite(self.assets, capacity, keep)
+
+    def _rewrite(self, assets, capacity=None, keep=PROJECT_KEEP):
+        capacity = capacity or self.capacity
+        chunks, new_assets = [], {}
+        pos = PROJECT_HEAD.size + 2 * capacity
+        for name, entry in assets.items():
+            versions = [[entry["offset"], entry["size"], entry["crc"], entry["z"]]] + entry["history"][:keep]
+            moved = []
+            for offset, size, crc, z in versions:
+                chunks.append(self._view(offset, size)); moved.append([pos, size, crc, z]); pos += size
+            new_assets[name] = dict(entry, offset=moved[0][0], history=moved[1:])
+        self.close()
+        self.assets, self.capacity, self.slot = new_assets, capacity, 0
+        while True:
+            blob = self._index_blob()
+            if len(blob) + PROJECT_SLOT_HEAD.size <= self.capacity: break
+            # индекс не влез: слоты шире — все смещения сдвигаются
+            shift = self.capacity
+            self.capacity *= 2
+            for e in self.assets.values():
+                e["offset"] += 2 * shift
+                e["history"] = [[o + 2 * shift, s, c, z] for o, s, c, z in e["history"]]
+        slot0 = (PROJECT_SLOT_HEAD.pack(len(blob), zlib.crc32(blob)) + blob).ljust(self.capacity, b'\x00')
+        head = PROJECT_HEAD.pack(PROJECT_MAGIC, PROJECT_VERSION, 0, self.capacity)
+        atomic_write(self.path, head + slot0 + bytes(self.capacity) + b''.join(chunks))
+
+def asset_glyphs(data, entry):
+    """Байты актива -> count глифов/кадров w x h (байты редактора)"""
+    size = entry["w"] * ((entry["h"] + 7) // 8)
+    return [data[i * size:(i + 1) * size] for i in range(entry["count"])]
+
+def font_table(name, glyphs, fmt):
+    """Глифы -> C-таблица с подсказкой /* format: ... */ (её читают ввод, ATLAS и batch)"""
+    rows = ",\n".join("    {" + ", ".join(HEX_LITERALS[b] for b in fmt.encode(g)) + "}" for g in glyphs)
+    return f"/* format: {fmt} */\nconst uint8_t {name}[{len(glyphs)}][{fmt.size}] = {{\n{rows}\n}};"
+
+# --- СЖАТЫЕ ФОРМАТЫ (CRLE / PRLE / DICT) ---
+# Заголовок /* packed:<режим> WxH ... */ перед массивом — по нему parse_and_draw распаковывает блок обратно
+PACKED_RE = re.compile(r'/\*\s*packed:(crle|prle|dict|anim)\s+(\d+)x(\d+)')
+NUMBER_RE = re.compile(r'\b(?:0[xX][0-9A-Fa-f]+|0[bB][01]+|\d+)\b')
+
+def page_columns(data, w, pages):
+    """Глиф (постранично) -> столбцы: bytes по байту на страницу"""
+    data = bytes(data).ljust(w * pages, b'\x00')
+    return [data[x::w][:pages] for x in range(w)]
+
+def columns_to_pages(cols, w, pages):
+    out = bytearray(w * pages)
+    for p in range(pages): out[p * w:(p + 1) * w] = bytes(c[p] for c in cols)
+    return bytes(out)
+
+def crle_pack(data, w, pages):
+    """RLE по столбцам: [счётчик 1..255, байты столбца по страницам]..."""
+    out, cols, x = bytearray(), page_columns(data, w, pages), 0
+    while x < w:
+        n = 1
+        while x + n < w and n < 255 and cols[x + n] == cols[x]: n += 1
+        out.append(n); out += cols[x]; x += n
+    return bytes(out)
+
+def crle_unpack(packed, w, pages):
+    cols, i = [], 0
+    while len(cols) < w and i + pages < len(packed):
+        cols += [packed[i + 1:i + 1 + pages]] * packed[i]; i += 1 + pages
+    return columns_to_pages(cols[:w], w, pages)
+
+PRLE_RUN_RE = re.compile(rb'(.)\1{1,128}', re.S)
+
+def prle_pack(data, w):
+    """RLE по страницам с литералами (как PackBits): c < 0x80 — далее c+1 байт как есть,
+    c >= 0x80 — следующий байт повторить c-0x7E раз (2..129). Серии не переходят границу страницы"""
+    data, out = bytes(data), bytearray()
+    def literal(chunk):
+        for k in range(0, len(chunk), 128):
+            part = chunk[k:k + 128]; out.append(len(part) - 1); out.extend(part)
+    for p in range(0, len(data), w):
+        page, pos = data[p:p + w], 0
+        for m in PRLE_RUN_RE.finditer(page):
+            a, b = m.span()
+            if b - a == 2 and a > pos: continue  # пара внутри литерала дешевле оставить литералом
+            if a > pos: literal(page[pos:a])
+            out.append(0x7E + b - a); out.append(page[a]); pos = b
+        if pos < len(page): literal(page[pos:])
+    return bytes(out)
+
+def prle_unpack(packed, length):
+    out, i = bytearray(), 0
+    while len(out) < length and i < len(packed):
+        c = packed[i]
+        if c < 0x80: out += packed[i + 1:i + 2 + c]; i += 2 + c
+        else: out += packed[i + 1:i + 2] * (c - 0x7E); i += 2
+    return bytes(out[:length]).ljust(length, b'\x00')
+
+def dict_pack(glyphs, w, pages):
+    """Общий словарь столбцов на всю таблицу: (словарь столбцов, индексы w на глиф)"""
+    table, index = {}, []
+    for vals in glyphs:
+        for col in page_columns(vals, w, pages): index.append(table.setdefault(col, len(table)))
+    return b''.join(table), index
+
+def dict_unpack(dictionary, index, w, pages):
+    cols = [dictionary[i * pages:(i + 1) * pages] for i in range(len(dictionary) // pages)]
+    return [columns_to_pages([cols[k] for k in index[g:g + w]], w, pages) for g in range(0, len(index), w)]
+
+C_DECODERS = {
+    "crle": """static void crle_unpack(const uint8_t *src, uint8_t *dst, uint8_t w, uint8_t pages)
+{
+    for (uint8_t x = 0; x < w; src += pages) {
+        for (uint8_t n = *src++; n && x < w; n--, x++)
+            for (uint8_t p = 0; p < pages; p++) dst[p * w + x] = src[p];
+    }
+}""",
+    "prle": """static void prle_unpack(const uint8_t *src, uint8_t *dst, uint16_t len)
+{
+    const uint8_t *end = dst + len;
+    while (dst < end) {
+        uint8_t c = *src++;
+        if (c < 0x80) { for (c++; c && dst < end; c--) *dst++ = *src++; }
+        else { uint8_t v = *src++; for (c -= 0x7E; c && dst < end; c--) *dst++ = v; }
+    }
+}""",
+    "anim": """static const uint8_t *anim_step(const uint8_t *src, uint8_t *dst, uint16_t size)
+{
+    uint8_t n = *src++;
+    if (n == 0xFF) {
+        for (uint16_t i = 0; i < size; i++) dst[i] = *src++;
+        return src;
+    }
+    while (n--) {
+        uint16_t off = src[0] | (src[1] << 8);
+        uint8_t len = src[2];
+        for (src += 3; len; len--) dst[off++] ^= *src++;
+    }
+    return src;
+}""",
+    "dict": """static void dict_unpack(const uint8_t *dict, const {itype} *index, uint8_t *dst, uint8_t w, uint8_t pages)
+{
+    for (uint8_t x = 0; x < w; x++) {
+        const uint8_t *col = dict + index[x] * pages;
+        for (uint8_t p = 0; p < pages; p++) dst[p * w + x] = col[p];
+    }
+}""",
+}
+
+def c_array(name, values, ctype="uint8_t", per_line=16):
+    fmt = "0x{:04X}" if ctype == "uint16_t" else "0x{:02X}"
+    lines = [", ".join(fmt.format(v) for v in values[k:k + per_line]) for k in range(0, len(values), per_line)]
+    return f"static const {ctype} {name}[] = {{\n    " + ",\n    ".join(lines) + "\n};"
+
+def size_note(raw, packed):
+    return f"raw {raw} -> {packed} bytes ({packed * 100 // max(1, raw)}%)"
+
+def format_packed(data, mode, v_name, w, pages):
+    """Один глиф в CRLE / PRLE с отчётом о размере и эталонным декодером на C"""
+    mode = mode.lower()
+    packed = crle_pack(data, w, pages) if mode == "crle" else prle_pack(data, w)
+    call = f"{mode}_unpack({v_name}, dst, {w}, {pages})" if mode == "crle" else f"prle_unpack({v_name}, dst, {w * pages})"
+    return "\n".join([f"/* packed:{mode} {w}x{pages * 8} {size_note(w * pages, len(packed))} */",
+                      c_array(v_name, packed), "", f"/* {call}; */", C_DECODERS[mode]])
+
+def format_dict(glyphs, v_name, w, pages):
+    """Таблица шрифта с общим словарём столбцов: {v_name}_dict + {v_name}_index"""
+    dictionary, index = dict_pack(glyphs, w, pages)
+    itype = "uint8_t" if len(dictionary) // pages <= 256 else "uint16_t"
+    packed = len(dictionary) + len(index) * (1 if itype == "uint8_t" else 2)
+    return "\n".join([f"/* packed:dict {w}x{pages * 8} {len(glyphs)} glyphs, {len(dictionary) // pages} unique columns, "
+                      f"{size_note(len(glyphs) * w * pages, packed)} */",
+                      c_array(v_name + "_dict", dictionary), c_array(v_name + "_index", index, itype), "",
+                      f"/* dict_unpack({v_name}_dict, {v_name}_index + glyph * {w}, dst, {w}, {pages}); */",
+                      C_DECODERS["dict"].replace("{itype}", itype)])
+
+def unpack_code(text):
+    """Обратное чтение блока packed:*: [(байты глифа, w, h), ...] или None, если заголовка нет"""
+    m = PACKED_RE.search(text)
+    if not m: return None
+    mode, w, h = m.group(1), int(m.group(2)), int(m.group(3))
+    pages = (h + 7) // 8
+    arrays = [[int(t, 0) if t[:2].lower() in ('0x', '0b') else int(t) for t in NUMBER_RE.findall(body)]
+              for body in re.findall(r'=\s*\{([^{}]*)\}', strip_comments(text[m.end():]))]
+    if not arrays or (mode == "dict" and len(arrays) < 2): return None
+    if mode == "crle": return [(crle_unpack(bytes(arrays[0]), w, pages), w, h)]
+    if mode == "prle": return [(prle_unpack(bytes(arrays[0]), w * pages), w, h)]
+    if mode == "anim": return [(f, w, h) for f in anim_unpack(bytes(arrays[0]), w * pages)]
+    return [(g, w, h) for g in dict_unpack(bytes(arrays[0]), arrays[1], w, pages)]
+
+# --- PNG (ЧИСТЫЙ PYTHON + ZLIB) ---
+def write_png(path, width, height, rows, rgb=False, palette=None):
+    """rows — строки байтов: оттенки серого (1 байт/пиксель), RGB (3 байта/пиксель)
+    или индексы палитры palette (1 байт/пиксель, palette — тройки RGB)"""
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xFFFFFFFF)
+    raw = b''.join(b'\x00' + bytes(r) for r in rows)
+    ctype = 3 if palette else 2 if rgb else 0
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, ctype, 0, 0, 0)
+    plte = chunk(b'PLTE', palette) if palette else b''
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', ihdr) + plte + chunk(b'IDAT', zlib.compress(raw, 6)) + chunk(b'IEND', b''))
+
+def png_unfilter(raw, h, stride, bpp):
+    """Снятие фильтров PNG. None и Up/Sub — целыми строками: строка = большое целое, сложение по байтам без
+    переносов (биты 0-6 складываются, бит 7 — XOR); Sub — префиксная сумма удвоением шага. Average/Paeth — побайтно"""
+    low, high = int.from_bytes(b'\x7f' * stride, 'little'), int.from_bytes(b'\x80' * stride, 'little')
+    add = lambda a, b: ((a & low) + (b & low)) ^ ((a ^ b) & high)
+    rows, prev = [], bytes(stride)
+    for y in range(h):
+        ft, line = raw[y * (stride + 1)], raw[y * (stride + 1) + 1:(y + 1) * (stride + 1)]
+        if ft == 1 or ft == 2:
+            v = int.from_bytes(line, 'little')
+            if ft == 2: v = add(v, int.from_bytes(prev, 'little'))
+            else:
+                k = bpp
+                while k < stride: v = add(v, v << (8 * k)); k *= 2
+            line = v.to_bytes(stride, 'little')
+        elif ft in (3, 4):
+            line = bytearray(line)
+            for i in range(stride):
+                a = line[i - bpp] if i >= bpp else 0; b = prev[i]; c = prev[i - bpp] if i >= bpp else 0
+                if ft == 3: line[i] = (line[i] + ((a + b) >> 1)) & 0xFF
+                else:
+                    p = a + b - c; pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                    line[i] = (line[i] + (a if pa <= pb and pa <= pc else b if pb <= pc else c)) & 0xFF
+            line = bytes(line)
+        rows.append(line); prev = line
+    return rows
+
+CRUMB_TABLES = tuple(bytes((v >> s) & 3 for v in range(256)) for s in (6, 4, 2, 0))  # 2-битные отсчёты байта, слева направо
+
+def png_samples(line, w, depth):
+    """Строка 1/2/4-битных отсчётов -> по байту на отсчёт (как у read_bmp: translate по таблице на позицию в байте)"""
+    tables = [BIT_TABLES[7 - b] for b in range(8)] if depth == 1 else CRUMB_TABLES if depth == 2 else NIBBLE_TABLES
+    idx = bytearray(len(tables) * len(line))
+    for k, t in enumerate(tables): idx[k::len(tables)] = line.translate(t)
+    return bytes(idx[:w])
+
+def read_png(path):
+    """Читает PNG без чересстрочности (серый, RGB, палитра, с альфой; 1-16 бит), возвращает (w, h, [строки серого])"""
+    with open(path, 'rb') as f: data = f.read()
+    if data[:8] != b'\x89PNG\r\n\x1a\n': raise ValueError(f"{path}: not a PNG")
+    pos, idat, palette, head = 8, [], None, None
+    while pos < len(data):
+        n, tag = struct.unpack('>I4s', data[pos:pos + 8]); body = data[pos + 8:pos + 8 + n]; pos += 12 + n
+        if tag == b'IHDR': head = struct.unpack('>IIBBBBB', body)
+        elif tag == b'PLTE': palette = body
+        elif tag == b'IDAT': idat.append(body)
+        elif tag == b'IEND': break
+    if head is None: raise ValueError(f"{path}: no IHDR")
+    w, h, depth, ctype, _, _, lace = head
+    channels = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}.get(ctype)
+    if channels is None or depth not in (1, 2, 4, 8, 16) or lace:
+        raise ValueError(f"{path}: unsupported PNG (color type {ctype}, {depth}-bit{', interlaced' if lace else ''})")
+    if ctype == 3 and palette is None: raise ValueError(f"{path}: palette PNG without PLTE")
+    stride = (w * channels * depth + 7) // 8
+    rows = png_unfilter(zlib.decompress(b''.join(idat)), h, stride, max(1, channels * depth // 8))
+    if ctype == 3: table = gray_table(palette, 3)
+    elif depth < 8: table = bytes(v * 255 // ((1 << depth) - 1) & 0xFF if v < 1 << depth else 0 for v in range(256))
+    else: table = None
+    out = []
+    for line in rows:
+        if depth < 8: line = png_samples(line, w, depth)
+        elif depth == 16: line = line[0::2]  # старший байт отсчёта
+        if channels >= 3:
+            line = bytes((r + g + b) // 3 for r, g, b in zip(line[0::channels], line[1::channels], line[2::channels]))
+        elif channels == 2: line = line[0::2]
+        out.append(line.translate(table) if table else bytes(line))
+    return w, h, out
+
+def glyph_to_rows(vals, w, h):
+    """Глиф в строки серого PNG: включённый пиксель чёрный, фон белый"""
+    fb = FrameBuffer(w, h, vals)
+    return [bytes(0 if fb.get(x, y) else 255 for x in range(w)) for y in range(h)]
+
+# --- ЭКСПОРТ PNG: ЦВЕТА ТЕМЫ, МАСШТАБ, СЕТКА, ЛИСТ ВСЕХ ГЛИФОВ (БЕЗ TK) ---
+THEMES = {
+    'O': {"bg": "#FFA500", "px": "#0A0A0A", "inv_bg": "#231600"},
+    'W': {"bg": "#E0E0E0", "px": "#0A0A0A", "inv_bg": "#232323"},
+    'B': {"bg": "#45b5ff", "px": "#0A0A0A", "inv_bg": "#001e34"}
+}
+
+def adjust_color(hex_color, factor):
+    hex_color = hex_color.lstrip('#')
+    rgb = [int(hex_color[i:i+2], 16) for i in (0, 2, 4)]
+    new_rgb = [max(0, min(255, int(c * factor))) for c in rgb]
+    return "#{:02x}{:02x}{:02x}".format(*new_rgb)
+
+def theme_colors(theme, inverted=False, grid=0.9, inv_grid=1.7):
+    """Цвета холста для темы (как в редакторе): фон, пиксель, сетка, линии страниц, калька"""
+    bg_c = theme["inv_bg"] if inverted else theme["bg"]
+    grid_c = adjust_color(bg_c, inv_grid if inverted else grid)
+    colors = {"bg": bg_c, "px": theme["bg"] if inverted else theme["px"], "grid": grid_c,
+              "lgrid": adjust_color(grid_c, 1.5 if inverted else 0.5)}
+    colors["onion"] = "#" + bytes((a + b) // 2 for a, b in zip(hex_to_rgb(colors["bg"]), hex_to_rgb(colors["px"]))).hex()
+    return colors
+
+def index_palette(colors):
+    """PLTE для индексной картинки растра: строка PixelRaster, взятая через байт (row[::3]), — это индексы 3i"""
+    plte = bytearray(9 * len(PALETTE_KEYS))
+    for i, key in enumerate(PALETTE_KEYS): plte[9 * i:9 * i + 3] = hex_to_rgb(colors.get(key, colors["bg"]))
+    return bytes(plte)
+
+def export_png(path, fb, x0, y0, w, h, colors, scale=8, stretch=1.0, grid=True, line_grid=False):
+    """Область буфера w x h -> PNG как на холсте (сетка запечена); возвращает размер картинки"""
+    raster = PixelRaster(w, h, scale, stretch, grid, line_grid)
+    write_png(path, raster.width, raster.height, [r[::3] for r in raster.rows(fb, x0, y0)], palette=index_palette(colors))
+    return raster.width, raster.height
+
+# Цифры 3x5 для подписей листа: 5 строк по 3 бита (старший — левый столбец)
+DIGITS_3X5 = ("75557", "26227", "71747", "71717", "55711", "74717", "74757", "71111", "75757", "75717")
+
+def label_rows(text, scale):
+    """Подпись цифрами 3x5 -> строки индексов растра (1 — пиксель, 0 — фон), каждая точка scale x scale"""
+    on, off = INDEX_RGB[1][:1] * scale, INDEX_RGB[0][:1] * scale
+    rows = []
+    for r in range(5):
+        bits = "0".join(f"{int(DIGITS_3X5[int(c)][r]):03b}" for c in text)
+        row = b''.join(on if b == "1" else off for b in bits)
+        rows += [row] * scale
+    return rows
+
+def contact_sheet(path, glyphs, w, h, colors, scale=4, stretch=1.0, grid=False, cols=16, labels=True, first=0):
+    """Все глифы таблицы (байты редактора) одной картинкой, cols в ряд, над каждым — номер (first + n).
+    Строки клеток собираются из строк PixelRaster, одинаковые строки глифа — один объект"""
+    raster = PixelRaster(w, h, scale, stretch, grid)
+    ls = max(1, scale // 2)
+    label_h = 5 * ls + 2 if labels else 0
+    pad = max(2, scale)
+    cell_w = max(raster.width, (4 * len(str(first + len(glyphs) - 1)) - 1) * ls if labels else 0) + pad
+    cols = max(1, min(cols, len(glyphs)))
+    sheet_w = cols * cell_w + pad
+    gap = INDEX_RGB[2][:1]  # промежутки между клетками — цветом сетки
+    fb = FrameBuffer(w, h)
+    out = [gap * sheet_w] * pad
+    for r0 in range(0, len(glyphs), cols):
+        cells = []
+        for n in range(r0, min(r0 + cols, len(glyphs))):
+            fb.load(glyphs[n])
+            rows = [row[::3] for row in raster.rows(fb, 0, 0)]
+            if labels:
+                lab = label_rows(str(first + n), ls)
+                lab = [row.ljust(raster.width, INDEX_RGB[0][:1]) for row in lab]
+                rows = [INDEX_RGB[0][:1] * raster.width] + lab + [INDEX_RGB[0][:1] * raster.width] + rows
+            cells.append([row.ljust(cell_w - pad, gap) for row in rows])
+        height = raster.height + label_h
+        for y in range(height):
+            out.append(gap * pad + (gap * pad).join(c[y] for c in cells).ljust(sheet_w - 2 * pad, gap) + gap * pad)
+        out += [gap * sheet_w] * pad
+    write_png(path, sheet_w, len(out), out, palette=index_palette(colors))
+    return sheet_w, len(out)
+
+# --- ИМПОРТ КАРТИНОК (PNG / BMP / PGM -> СТРАНИЦЫ LCD) ---
+IMAGE_EXTS = ('.png', '.bmp', '.pgm')
+DITHER_MODES = ("THRESH", "FLOYD", "BAYER")
+BAYER4 = [[0, 8, 2, 10], [12, 4, 14, 6], [3, 11, 1, 9], [15, 7, 13, 5]]
+NIBBLE_TABLES = (bytes(v >> 4 for v in range(256)), bytes(v & 15 for v in range(256)))
+INVERT_TABLE = bytes(255 - v for v in range(256))
+
+def gray_table(palette, step):
+    """Палитра BMP/PNG (по step байт на цвет) -> таблица индекс -> серый"""
+    table = bytearray(256)
+    for i in range(min(256, len(palette) // step)):
+        table[i] = sum(palette[i * step:i * step + 3]) // 3
+    return bytes(table)
+
+def read_bmp(path):
+    """Несжатый BMP 1/4/8/24/32 бит -> (w, h, [строки в оттенках серого])"""
+    with open(path, 'rb') as f: data = f.read()
+    if data[:2] != b'BM': raise ValueError(f"{path}: not a BMP")
+    offset, dib = struct.unpack_from('<II', data, 10)
+    w, h, _, bpp, comp = struct.unpack_from('<iiHHI', data, 18)
+    if comp not in (0, 3) or bpp not in (1, 4, 8, 24, 32): raise ValueError(f"{path}: only uncompressed 1/4/8/24/32-bit BMP is supported")
+    top_down, h = h < 0, abs(h)
+    stride = (bpp * w + 31) // 32 * 4
+    table = gray_table(data[14 + dib:offset], 4) if bpp <= 8 else None
+    rows = []
+    for y in range(h):
+        row = data[offset + y * stride:offset + (y + 1) * stride]
+        if bpp == 8: line = row[:w].translate(table)
+        elif bpp == 4:
+            idx = bytearray(2 * len(row)); idx[0::2] = row.translate(NIBBLE_TABLES[0]); idx[1::2] = row.translate(NIBBLE_TABLES[1])
+            line = bytes(idx[:w]).translate(table)
+        elif bpp == 1:
+            idx = bytearray(8 * len(row))
+            for b in range(8): idx[b::8] = row.translate(BIT_TABLES[7 - b])
+            line = bytes(idx[:w]).translate(table)
+        else:
+            n = bpp // 8
+            line = bytes((r + g + b) // 3 for b, g, r in zip(row[0:w * n:n], row[1:w * n:n], row[2:w * n:n]))
+        rows.append(line)
+    if not top_down: rows.reverse()
+    return w, h, rows
+
+def read_pgm(path):
+    """PGM P5 (двоичный) или P2 (текстовый) -> (w, h, [строки в оттенках серого])"""
+    with open(path, 'rb') as f: data = f.read()
+    magic = data[:2]
+    if magic not in (b'P5', b'P2'): raise ValueError(f"{path}: not a PGM")
+    tokens, pos = [], 2
+    for m in re.finditer(rb'#[^\n]*|(\S+)', data[2:]):
+        if m.group(1): tokens.append(int(m.group(1)))
+        pos = 2 + m.end()
+        if len(tokens) == 3 and magic == b'P5': break
+    w, h, maxval = tokens[:3]
+    if magic == b'P5':
+        if maxval > 255: raise ValueError(f"{path}: 16-bit PGM is not supported")
+        pix = data[pos + 1:pos + 1 + w * h]
+    else: pix = bytes(min(255, v) for v in tokens[3:3 + w * h])
+    if maxval != 255: pix = pix.translate(bytes(min(255, v * 255 // max(1, maxval)) for v in range(256)))
+    return w, h, [pix[y * w:(y + 1) * w] for y in range(h)]
+
+def read_image(path):
+    with open(path, 'rb') as f: head = f.read(8)
+    if head.startswith(b'\x89PNG'): return read_png(path)
+    if head.startswith(b'BM'): return read_bmp(path)
+    if head[:2] in (b'P5', b'P2'): return read_pgm(path)
+    raise ValueError(f"{path}: unsupported image format")
+
+def fit_size(w, h, max_w=128, max_h=64, stretch=1.0):
+    """Размер в точках LCD: не больше max_w x max_h, с поправкой на вытянутые по вертикали точки (STRETCH_Y)"""
+    tw = min(max_w, w)
+    th = max(1, round(h * tw / w / stretch))
+    if th > max_h: th, tw = max_h, max(1, min(max_w, round(w * max_h * stretch / h)))
+    return tw, th
+
+def resize_gray(w, h, rows, tw, th):
+    """Ближайший сосед по центрам точек; строка собирается одним map без цикла по пикселям"""
+    if (tw, th) == (w, h): return rows
+    xmap = [min(w - 1, int((i + 0.5) * w / tw)) for i in range(tw)]
+    return [bytes(map(rows[min(h - 1, int((j + 0.5) * h / th))].__getitem__, xmap)) for j in range(th)]
+
+def binarize(rows, w, mode="THRESH", threshold=128, invert=False):
+    """Серые строки -> строки 0/1 (1 = включённая точка: тёмное на светлом, либо наоборот при invert)"""
+    if not invert: rows = [r.translate(INVERT_TABLE) for r in rows]  # дальше «включено» = светлее порога
+    if mode == "FLOYD":
+        # Ошибка квантования уходит вправо и на строку ниже — поэтому поточечно
+        out, err, nxt = [], [0] * (w + 2), [0] * (w + 2)
+        for r in rows:
+            line = bytearray(w)
+            for x in range(w):
+                v = r[x] + err[x + 1] // 16
+                if v >= 256 - threshold: line[x] = 1; v -= 255
+                err[x + 2] += v * 7; nxt[x] += v * 3; nxt[x + 1] += v * 5; nxt[x + 2] += v
+            out.append(bytes(line))
+            err, nxt = nxt, [0] * (w + 2)
+        return out
+    if mode == "BAYER":
+        # Порог матрицы 4x4 зависит от x % 4: четыре среза строки, по таблице translate на каждый
+        tables = [bytes(1 if v >= (k + 0.5) * 16 + 128 - threshold else 0 for v in range(256)) for k in range(16)]
+        out = []
+        for y, r in enumerate(rows):
+            line = bytearray(w)
+            for ph in range(min(4, w)): line[ph::4] = r[ph::4].translate(tables[BAYER4[y & 3][ph]])
+            out.append(bytes(line))
+        return out
+    table = bytes(1 if v >= 256 - threshold else 0 for v in range(256))
+    return [r.translate(table) for r in rows]
+
+def pack_pages(bit_rows, w):
+    """Строки 0/1 -> байты страниц LCD. Каждая строка — большое целое с одним битом на байт,
+    поэтому 8 строк страницы складываются сдвигами без переносов между колонками"""
+    out = bytearray()
+    for p in range(0, len(bit_rows), 8):
+        acc = 0
+        for b, row in enumerate(bit_rows[p:p + 8]): acc |= int.from_bytes(row, 'little') << b
+        out += acc.to_bytes(w, 'little')
+    return bytes(out)
+
+def image_to_glyph(path, size=None, stretch=1.0, mode="THRESH", threshold=128, invert=False):
+    """Картинка -> (байты страниц, w, h). size=(max_w, max_h) — вписать с поправкой на stretch; None — как есть"""
+    w, h, rows = read_image(path)
+    if size: tw, th = fit_size(w, h, size[0], size[1], stretch)
+    else: tw, th = w, h
+    rows = resize_gray(w, h, rows, tw, th)
+    return pack_pages(binarize(rows, tw, mode, threshold, invert), tw), tw, th
+
+# --- МИНИМАЛЬНЫЙ ПАТЧ ЭКРАНА (ЧТО РЕАЛЬНО НАДО ОТПРАВИТЬ ПО SPI) ---
+PATCH_OVERHEAD = 3  # байт команд на участок: страница + столбец (2 байта)
+
+def lcd_patch(before, after, width=128, gap=PATCH_OVERHEAD):
+    """Участки (страница, столбец, длина), где кадры различаются. Соседние участки с разрывом <= gap
+    склеиваются: лишние байты данных дешевле, чем ещё одна установка адреса"""
+    before, after = bytes(before), bytes(after)
+    n = max(len(before), len(after))
+    before, after = before.ljust(n, b'\x00'), after.ljust(n, b'\x00')
+    xored = (int.from_bytes(before, 'little') ^ int.from_bytes(after, 'little')).to_bytes(n, 'little')
+    runs = []
+    for p in range(n // width):
+        page = xored[p * width:(p + 1) * width]
+        for m in re.finditer(rb'[^\x00]+', page):
+            start, end = m.span()
+            if runs and runs[-1][0] == p and start - (runs[-1][1] + runs[-1][2]) <= gap:
+                runs[-1] = (p, runs[-1][1], end - runs[-1][1])
+            else: runs.append((p, start, end - start))
+    return runs
+
+def format_patch(runs, after, name, width=128, overhead=PATCH_OVERHEAD):
+    """C-таблица патча {страница, столбец, длина, данные...} и отчёт о байтах на шине"""
+    data_bytes = sum(r[2] for r in runs)
+    total = data_bytes + overhead * len(runs)
+    full = len(after) + overhead * (len(after) // width)
+    lines = [f"/* LCD patch: {len(runs)} runs, {data_bytes} data bytes + {overhead * len(runs)} command bytes = {total} bytes on SPI",
+             f"   (full redraw: {full} bytes, saved {full - total}) */",
+             f"static const uint8_t {name}[] = {{",
+             "    /* page, column, length, data... */"]
+    for p, col, ln in runs:
+        chunk = after[p * width + col:p * width + col + ln]
+        lines.append(f"    {p}, {col}, {ln}, " + ", ".join(HEX_LITERALS[b] for b in chunk) + ",")
+    lines.append("    0xFF /* end */")
+    lines.append("};")
+    return "\n".join(lines)
+
+# --- АНИМАЦИЯ: КАДРЫ ЦЕЛИКОМ ИЛИ XOR-ДЕЛЬТЫ К ПРЕДЫДУЩЕМУ ---
+# Поток кадров: байт n, затем
+#   n == 0xFF — кадр целиком (size байт);
+#   n < 0xFF  — n участков {смещение (2 байта, младший первым), длина, байты xor...}; n == 0 — кадр не изменился.
+# Первый кадр всегда целиком, так что поток можно крутить по кругу
+ANIM_FULL = 0xFF
+
+def frame_delta(prev, cur, gap=PATCH_OVERHEAD):
+    """XOR-участки между кадрами одного размера: [(смещение, байты xor)], длина участка до 255"""
+    n = len(cur)
+    xored = (int.from_bytes(prev, 'little') ^ int.from_bytes(cur, 'little')).to_bytes(n, 'little')
+    runs = []
+    for _, start, ln in lcd_patch(prev, cur, n, gap):
+        for a in range(start, start + ln, 255): runs.append((a, xored[a:min(a + 255, start + ln)]))
+    return runs
+
+def anim_pack(frames, gap=PATCH_OVERHEAD):
+    """Кадры -> (поток, [(вид 'full' | 'delta', байт кадра в потоке)]): для каждого кадра берётся меньшее"""
+    out, kinds, prev = bytearray(), [], None
+    for frame in frames:
+        frame = bytes(frame)
+        runs = frame_delta(prev, frame, gap) if prev is not None else None
+        delta = 1 + sum(3 + len(x) for _, x in runs) if runs is not None and len(runs) < ANIM_FULL else None
+        if delta is None or delta >= 1 + len(frame):
+            out.append(ANIM_FULL); out += frame
+            kinds.append(("full", 1 + len(frame)))
+        else:
+            out.append(len(runs))
+            for off, x in runs: out += bytes((off & 0xFF, off >> 8, len(x))); out += x
+            kinds.append(("delta", delta))
+        prev = frame
+    return bytes(out), kinds
+
+def anim_unpack(stream, size):
+    frames, cur, i = [], bytearray(size), 0
+    while i < len(stream):
+        n = stream[i]; i += 1
+        if n == ANIM_FULL:
+            cur[:] = stream[i:i + size].ljust(size, b'\x00'); i += size
+        else:
+            for _ in range(n):
+                off, ln = stream[i] | stream[i + 1] << 8, stream[i + 2]
+                x = stream[i + 3:i + 3 + ln]; i += 3 + ln
+                cur[off:off + ln] = (int.from_bytes(cur[off:off + ln], 'little') ^ int.from_bytes(x, 'little')).to_bytes(ln, 'little')
+        frames.append(bytes(cur))
+    return frames
+
+def format_anim(frames, v_name, w, pages):
+    """Анимация одним потоком с отчётом по кадрам (целиком / дельта) и эталонным декодером на C"""
+    size = w * pages
+    stream, kinds = anim_pack(frames)
+    full = len(frames) * size
+    report = [f"/* packed:anim {w}x{pages * 8} {len(frames)} frames, {size_note(full, len(stream))}"]
+    report += [f"   frame {n}: {kind} {cost} bytes" for n, (kind, cost) in enumerate(kinds)]
+    return "\n".join(report + ["*/", c_array(v_name, stream), "",
+                               f"/* src = {v_name}; each tick: src = anim_step(src, dst, {size}); "
+                               f"if (src == {v_name} + sizeof({v_name})) src = {v_name}; */",
+                               C_DECODERS["anim"]])
+
+# --- ПОВТОРЫ И ПОХОЖИЕ ГЛИФЫ В ТАБЛИЦАХ ---
+def hamming_pairs(glyphs, limit):
+    """Пары (i, j, d) различных глифов одной длины, отличающихся на d <= limit пикселей.
+    Мультииндекс по принципу Дирихле: глиф режется на limit+1 кусков, у близкой пары хотя бы один кусок
+    совпадает целиком — сравниваются только глифы из общих корзин"""
+    if limit <= 0 or len(glyphs) < 2: return []
+    ints = [int.from_bytes(g, 'little') for g in glyphs]
+    n, size = len(glyphs), len(glyphs[0])
+    if size < limit + 1: candidates = ((i, j) for i in range(n) for j in range(i + 1, n))  # кусков не хватает — перебор
+    else:
+        bounds = [size * c // (limit + 1) for c in range(limit + 2)]
+        pairs = set()
+        for a, b in zip(bounds, bounds[1:]):
+            buckets = {}
+            for i, g in enumerate(glyphs): buckets.setdefault(g[a:b], []).append(i)
+            for ids in buckets.values():
+                for k, i in enumerate(ids): pairs.update((i, j) for j in ids[k + 1:])
+        candidates = sorted(pairs)
+    out = []
+    for i, j in candidates:
+        d = bin(ints[i] ^ ints[j]).count('1')
+        if d <= limit: out.append((i, j, d))
+    return out
+
+def dedup_code(arrays, near=0):
+    """arrays: [(имя, [байты глифа])]. Общий пул уникальных глифов на каждую длину, таблицы
+    перекодировки {имя}_remap (старый индекс -> индекс в пуле) и отчёт о выигрыше во флеше"""
+    pools, remaps, where, dups = {}, [], {}, []
+    for name, glyphs in arrays:
+        remap = []
+        for i, g in enumerate(glyphs):
+            g = bytes(g)
+            pool = pools.setdefault(len(g), {})
+            if g in pool: dups.append((f"{name}[{i}]", where[(len(g), pool[g])]))
+            else: pool[g] = len(pool); where[(len(g), pool[g])] = f"{name}[{i}]"
+            remap.append((len(g), pool[g]))
+        remaps.append((name, remap))
+    total = sum(len(g) for _, glyphs in arrays for g in glyphs)
+    saved = sum(size * (sum(1 for _, r in remaps for s, _ in r if s == size) - len(pool)) for size, pool in pools.items())
+    near_pairs, near_saved = [], 0
+    for size, pool in pools.items():
+        parent = list(range(len(pool)))  # группы похожих глифов (объединение пар)
+        def root(i):
+            while parent[i] != i: parent[i] = parent[parent[i]]; i = parent[i]
+            return i
+        for i, j, d in hamming_pairs(list(pool), near):
+            near_pairs.append((where[(size, i)], where[(size, j)], d))
+            a, b = root(i), root(j)
+            if a != b: parent[b] = a; near_saved += size
+    lines = [f"/* glyph dedup: {len(arrays)} arrays, {sum(len(g) for _, g in arrays)} glyphs, {total} bytes",
+             f"   exact duplicates: {len(dups)}, saved {saved} bytes ({total - saved} bytes of glyphs left, plus remap tables)"]
+    if near > 0:
+        lines.append(f"   near duplicates within {near} px: {len(near_pairs)} pairs, {near_saved} more bytes if each group is merged")
+    lines.append("*/")
+    for a, b in dups: lines.append(f"/* {a} == {b} */")
+    for a, b, d in sorted(near_pairs, key=lambda p: p[2]): lines.append(f"/* {a} ~ {b}: {d} px */")
+    for size, pool in sorted(pools.items()):
+        lines.append(f"static const uint8_t glyphs_{size}[{len(pool)}][{size}] = {{")
+        lines += ["    {" + ", ".join(HEX_LITERALS[v] for v in g) + f"}}, // {k}: {where[(size, k)]}" for k, g in enumerate(pool)]
+        lines.append("};")
+    for name, remap in remaps:
+        ctype = "uint8_t" if all(k < 256 for _, k in remap) else "uint16_t"
+        lines.append(f"/* {name}[i] -> glyphs_{remap[0][0] if remap else 0}[{name}_remap[i]] */" if len({s for s, _ in remap}) <= 1
+                     else f"/* {name}: mixed glyph sizes, see glyphs_N tables */")
+        lines.append(c_array(name + "_remap", [k for _, k in remap], ctype))
+    return "\n".join(lines)
+
+def dedup_source(text, near=0):
+    """Все массивы текста (как в пакетном режиме); блоки с ошибками пропускаются"""
+    arrays = [(name, [bytes(v) for v, err in glyphs if not err]) for name, glyphs in find_bitmap_arrays(text)]
+    arrays = [(name, glyphs) for name, glyphs in arrays if glyphs]
+    if not arrays:
+        # Просто блоки {...} без объявления массива (как во вводе MULTI)
+        glyphs = [bytes(b.values) for b in TOKENIZER.blocks(text, braced_only=True) if b.values]
+        if glyphs: arrays = [(guess_var_name(text) or "glyphs", glyphs)]
+    return dedup_code(arrays, near) if arrays else None
+
+# --- ТЕКСТ ШРИФТОМ ИЗ ТАБЛИЦЫ ---
+TEXT_ALIGNS = ("LEFT", "CENTER", "RIGHT")
+
+class BitmapFont:
+    """Таблица глифов как шрифт. Ширина каждого глифа (без пустых колонок справа) и срезы его страниц
+    считаются один раз при загрузке; строка собирается склейкой готовых срезов, без работы с битами"""
+
+    def __init__(self, glyphs, w, h, first=32):
+        self.w, self.h, self.pages, self.first = w, h, (h + 7) // 8, first
+        self.glyphs = []  # (срезы по страницам, ширина)
+        for vals in glyphs:
+            data = bytes(vals)[:self.pages * w].ljust(self.pages * w, b'\x00')
+            width = max((x + 1 for x in range(w) if any(data[x::w])), default=0) or max(1, w // 2)  # пустой (пробел) — полширины
+            self.glyphs.append((tuple(data[p * w:p * w + width] for p in range(self.pages)), width))
+
+    @classmethod
+    def from_text(cls, text, first=32, override=None):
+        """Шрифт из блоков {...} таблицы; формат глифа — заданный, из подсказки или по первому блоку"""
+        glyphs = [b.values for b in TOKENIZER.blocks(text, braced_only=True) if b.values]
+        if not glyphs: return None
+        fmt = detect_format(len(glyphs[0]), text, override, template=True)
+        return cls([fmt.decode(g) for g in glyphs], fmt.w, fmt.pages * 8, first)
+
+    def glyph(self, ch):
+        i = ord(ch) - self.first
+        return self.glyphs[i] if 0 <= i < len(self.glyphs) else None
+
+    def line(self, text, spacing=1):
+        """Строка -> (срезы страниц, ширина). Неизвестные символы — '?' (если он есть в шрифте)"""
+        rows, width = [[] for _ in range(self.pages)], 0
+        gap = b'\x00' * max(0, spacing)
+        for ch in text:
+            g = self.glyph(ch) or self.glyph('?')
+            if g is None: continue
+            slices, gw = g
+            for p in range(self.pages):
+                if width: rows[p].append(gap)
+                rows[p].append(slices[p])
+            width += gw + (len(gap) if width else 0)
+        return [b''.join(r) for r in rows], width
+
+    def render(self, text, spacing=1, align="LEFT"):
+        """Текст (строки через \\n) -> (байты глифа, w, h): страницы блока, строки выровнены внутри блока"""
+        lines = [self.line(t, spacing) for t in text.split('\n')]
+        width = max(w for _, w in lines) or 1
+        out = []
+        for rows, w in lines:
+            pad = 0 if align == "LEFT" else (width - w) // 2 if align == "CENTER" else width - w
+            out += [(b'\x00' * pad + r).ljust(width, b'\x00') for r in rows]
+        return b''.join(out), width, len(out) * 8
+
+# --- ОПЕРАЦИИ НАД ВЫДЕЛЕНИЕМ (ГЛИФ W x H В БАЙТАХ СТРАНИЦ) ---
+# Строка страницы — bytes по байту на колонку. Вертикальный сдвиг — сдвиги байтов таблицами translate
+# с переносом битов в соседнюю страницу, горизонтальный — срезы строк; поточечных циклов нет
+SHL_TABLES = [bytes((v << k) & 0xFF for v in range(256)) for k in range(8)]
+SHR_TABLES = [bytes(v >> k for v in range(256)) for k in range(8)]
+MASK_TABLES = [bytes(v & ((1 << k) - 1) for v in range(256)) for k in range(8)]
+REVERSE_BITS = bytes(int(f"{v:08b}"[::-1], 2) for v in range(256))
+LANE_ASCII = bytes(48 + (v & 1) for v in range(256))  # байт 0/1 -> символ '0'/'1'
+
+def glyph_rows(data, w, h):
+    data = bytes(data).ljust(w * ((h + 7) // 8), b'\x00')
+    return [data[p * w:(p + 1) * w] for p in range((h + 7) // 8)]
+
+def rows_to_data(rows, h):
+    """Склейка строк страниц; биты ниже высоты h в последней странице гасятся"""
+    if h % 8: rows = rows[:-1] + [rows[-1].translate(MASK_TABLES[h % 8])]
+    return b''.join(rows)
+
+def or_rows(a, b):
+    return (int.from_bytes(a, 'little') | int.from_bytes(b, 'little')).to_bytes(len(a), 'little')
+
+def shift_pages(rows, w, k):
+    """Сдвиг вниз на k строк (вверх при k < 0): целые страницы — индексом, остаток — переносом битов"""
+    q, r = divmod(abs(k), 8)
+    zero, n, out = bytes(w), len(rows), []
+    for p in range(n):
+        if k >= 0:
+            a = rows[p - q] if 0 <= p - q < n else zero
+            b = rows[p - q - 1] if 0 <= p - q - 1 < n else zero
+            out.append(or_rows(a.translate(SHL_TABLES[r]), b.translate(SHR_TABLES[8 - r])) if r else a)
+        else:
+            a = rows[p + q] if 0 <= p + q < n else zero
+            b = rows[p + q + 1] if 0 <= p + q + 1 < n else zero
+            out.append(or_rows(a.translate(SHR_TABLES[r]), b.translate(SHL_TABLES[8 - r])) if r else a)
+    return out
+
+def shift_v(data, w, h, dy, cyclic=False):
+    rows = glyph_rows(data, w, h)
+    if not cyclic: return rows_to_data(shift_pages(rows, w, dy), h)
+    dy %= h
+    rows = rows_to_data(rows, h)  # мусор ниже h не должен «заехать» сверху
+    rows = glyph_rows(rows, w, h)
+    return rows_to_data([or_rows(a, b) for a, b in zip(shift_pages(rows, w, dy), shift_pages(rows, w, dy - h))], h)
+
+def shift_h(data, w, h, dx, cyclic=False):
+    rows = glyph_rows(data, w, h)
+    if cyclic:
+        dx %= w
+        return b''.join(r[w - dx:] + r[:w - dx] for r in rows)
+    if dx >= 0: return b''.join((bytes(dx) + r)[:w] for r in rows)
+    return b''.join(r[-dx:].ljust(w, b'\x00') for r in rows)
+
+def flip_h(data, w, h):
+    return b''.join(r[::-1] for r in glyph_rows(data, w, h))
+
+def flip_v(data, w, h):
+    rows = [r.translate(REVERSE_BITS) for r in reversed(glyph_rows(data, w, h))]
+    return rows_to_data(shift_pages(rows, w, h - len(rows) * 8), h)
+
+def invert_region(data, w, h):
+    return rows_to_data([r.translate(INVERT_TABLE) for r in glyph_rows(data, w, h)], h)
+
+def rotate_cw(data, w, h):
+    """Поворот на 90° по часовой: (байты, новая w = h, новая h = w). Строка y старого глифа
+    становится колонкой h-1-y: биты строки собираются в целое через translate и int(..., 2)"""
+    rows, pages = glyph_rows(data, w, h), (w + 7) // 8
+    out = bytearray(pages * h)
+    for nx in range(h):
+        y = h - 1 - nx
+        col = int(rows[y >> 3].translate(BIT_TABLES[y & 7]).translate(LANE_ASCII)[::-1], 2)
+        out[nx::h] = col.to_bytes(pages, 'little')
+    return bytes(out), h, w
+
+# --- ФОРМАТ ГЛИФА: ШИРИНА, ВЫСОТА, ПОРЯДОК СТРАНИЦ И БИТОВ ---
+# Редактор внутри держит глиф как буфер LCD: ceil(h/8) страниц по w байт, бит 0 — верхняя строка страницы.
+# Формат таблицы в исходнике может отличаться: MSB сверху и/или столбцы подряд (все страницы столбца x вместе)
+FORMAT_SPEC_RE = re.compile(r'(\d+)\s*[xX*]\s*(\d+)((?:\s+(?:lsb|msb|pages|columns))*)\s*$', re.I)
+FORMAT_RE = re.compile(r'/\*\s*format:\s*([^*]*?)\s*\*/', re.I)  # подсказка в тексте: /* format: 16x24 msb columns */
+MAX_GLYPH_H = 64
+
+class GlyphFormat:
+    """Описание формата w x h; перевод в байты редактора и обратно — срезы и bytes.translate за один проход"""
+
+    def __init__(self, w, h, order="lsb", layout="pages"):
+        self.w, self.h, self.order, self.layout = w, h, order, layout
+        self.pages = (h + 7) // 8
+        self.size = w * self.pages
+        self.table = REVERSE_BITS if order == "msb" else None
+        self.tail = MASK_TABLES[h % 8] if h % 8 else None  # биты ниже h в последней странице
+
+    def __str__(self):
+        flags = [f for f in (self.order, self.layout) if f not in ("lsb", "pages")]
+        return " ".join([f"{self.w}x{self.h}"] + flags)
+
+    def _fit(self, data):
+        return bytes(data)[:self.size].ljust(self.size, b'\x00')
+
+    def decode(self, data):
+        """Байты формата -> байты редактора; лишнее отрезается, недостающее — нули"""
+        data = self._fit(data)
+        if self.table: data = data.translate(self.table)
+        if self.layout == "columns": data = b''.join(data[p::self.pages] for p in range(self.pages))
+        if self.tail: data = data[:-self.w] + data[-self.w:].translate(self.tail)
+        return data
+
+    def encode(self, data):
+        """Байты редактора -> байты формата"""
+        data = self._fit(data)
+        if self.tail: data = data[:-self.w] + data[-self.w:].translate(self.tail)
+        if self.layout == "columns":
+            out = bytearray(self.size)
+            for p in range(self.pages): out[p::self.pages] = data[p * self.w:(p + 1) * self.w]
+            data = bytes(out)
+        if self.table: data = data.translate(self.table)
+        return data
+
+_FORMATS = {}
+
+def glyph_format(w, h, order="lsb", layout="pages"):
+    """Описатель формата из кэша: таблица на 256 глифов разбирается одним и тем же объектом"""
+    key = (w, h, order, layout)
+    fmt = _FORMATS.get(key)
+    if fmt is None: fmt = _FORMATS[key] = GlyphFormat(w, h, order, layout)
+    return fmt
+
+def parse_format(spec):
+    """'16x24', '8x12 msb', '16x32 msb columns' -> GlyphFormat; AUTO, пусто или ошибка -> None"""
+    m = FORMAT_SPEC_RE.match(spec.strip())
+    if not m: return None
+    w, h = int(m.group(1)), int(m.group(2))
+    if not (0 < w and 0 < h <= MAX_GLYPH_H): return None
+    flags = m.group(3).lower().split()
+    return glyph_format(w, h, "msb" if "msb" in flags else "lsb", "columns" if "columns" in flags else "pages")
+
+def detect_format(total, text="", override=None, template=False):
+    """Формат глифа из total байт: заданный явно > подсказка /* format: ... */ в тексте > размер по числу байтов"""
+    if override is not None: return override
+    m = FORMAT_RE.search(text) if text else None
+    fmt = parse_format(m.group(1)) if m else None
+    if fmt is not None: return fmt
+    return glyph_format(*(guess_template_dims if template else guess_dims)(total))
+
+# --- СЛОИ ЭКРАНА (СТРОКА СОСТОЯНИЯ, ФОН, ИКОНКИ) ---
+BLEND_MODES = ("OR", "AND-NOT", "XOR")
+BLEND_C = {"OR": "|= 0x{:02X}", "AND-NOT": "&= ~0x{:02X}", "XOR": "^= 0x{:02X}"}
+
+class Layer:
+    """Именованный слой: глиф w x h (байты страниц), точка на экране, видимость и режим наложения"""
+
+    def __init__(self, name, data, w, h, x=0, y=0, mode="OR", visible=True):
+        self.name, self.w, self.h = name, w, h
+        self.data = bytes(data)[:w * ((h + 7) // 8)].ljust(w * ((h + 7) // 8), b'\x00')
+        self.x, self.y, self.mode, self.visible = x, y, mode, visible
+        self._rows = None  # страница экрана -> строка слоя во весь экран (int, байт x = биты 8x..8x+7)
+
+    def pages(self, height):
+        """Страницы экрана, которые слой задевает"""
+        return range(max(0, self.y >> 3), max(0, min(height >> 3, (self.y + self.h + 7) >> 3)))
+
+    def rows(self, width, height):
+        if self._rows is None:
+            fb = FrameBuffer(width, height)
+            fb.insert(self.x, self.y, self.w, self.h, self.data)
+            buf = fb.to_bytes()
+            self._rows = {p: int.from_bytes(buf[p * width:(p + 1) * width], 'little') for p in self.pages(height)}
+        return self._rows
+
+class LayerStack:
+    """Слои снизу вверх, сведённые в буфер страниц. Сведение кэшируется постранично:
+    правка слоя пересчитывает только страницы, которые он задевал до и после правки"""
+
+    def __init__(self, width=128, height=64):
+        self.width, self.height = width, height
+        self.layers = []
+        self._pages = [0] * (height >> 3)
+        self._dirty = set(range(height >> 3))
+
+    def get(self, name):
+        return next((l for l in self.layers if l.name == name), None)
+
+    def touch(self, layer):
+        self._dirty.update(layer.pages(self.height))
+
+    def add(self, layer):
+        """Новый слой сверху; слой с тем же именем заменяется на месте"""
+        old = self.get(layer.name)
+        if old is None: self.layers.append(layer)
+        else:
+            self.touch(old)
+            self.layers[self.layers.index(old)] = layer
+        self.touch(layer)
+        return layer
+
+    def remove(self, name):
+        layer = self.get(name)
+        if layer is not None:
+            self.touch(layer); self.layers.remove(layer)
+
+    def update(self, name, **changes):
+        """Меняет поля слоя (data, x, y, mode, visible...); задетые страницы — до и после правки"""
+        layer = self.get(name)
+        if layer is None: return None
+        self.touch(layer)
+        for key, value in changes.items(): setattr(layer, key, value)
+        if changes.keys() - {"mode", "visible"}: layer._rows = None
+        self.touch(layer)
+        return layer
+
+    def move(self, name, delta):
+        """Сдвиг слоя в стопке (delta > 0 — выше)"""
+        layer = self.get(name)
+        if layer is None: return
+        i = self.layers.index(layer)
+        j = max(0, min(len(self.layers) - 1, i + delta))
+        if i != j:
+            self.layers.insert(j, self.layers.pop(i))
+            self.touch(layer)
+
+    def compose(self):
+        """Сведённый буфер (страница за страницей, как FrameBuffer.to_bytes)"""
+        for p in sorted(self._dirty):
+            acc = 0
+            for layer in self.layers:
+                if not layer.visible: continue
+                v = layer.rows(self.width, self.height).get(p)
+                if v is None: continue
+                if layer.mode == "OR": acc |= v
+                elif layer.mode == "XOR": acc ^= v
+                else: acc &= ~v
+            self._pages[p] = acc
+        self._dirty.clear()
+        return b''.join(v.to_bytes(self.width, 'little') for v in self._pages)
+
+    def status_code(self):
+        """Код по слоям: страница 0 — gStatusLine, ниже — gFrameBuffer[страница - 1]; нулевые байты пропускаются"""
+        out = []
+        for layer in self.layers:
+            head = f"/* {layer.name}: {layer.w}x{layer.h} at {layer.x},{layer.y} {layer.mode}"
+            if not layer.visible:
+                out.append(head + " (hidden) */"); continue
+            out.append(head + " */")
+            fmt = BLEND_C[layer.mode]
+            x0 = max(0, layer.x)
+            for p, v in sorted(layer.rows(self.width, self.height).items()):
+                row = v.to_bytes(self.width, 'little')
+                target = "gStatusLine[" if p == 0 else f"gFrameBuffer[{p - 1}]["
+                out += [f"{target}{x0} + {x - x0}] {fmt.format(row[x])};"
+                        for x in range(x0, min(self.width, layer.x + layer.w)) if row[x]]
+        return "\n".join(out)
+
+# --- АТЛАС ШРИФТА (ВИРТУАЛЬНАЯ СЕТКА МИНИАТЮР) ---
+class FontAtlas(tk.Toplevel):
+    """Все глифы таблицы из поля ввода миниатюрами. Миниатюры рисуются только для видимых строк
+    и кэшируются по байтам глифа, так что таблица на 256 символов открывается мгновенно"""
+    THUMB_SCALE = 3
+    CELL_PAD = 10
+
+    def __init__(self, editor):
+        super().__init__(editor)
+        self.editor = editor
+        self.title("FONT ATLAS")
+        self.configure(bg=editor.C_SIDEBAR_BG)
+        self.geometry("640x560")
+        self.glyphs = []        # [(индекс блока, байты, w, h)]
+        self.thumbs = {}        # (байты, w, h, цвета) -> PhotoImage
+        self.placed = {}        # номер глифа -> id элементов на холсте
+        self.current = None     # номер глифа, открытого на основном холсте
+        self.loaded_chunk = None  # текст его блока в момент открытия (SAVE SRC сверяет с файлом)
+        self.cols, self.cell_w, self.cell_h = 1, 1, 1
+
+        bar = tk.Frame(self, bg=editor.C_TOPBAR_BG)
+        bar.pack(fill=tk.X)
+        self.info_label = tk.Label(bar, text="", fg=editor.C_TEXT_MAIN, bg=editor.C_TOPBAR_BG, font=("Consolas", 10, "bold"))
+        self.info_label.pack(side=tk.LEFT, padx=10, pady=6)
+        for text, cmd in (("SAVE GLYPH", self.save_glyph), ("RELOAD", self.reload)):
+            tk.Button(bar, text=text, bg=editor.C_BTN_DARK, fg=editor.C_BTN_TEXT, font=("Arial", 8, "bold"),
+                      relief="flat", bd=0, padx=10, command=cmd).pack(side=tk.RIGHT, padx=4)
+
+        self.scroll = tk.Scrollbar(self, orient=tk.VERTICAL)
+        self.scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas = tk.Canvas(self, bg=editor.C_CANVAS_BG, highlightthickness=0, bd=0, yscrollcommand=self.on_scroll)
+        self.canvas.pack(fill=tk.BOTH, expand=True)
+        self.scroll.config(command=self.canvas.yview)
+        self.canvas.bind("<Configure>", lambda e: self.layout())
+        self.canvas.bind("<MouseWheel>", lambda e: self.canvas.yview_scroll(-1 if e.delta > 0 else 1, "units"))
+        self.canvas.bind("<Button-1>", self.on_click)
+        self.reload()
+
+    def reload(self):
+        """Перечитывает таблицу из поля ввода (неизменённые блоки берутся из кэша токенизатора)"""
+        raw = self.editor.input_text.get("1.0", tk.END)
+        override = self.editor.format_override()
+        self.glyphs = []
+        for i, b in enumerate(TOKENIZER.blocks(raw, braced_only=True)):
+            if b.values:
+                fmt = detect_format(len(b.values), raw, override)
+                self.glyphs.append((i, tuple(fmt.decode(b.values)), fmt.w, fmt.h))
+        name = TOKENIZER.var_name(raw) or "?"
+        self.info_label.config(text=f"{name}: {len(self.glyphs)} glyphs")
+        self.layout()
+
+    def layout(self):
+        """Пересчёт сетки; сами миниатюры появятся в fill() только для видимой области"""
+        for ids in self.placed.values():
+            for item in ids: self.canvas.delete(item)
+        self.placed.clear()
+        max_w = max((g[2] for g in self.glyphs), default=8)
+        max_h = max((g[3] for g in self.glyphs), default=8)
+        self.cell_w = max_w * self.THUMB_SCALE + self.CELL_PAD * 2
+        self.cell_h = int(max_h * self.THUMB_SCALE * self.editor.STRETCH_Y) + self.CELL_PAD * 2 + 12
+        self.cols = max(1, self.canvas.winfo_width() // self.cell_w)
+        rows = (len(self.glyphs) + self.cols - 1) // self.cols
+        self.canvas.config(scrollregion=(0, 0, self.cols * self.cell_w, rows * self.cell_h))
+        self.fill()
+
+    def on_scroll(self, first, last):
+        self.scroll.set(first, last)
+        self.after_idle(self.fill)
+
+    def fill(self):
+        if not self.glyphs: return
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        r0 = max(0, int(top // self.cell_h) - 1)
+        r1 = int(bottom // self.cell_h) + 1
+        visible = set(range(r0 * self.cols, min(len(self.glyphs), (r1 + 1) * self.cols)))
+        for n in [n for n in self.placed if n not in visible]:
+            for item in self.placed.pop(n): self.canvas.delete(item)
+        for n in visible:
+            if n not in self.placed: self.place(n)
+
+    def thumb(self, vals, w, h):
+        colors = self.editor.canvas_colors()
+        key = (vals, w, h, colors["bg"], colors["px"], self.editor.STRETCH_Y)
+        img = self.thumbs.get(key)
+        if img is None:
+            raster = PixelRaster(w, h, self.THUMB_SCALE, self.editor.STRETCH_Y, grid=False)
+            img = self.thumbs[key] = tk.PhotoImage(master=self, data=raster.ppm(FrameBuffer(w, h, vals), 0, 0, colors), format="PPM")
+        return img
+
+    def place(self, n):
+        _, vals, w, h = self.glyphs[n]
+        r, c = divmod(n, self.cols)
+        x, y = c * self.cell_w, r * self.cell_h
+        ids = []
+        if n == self.current:
+            ids.append(self.canvas.create_rectangle(x + 2, y + 2, x + self.cell_w - 2, y + self.cell_h - 2, outline=self.editor.C_ACCENT))
+        ids.append(self.canvas.create_image(x + self.CELL_PAD, y + self.CELL_PAD, image=self.thumb(vals, w, h), anchor="nw"))
+        ids.append(self.canvas.create_text(x + self.cell_w // 2, y + self.cell_h - 8, text=str(n), fill=self.editor.C_TEXT_DIM, font=("Consolas", 8)))
+        self.placed[n] = ids
+
+    def redraw_cell(self, n):
+        for item in self.placed.pop(n, ()): self.canvas.delete(item)
+        self.fill()
+
+    def on_click(self, event):
+        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+        c, r = int(x // self.cell_w), int(y // self.cell_h)
+        n = r * self.cols + c
+        if c >= self.cols or not 0 <= n < len(self.glyphs): return
+        prev, self.current = self.current, n
+        _, vals, w, h = self.glyphs[n]
+        self.loaded_chunk = self.block_text(n)
+        self.editor.load_glyph(list(vals), w, h)
+        if prev is not None: self.redraw_cell(prev)
+        self.redraw_cell(n)
+
+    def block_text(self, n):
+        """Текст блока глифа n в поле ввода"""
+        raw = self.editor.input_text.get("1.0", tk.END)
+        block = next((b for i, b in enumerate(TOKENIZER.blocks(raw, braced_only=True)) if i == self.glyphs[n][0]), None)
+        return raw[block.start:block.end] if block else None
+
+    def save_glyph(self):
+        """Записывает байты текущего глифа обратно в таблицу: меняются только литералы его блока"""
+        if self.current is None: return
+        block_no, _, w, h = self.glyphs[self.current]
+        text_w = self.editor.input_text
+        raw = text_w.get("1.0", tk.END)
+        block = next((b for i, b in enumerate(TOKENIZER.blocks(raw, braced_only=True)) if i == block_no), None)
+        if block is None: return
+        sx, sy = self.editor.get_offsets()
+        data = self.editor.fb.extract(sx, sy, w, ((h + 7) // 8) * 8)
+        fmt = detect_format(len(block.values), raw, self.editor.format_override())
+        for a, b, lit in reversed(block_edits(block, fmt.encode(data))):
+            text_w.delete(f"1.0 + {a} chars", f"1.0 + {b} chars")
+            text_w.insert(f"1.0 + {a} chars", lit)
+        self.glyphs[self.current] = (block_no, tuple(fmt.decode(fmt.encode(data))), w, h)
+        self.redraw_cell(self.current)
+
+class LayerPanel(tk.Toplevel):
+    """Слои экрана: список снизу вверх, позиция, режим наложения, видимость.
+    Холст редактора показывает сведённый экран (VIEW) или отдельный слой (EDIT -> STORE)"""
+
+    def __init__(self, editor):
+        super().__init__(editor)
+        self.editor, self.stack = editor, editor.layers
+        self.title("LAYERS")
+        self.configure(bg=editor.C_SIDEBAR_BG)
+        self.geometry("420x460")
+
+        bar = tk.Frame(self, bg=editor.C_TOPBAR_BG)
+        bar.pack(fill=tk.X)
+        self.info_label = tk.Label(bar, text="", fg=editor.C_TEXT_MAIN, bg=editor.C_TOPBAR_BG, font=("Consolas", 10, "bold"))
+        self.info_label.pack(side=tk.LEFT, padx=10, pady=6)
+        for text, cmd in (("STATUS", self.export_status), ("VIEW", self.view)):
+            tk.Button(bar, text=text, bg=editor.C_BTN_DARK, fg=editor.C_BTN_TEXT, font=("Arial", 8, "bold"),
+                      relief="flat", bd=0, padx=10, command=cmd).pack(side=tk.RIGHT, padx=4)
+
+        self.listbox = tk.Listbox(self, bg=editor.C_ENTRY_BG, fg=editor.C_TEXT_MAIN, font=("Consolas", 10), bd=0,
+                                  highlightthickness=0, selectbackground=editor.C_MENU_ACTIVE, activestyle="none")
+        self.listbox.pack(fill=tk.BOTH, expand=True, padx=8, pady=8)
+        self.listbox.bind("<<ListboxSelect>>", lambda e: self.show_pos())
+
+        rows = (
+            (("ADD CANVAS", self.add_canvas), ("ADD INPUT", self.add_input), ("DEL", self.delete)),
+            (("SHOW", self.toggle_visible), ("MODE", self.cycle_mode), ("UP", lambda: self.restack(1)), ("DOWN", lambda: self.restack(-1))),
+            (("EDIT", self.edit), ("STORE", self.store)),
+        )
+        for row in rows:
+            fr = tk.Frame(self, bg=editor.C_SIDEBAR_BG)
+            fr.pack(fill=tk.X, padx=8, pady=(0, 4))
+            for text, cmd in row:
+                tk.Button(fr, text=text, bg=editor.C_BTN_DARK, fg=editor.C_BTN_TEXT, font=("Arial", 8, "bold"),
+                          relief="flat", bd=0, command=cmd).pack(side=tk.LEFT, expand=True, fill=tk.X, padx=2)
+        pos = tk.Frame(self, bg=editor.C_SIDEBAR_BG)
+        pos.pack(fill=tk.X, padx=8, pady=(0, 8))
+        self.pos_entries = []
+        for label in ("X:", "Y:"):
+            tk.Label(pos, text=label, fg=editor.C_TEXT_DIM, bg=editor.C_SIDEBAR_BG, font=("Arial", 8)).pack(side=tk.LEFT, padx=(2, 0))
+            e = tk.Entry(pos, width=4, bg=editor.C_ENTRY_BG, fg=editor.C_TEXT_MAIN, bd=0, highlightthickness=0, justify="center")
+            e.pack(side=tk.LEFT, padx=4)
+            e.bind("<Return>", lambda ev: self.place())
+            self.pos_entries.append(e)
+        tk.Button(pos, text="MOVE", bg=editor.C_BTN_DARK, fg=editor.C_BTN_TEXT, font=("Arial", 8, "bold"),
+                  relief="flat", bd=0, padx=10, command=self.place).pack(side=tk.LEFT, padx=4)
+        self.refresh()
+
+    def refresh(self, select=None):
+        self.listbox.delete(0, tk.END)
+        for layer in reversed(self.stack.layers):  # верхний слой — первой строкой
+            mark = " " if layer.visible else "-"
+            self.listbox.insert(tk.END, f"{mark} {layer.name:<16} {layer.mode:<7} {layer.x},{layer.y} {layer.w}x{layer.h}")
+        names = [l.name for l in reversed(self.stack.layers)]
+        if select in names:
+            self.listbox.selection_set(names.index(select)); self.show_pos()
+        self.info_label.config(text=f"{len(names)} layers")
+
+    def selected(self):
+        sel = self.listbox.curselection()
+        if not sel: return None
+        return self.stack.layers[len(self.stack.layers) - 1 - sel[0]]
+
+    def show_pos(self):
+        layer = self.selected()
+        if layer is None: return
+        for e, v in zip(self.pos_entries, (layer.x, layer.y)):
+            e.delete(0, tk.END); e.insert(0, str(v))
+
+    def changed(self, layer):
+        self.refresh(layer.name if layer else None)
+        if self.editor.layer_view: self.view()
+
+    def add_canvas(self):
+        """Рисунок холста (по рамке) -> слой на том же месте экрана; имя — из NAME (VAR)"""
+        box = self.editor.fb.bbox()
+        if box is None: return
+        x0, y0, x1, y1 = box
+        w, h = x1 - x0 + 1, y1 - y0 + 1
+        name = self.editor.var_entry.get().strip() or f"layer{len(self.stack.layers)}"
+        self.changed(self.stack.add(Layer(name, self.editor.fb.extract(x0, y0, w, h), w, h, x0, y0)))
+
+    def add_input(self):
+        """Массивы из поля ввода: блоки gStatusLine[X + i] |= ... — слой в строке состояния, глифы — слои 0,8"""
+        raw, layer = self.editor.input_text.get("1.0", tk.END), None
+        status_names = {m.group(1) for m in STATUS_RE.finditer(strip_comments(raw))}
+        for name, glyphs in find_bitmap_arrays(raw):
+            status = name in status_names
+            for n, (vals, err) in enumerate(glyphs):
+                if err or not vals: continue
+                fmt = glyph_format(len(vals), 8) if status else detect_format(len(vals), raw, self.editor.format_override(), template=True)
+                x = int(name) if status and name.isdigit() else 0  # gStatusLine[100 + i] — числом, как в экспорте STATUS
+                layer = self.stack.add(Layer(name if len(glyphs) == 1 else f"{name}[{n}]", fmt.decode(vals), fmt.w, fmt.h,
+                                             x, 0 if status else 8))
+        if layer is not None: self.changed(layer)
+
+    def delete(self):
+        layer = self.selected()
+        if layer is not None: self.stack.remove(layer.name); self.changed(None)
+
+    def toggle_visible(self):
+        layer = self.selected()
+        if layer is not None: self.changed(self.stack.update(layer.name, visible=not layer.visible))
+
+    def cycle_mode(self):
+        layer = self.selected()
+        if layer is None: return
+        mode = BLEND_MODES[(BLEND_MODES.index(layer.mode) + 1) % len(BLEND_MODES)]
+        self.changed(self.stack.update(layer.name, mode=mode))
+
+    def restack(self, delta):
+        layer = self.selected()
+        if layer is not None: self.stack.move(layer.name, delta); self.changed(layer)
+
+    def place(self):
+        layer = self.selected()
+        if layer is None: return
+        try: x, y = (int(e.get()) for e in self.pos_entries)
+        except ValueError: return
+        self.changed(self.stack.update(layer.name, x=x, y=y))
+
+    def view(self):
+        """Сведённый экран на холст (рабочая область 128x64)"""
+        ed = self.editor
+        ed.load_glyph(self.stack.compose(), ed.WIDTH, ed.HEIGHT)
+        ed.layer_view = True
+
+    def edit(self):
+        """Один слой на холст: рисуем его отдельно от остальных"""
+        layer = self.selected()
+        if layer is None: return
+        self.editor.load_glyph(list(layer.data), layer.w, layer.h)
+
+    def store(self):
+        """Глиф с холста (рабочая область по центру) -> байты выбранного слоя"""
+        layer = self.selected()
+        if layer is None or self.editor.layer_view: return
+        sx, sy = self.editor.get_offsets()
+        data = self.editor.fb.extract(sx, sy, layer.w, ((layer.h + 7) // 8) * 8)
+        self.changed(self.stack.update(layer.name, data=data))
+
+    def export_status(self):
+        self.editor.show_output(self.stack.status_code())
+
+class ProjectPanel(tk.Toplevel):
+    """Проект .ouro: список активов берётся из индекса, байты актива читаются только при LOAD.
+    STORE дописывает новую версию в конец файла; OLDER — шаг назад по версиям выбранного актива"""
+
+    def __init__(self, editor):
+        super().__init__(editor)
+        self.editor, self.rev = editor, 0
+        self.title("PROJECT")
+        self.configure(bg=editor.C_SIDEBAR_BG)
+        self.geometry("460x460")
+
+        bar = tk.Frame(self, bg=editor.C_TOPBAR_BG)
+        bar.pack(fill=tk.X)
+        self.info_label = tk.Label(bar, text="", fg=editor.C_TEXT_MAIN, bg=editor.C_TOPBAR_BG, font=("Consolas", 10, "bold"))
+        self.info_label.pack(side=tk.LEFT, padx=10, pady=6)
+        for text, cmd in (("COMPACT", self.compact), ("OPEN", self.open), ("NEW", self.new)):
+            tk.Button(bar, text=text, bg=editor.C_BTN_DARK, fg=editor.C_BTN_TEXT, font=("Arial", 8, "bold"),
+                      relief="flat", bd=0, padx=10, command=cmd).pack(side=tk.RIGHT, padx=4)
+
+        self.listbox = tk.Listbox(self, bg=editor.C_ENTRY_BG, fg=editor.C_TEXT_MAIN, font=("Consolas", 10), bd=0,
+                                  highlightthickness=0, selectbackground=editor.C_MENU_ACTIVE, activestyle="none")
+        self.listbox.pack(fill=tk.BOTH, expand=True, padx=8, pady=8)
+        self.listbox.bind("<<ListboxSelect>>", lambda e: setattr(self, "rev", 0))
+        self.listbox.bind("<Double-Button-1>", lambda e: self.load())
+
+        rows = (
+            (("LOAD", self.load), ("OLDER", self.older), ("DEL", self.delete)),
+            (("STORE CANVAS", self.store_canvas), ("STORE TABLE", self.store_table)),
+        )
+        for row in rows:
+            fr = tk.Frame(self, bg=editor.C_SIDEBAR_BG)
+            fr.pack(fill=tk.X, padx=8, pady=(0, 4))
+            for text, cmd in row:
+                tk.Button(fr, text=text, bg=editor.C_BTN_DARK, fg=editor.C_BTN_TEXT, font=("Arial", 8, "bold"),
+                          relief="flat", bd=0, command=cmd).pack(side=tk.LEFT, expand=True, fill=tk.X, padx=2)
+        self.refresh()
+
+    @property
+    def project(self):
+        return self.editor.project
+
+    def refresh(self, select=None):
+        self.listbox.delete(0, tk.END)
+        if self.project is None:
+            self.info_label.config(text="no project"); return
+        names = self.project.names()
+        for name in names:
+            e = self.project.assets[name]
+            count = f" x{e['count']}" if e["count"] > 1 else ""
+            self.listbox.insert(tk.END, f"{name:<18} {e['kind']:<6} {e['w']}x{e['h']}{count:<5} {e['raw']}B v{len(e['history']) + 1}")
+        if select in names: self.listbox.selection_set(names.index(select))
+        self.info_label.config(text=f"{os.path.basename(self.project.path)}: {len(names)} assets, "
+                                    f"{self.project.garbage() // 1024}K unused")
+
+    def selected(self):
+        sel = self.listbox.curselection()
+        return self.project.names()[sel[0]] if sel and self.project is not None else None
+
+    def attach(self, path):
+        try: project = Project(path)
+        except (OSError, ValueError) as e:
+            self.editor.show_output(f"/* {e} */"); return
+        if self.editor.project is not None: self.editor.project.close()
+        self.editor.project = project
+        self.editor.restore_session(project.session)
+        self.refresh()
+
+    def new(self):
+        path = filedialog.asksaveasfilename(parent=self, defaultextension=".ouro", filetypes=[("Ouro project", "*.ouro")])
+        if not path: return
+        if self.project is not None: self.project.close()  # mmap держит файл (Windows не даст его удалить)
+        if os.path.exists(path): os.remove(path)  # диалог уже спросил про замену
+        self.attach(path)
+
+    def open(self):
+        path = filedialog.askopenfilename(parent=self, filetypes=[("Ouro project", "*.ouro"), ("All files", "*.*")])
+        if path: self.attach(path)
+
+    def load(self):
+        """Выбранный актив -> холст (глиф, экран, кадры) или поле ввода (шрифт + ATLAS)"""
+        name, ed = self.selected(), self.editor
+        if name is None: return
+        try: data, entry = self.project.load(name, self.rev)
+        except (OSError, ValueError, IndexError) as e:
+            ed.show_output(f"/* {e} */"); return
+        glyphs = asset_glyphs(data, entry)
+        if entry["kind"] == "font":
+            fmt = parse_format(entry["meta"].get("format", "")) or glyph_format(entry["w"], entry["h"])
+            ed.input_text.delete("1.0", tk.END)
+            ed.input_text.insert("1.0", font_table(name, glyphs, fmt))
+            ed.open_atlas()
+        elif entry["kind"] == "anim":
+            ed.set_frames([(g, entry["w"], entry["h"]) for g in glyphs])
+        else:
+            ed.load_glyph(list(glyphs[0]), entry["w"], entry["h"])
+        ed.var_entry.delete(0, tk.END); ed.var_entry.insert(0, name)
+        self.info_label.config(text=f"{name}: {'current' if self.rev == 0 else f'{self.rev} back'}")
+
+    def older(self):
+        name = self.selected()
+        if name is None: return
+        self.rev = min(self.rev + 1, len(self.project.assets[name]["history"]))
+        self.load()
+
+    def delete(self):
+        name = self.selected()
+        if name is not None: self.project.delete(name); self.refresh()
+
+    def store(self, kind, data, w, h, count=1, **meta):
+        ed = self.editor
+        name = ed.var_entry.get().strip() or f"{kind}{len(self.project.assets)}"
+        self.project.session = ed.session_state()  # индекс пишется один раз — вместе с активом
+        try: self.project.save(name, kind, data, w, h, count, **meta)
+        except OSError as e:
+            ed.show_output(f"/* {e} */"); return
+        self.rev = 0
+        self.refresh(name)
+
+    def store_canvas(self):
+        """Холст под именем из NAME (VAR): кадры ANIM, весь экран 128x64 или глиф рабочей области"""
+        ed = self.editor
+        if self.project is None: return
+        frames = ed.current_frames()
+        if len(frames) > 1:
+            pages = (ed.work_h + 7) // 8
+            sx, sy = ed.get_offsets()
+            crops = [FrameBuffer(ed.WIDTH, ed.HEIGHT, f).extract(sx, sy, ed.work_w, pages * 8) for f in frames]
+            self.store("anim", b''.join(crops), ed.work_w, ed.work_h, len(crops))
+        elif (ed.work_w, ed.work_h) == (ed.WIDTH, ed.HEIGHT):
+            self.store("screen", ed.fb.to_bytes(), ed.WIDTH, ed.HEIGHT)
+        else:
+            sx, sy = ed.get_offsets()
+            self.store("glyph", ed.fb.extract(sx, sy, ed.work_w, ((ed.work_h + 7) // 8) * 8), ed.work_w, ed.work_h)
+
+    def store_table(self):
+        """Таблица глифов из поля ввода -> шрифт (байты редактора + исходный формат для обратной выгрузки)"""
+        ed = self.editor
+        if self.project is None: return
+        raw = ed.input_text.get("1.0", tk.END)
+        blocks = [b.values for b in TOKENIZER.blocks(raw, braced_only=True) if b.values]
+        if not blocks: return
+        fmt = detect_format(len(blocks[0]), raw, ed.format_override())
+        self.store("font", b''.join(fmt.decode(v) for v in blocks), fmt.w, fmt.h, len(blocks), format=str(fmt))
+
+    def compact(self):
+        if self.project is None: return
+        try: self.project.compact()
+        except OSError as e:
+            self.editor.show_output(f"/* {e} */"); return
+        self.refresh(self.selected())
+
+# --- ФОНОВЫЙ ПОТОК: РАЗБОР ВВОДА И ГЕНЕРАЦИЯ КОДА ---
+# Задачи — чистые функции: на вход текст и снимок буфера, на выход неизменяемый результат.
+# Tk трогает только главный поток (poll_worker)
+def parse_input(raw, multi, override=None):
+    """Разбор поля ввода: (имя переменной, 'glyph' | 'pending', данные); override — формат из поля FMT"""
+    var_name = guess_var_name(raw)
+    unpacked = unpack_code(raw)
+    if unpacked:
+        if multi: return var_name, 'pending', tuple((tuple(v), w, h) for v, w, h in unpacked)
+        return var_name, 'glyph', unpacked[0]
+    if multi:
+        # Авто-определение размеров для каждого символа в очереди
+        blocks = [b.values for b in TOKENIZER.blocks(raw, braced_only=True)] or [tuple(byte_values(raw))]
+        fmts = [detect_format(len(vals), raw, override) for vals in blocks]
+        return var_name, 'pending', tuple((tuple(f.decode(vals)), f.w, f.h) for vals, f in zip(blocks, fmts) if vals)
+    all_vals = byte_values(raw)
+    if not all_vals: return var_name, 'glyph', None
+    fmt = detect_format(len(all_vals), raw, override)
+    return var_name, 'glyph', (tuple(fmt.decode(all_vals)), fmt.w, fmt.h)
+
+def crop_code(template, fb, offsets, mode, v_name, override=None):
+    """Код выделения: формат по шаблону во вводе или полю FMT (от центра рабочей области), иначе по рамке рисунка"""
+    found_vals, fmt = byte_values(template), None
+    if found_vals or override is not None:
+        fmt = detect_format(len(found_vals), template, override, template=True)
+        cw, pages = fmt.w, fmt.pages
+        data = fb.extract(offsets[0], offsets[1], cw, pages * 8)
+    else:
+        # Рамка уже посчитана буфером по ходу рисования — холст не сканируется
+        box = fb.bbox()
+        if box is None: return None
+        min_x, min_y, max_x, max_y = box
+        cw = max_x - min_x + 1
+        pages = (max_y - min_y) // 8 + 1
+        data = fb.extract(min_x, min_y, cw, pages * 8)
+    if mode in ("CRLE", "PRLE"): return format_packed(data, mode, v_name, cw, pages)
+    if fmt is None or mode == "STATUS": return format_code(data, mode, v_name, template)
+    code = format_code(fmt.encode(data), mode, v_name, template)
+    # Нестандартный формат без подсказки в шаблоне — подсказка в выводе, чтобы он читался обратно
+    if override is not None and str(fmt) != "{}x{}".format(*guess_template_dims(fmt.size)) and not FORMAT_RE.search(template):
+        code = f"/* format: {fmt} */\n" + code
+    return code
+
+def dict_code(raw, fb, v_name, override=None):
+    """Вся таблица из ввода (блоки {...}) с общим словарём столбцов; без таблицы — рамка рисунка"""
+    glyphs = [b.values for b in TOKENIZER.blocks(raw, braced_only=True) if b.values] or [byte_values(raw)]
+    if not glyphs[0]:
+        box = fb.bbox()
+        if box is None: return None
+        min_x, min_y, max_x, max_y = box
+        pages = (max_y - min_y) // 8 + 1
+        return format_dict([fb.extract(min_x, min_y, max_x - min_x + 1, pages * 8)], v_name, max_x - min_x + 1, pages)
+    fmt = detect_format(len(glyphs[0]), raw, override, template=True)
+    return format_dict([fmt.decode(g) for g in glyphs], v_name, fmt.w, fmt.pages)
+
+def patch_code(raw, screen, gap, v_name, width=128, height=64):
+    """Патч между кадрами: два блока во вводе — ДО и ПОСЛЕ; один блок — ДО, а ПОСЛЕ = screen (холст)"""
+    blocks = [b.values for b in TOKENIZER.blocks(raw, braced_only=True) if b.values]
+    if len(blocks) >= 2: before, after = blocks[0], blocks[1]
+    else: before, after = (blocks[0] if blocks else byte_values(raw)), screen
+    before = FrameBuffer(width, height, before).to_bytes()
+    after = FrameBuffer(width, height, after).to_bytes()
+    return format_patch(lcd_patch(before, after, width, gap), after, v_name, width)
+
+def save_png(path, fb, offsets, w, h, colors, scale, stretch, grid, line_grid):
+    """Рабочая область как на холсте -> PNG"""
+    size = export_png(path, fb, offsets[0], offsets[1], w, h, colors, scale, stretch, grid, line_grid)
+    return f"/* {os.path.basename(path)}: {size[0]}x{size[1]} */"
+
+def save_sheet(path, raw, colors, scale, stretch, override=None):
+    """Блоки {...} таблицы из ввода -> лист PNG с номерами глифов"""
+    blocks = [b.values for b in TOKENIZER.blocks(raw, braced_only=True) if b.values]
+    if not blocks: raise ValueError("no {...} glyph blocks in the input")
+    fmt = detect_format(len(blocks[0]), raw, override)
+    size = contact_sheet(path, [fmt.decode(v) for v in blocks], fmt.w, fmt.h, colors, scale, stretch)
+    return f"/* {os.path.basename(path)}: {len(blocks)} glyphs {fmt}, {size[0]}x{size[1]} */"
+
+def anim_code(frames, offsets, w, h, v_name, width=128, height=64):
+    """Рабочая область каждого кадра -> поток packed:anim"""
+    pages = (h + 7) // 8
+    crops = [FrameBuffer(width, height, f).extract(offsets[0], offsets[1], w, pages * 8) for f in frames]
+    return format_anim(crops, v_name, w, pages)
+
+class Worker:
+    """Один фоновый поток. Каждая задача идёт по своему каналу с номером поколения:
+    новый запрос по каналу делает старые устаревшими — они не запускаются, а их результаты выбрасываются.
+    При включённом профайлере время каждой задачи пишется как «канал:функция» (в трассе — отдельный поток)"""
+
+    def __init__(self, profiler=None):
+        self.jobs, self.results = queue.Queue(), queue.Queue()
+        self.generation, self.delivered = {}, {}
+        self.profiler = profiler
+        threading.Thread(target=self._loop, name="ouro-worker", daemon=True).start()
+
+    def submit(self, channel, fn, *args):
+        gen = self.generation[channel] = self.generation.get(channel, 0) + 1
+        self.jobs.put((channel, gen, fn, args))
+        return gen
+
+    def _loop(self):
+        while True:
+            channel, gen, fn, args = self.jobs.get()
+            if gen != self.generation.get(channel): continue  # пока ждала — пришёл новый запрос
+            prof = self.profiler if self.profiler is not None and self.profiler.enabled else None
+            start = time.perf_counter()
+            try: self.results.put((channel, gen, fn(*args), None))
+            except Exception as e: self.results.put((channel, gen, None, e))
+            if prof is not None:
+                name = f"{channel}:{fn.__name__}"
+                prof.record(name, start, time.perf_counter(), tid=2)
+                prof.last_job = name
+
+    @property
+    def busy(self):
+        return any(self.delivered.get(c) != g for c, g in self.generation.items())
+
+    def poll(self):
+        """Готовые актуальные результаты: [(канал, результат, ошибка)] (вызывать из главного потока)"""
+        out = []
+        while True:
+            try: channel, gen, result, err = self.results.get_nowait()
+            except queue.Empty: return out
+            if gen != self.generation.get(channel): continue
+            self.delivered[channel] = gen
+            out.append((channel, result, err))
+
+# --- ПРОФИЛИРОВАНИЕ UI (F12 — вкл/выкл, Shift+F12 — экспорт трассы Chrome) ---
+class Profiler:
+    """Время обработчиков, задержка «событие -> отрисовка» и число элементов Canvas.
+    Выключенный профайлер стоит одну проверку флага на вызов"""
+    WINDOW = 256          # скользящее окно для p50/p99
+    MAX_EVENTS = 200_000  # потолок трассы в памяти
+
+    def __init__(self):
+        self.enabled = False
+        self.samples = {}
+        self.events = []
+        self.depth = 0
+        self.last = None
+        self.last_job = None  # последняя задача фонового потока (Worker)
+        self.t0 = time.perf_counter()
+
+    def record(self, name, start, end, tid=1):
+        win = self.samples.setdefault(name, [])
+        win.append((end - start) * 1000)
+        if len(win) > self.WINDOW: del win[0]
+        if len(self.events) < self.MAX_EVENTS:
+            self.events.append({"name": name, "ph": "X", "pid": 1, "tid": tid,
+                                "ts": round((start - self.t0) * 1e6, 1), "dur": round((end - start) * 1e6, 1)})
+
+    def counter(self, name, value):
+        if len(self.events) < self.MAX_EVENTS:
+            self.events.append({"name": name, "ph": "C", "pid": 1, "tid": 1,
+                                "ts": round((time.perf_counter() - self.t0) * 1e6, 1), "args": {name: value}})
+
+    def percentiles(self, name):
+        win = sorted(self.samples.get(name) or [0.0])
+        return win[len(win) // 2], win[min(len(win) - 1, len(win) * 99 // 100)]
+
+    def reset(self):
+        self.samples.clear(); self.events.clear(); self.last = self.last_job = None
+        self.t0 = time.perf_counter()
+
+    def export(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+
+def profiled(method):
+    """Обёртка обработчика редактора: при включённом профайлере пишет время вызова,
+    а для внешнего вызова ещё и задержку до ближайшего простоя Tk (т.е. до перерисовки)"""
+    name = method.__name__
+    def wrapper(self, *args, **kwargs):
+        prof = self.profiler
+        if not prof.enabled: return method(self, *args, **kwargs)
+        start = time.perf_counter()
+        prof.depth += 1
+        try: return method(self, *args, **kwargs)
+        finally:
+            prof.depth -= 1
+            prof.record(name, start, time.perf_counter())
+            if prof.depth == 0:
+                prof.last = name
+                self.after_idle(lambda: self.profile_painted(start))
+    wrapper.__name__, wrapper.__doc__ = name, method.__doc__
+    return wrapper
 
 class OuroMasterEditor(tk.Tk):
     def __init__(self):
@@ -21,11 +2341,7 @@ class OuroMasterEditor(tk.Tk):
         self.C_MENU_BG     = "#222222"  
         self.C_MENU_ACTIVE = "#444444"  
         
-        self.themes = {
-            'O': {"bg": "#FFA500", "px": "#0A0A0A", "inv_bg": "#231600"},
-            'W': {"bg": "#E0E0E0", "px": "#0A0A0A", "inv_bg": "#232323"},
-            'B': {"bg": "#45b5ff", "px": "#0A0A0A", "inv_bg": "#001e34"}
-        }
+        self.themes = {name: dict(t) for name, t in THEMES.items()}
         
         self.GRID_BRIGHTNESS = 0.9
         self.INV_GRID_BRIGHTNESS = 1.7
@@ -40,21 +2356,46 @@ class OuroMasterEditor(tk.Tk):
         self.SCALE = 8
         self.STRETCH_Y = 1.45
         self.PADDING = 2 
-        self.pixels = [[0 for _ in range(self.HEIGHT)] for _ in range(self.WIDTH)]
+        self.RENDER_MODE = "image"  # "image" — один PhotoImage, "items" — прямоугольник на пиксель
+        self.IMAGE_MAX_PIXELS = 6_000_000  # крупнее — рисуем элементами Canvas
+        self.raster, self.photo, self.raster_body = None, None, None
+        self._palettes = {}  # (цвета темы, инверсия) -> готовые цвета холста и таблица translate
+        self.fb = FrameBuffer(self.WIDTH, self.HEIGHT)
         
-        # --- ИСТОРИЯ (UNDO) ---
-        self.history = []
+        # --- ИСТОРИЯ (UNDO/REDO) ---
+        self.UNDO_BUDGET_KB = 512  # память под журнал отмены; глубина в шагах не ограничена
+        self.journal = UndoJournal(self.UNDO_BUDGET_KB * 1024)
         
         self.work_w, self.work_h = 128, 64
         self.current_theme = 'O'
         self.inverted = False
         self.line_start = None
         self.phantom_line = None 
+        self.text_mode, self.text_font, self.text_preview = False, (None, None), None  # инструмент TEXT
+        self.select_mode, self.selection, self.sel_drag, self.sel_item = False, None, None, None  # выделение (x, y, w, h)
+        self.sel_clip, self.last_cell = None, (0, 0)
         self.line_just_finished = False
+        self.FRAME_MS = 16  # протяжка мыши рисуется не чаще раза за кадр
+        self.stroke_queue, self.stroke_last, self._stroke_job = [], None, None
+        self._invalid, self._dirty_rects, self._render_job = set(), [], None  # отложенная перерисовка (render)
+        self._zoom_anchor = None
         self.show_line_grid = False
         
         self.multi_mode = False
         self.pending_chars = None 
+        self.atlas = None
+        self.layers, self.layer_panel, self.layer_view = LayerStack(self.WIDTH, self.HEIGHT), None, False
+        self.project, self.project_panel = None, None
+        # --- АНИМАЦИЯ: кадр = (байты буфера, свой журнал отмены); текущий кадр живёт в self.fb / self.journal ---
+        self.frames, self.frame_index = [None], 0
+        self.onion_skin, self.onion = False, None  # калька: буфер предыдущего кадра под текущим
+        self._play_job, self._play_cache = None, {}  # воспроизведение: готовые PPM кадров
+        self.profiler = Profiler()
+        self.worker = Worker(self.profiler)  # разбор ввода и генерация кода — вне потока Tk
+        self.POLL_MS, self._poll_job = 15, None
+        self.link = None  # открытый .c/.h (SourceLink), за которым следим
+        self.shown_source = ""  # текст файла в том виде, в каком он последний раз лёг в поле ввода
+        self.WATCH_MS, self._watch_job = 500, None
 
         self.theme_buttons = {}
         self.quick_buttons = {} 
@@ -62,27 +2403,46 @@ class OuroMasterEditor(tk.Tk):
         
         self.setup_ui()
         self.create_context_menu()
-        self.redraw_full()
+        self.invalidate("geometry")
 
     # --- МЕТОДЫ ОТМЕНЫ ---
+    def begin_edit(self):
+        """Вход любой правки буфера: PLAY останавливается, чтобы правка легла в кадр вместе с его журналом"""
+        if self._play_job is not None: self.toggle_play()
+        self.journal.begin(self.fb)
+
     def save_history(self):
-        """Сохраняем текущее состояние перед изменением"""
-        state = [row[:] for row in self.pixels]
-        self.history.append(state)
-        if len(self.history) > 10:
-            self.history.pop(0)
+        """Открываем новую запись перед изменением (незакрытый штрих закрывается)"""
+        if self._play_job is not None: self.toggle_play()
+        self.journal.commit(self.fb)
+        self.begin_edit()
+
+    def commit_history(self):
+        """Закрываем запись: в журнал уходит только XOR-дельта изменённых байтов"""
+        self.journal.commit(self.fb)
+        self.show_bbox()
 
+    def show_bbox(self):
+        box = self.fb.bbox()
+        text = "BOX: ---" if box is None else f"BOX: {box[0]},{box[1]} {box[2] - box[0] + 1}x{box[3] - box[1] + 1}"
+        if self.bbox_label.cget("text") != text: self.bbox_label.config(text=text)
+
+    @profiled
     def undo(self, event=None):
         """Возврат к предыдущему состоянию"""
-        if self.history:
-            self.pixels = self.history.pop()
-            self.redraw_full()
+        if self._play_job is not None: return  # журнал — у остановленного кадра
+        if self.journal.undo(self.fb):
+            self.invalidate("pixels"); self.show_bbox()
+
+    @profiled
+    def redo(self, event=None):
+        """Повтор отменённого действия"""
+        if self._play_job is not None: return
+        if self.journal.redo(self.fb):
+            self.invalidate("pixels"); self.show_bbox()
 
     def adjust_color(self, hex_color, factor):
-        hex_color = hex_color.lstrip('#')
-        rgb = [int(hex_color[i:i+2], 16) for i in (0, 2, 4)]
-        new_rgb = [max(0, min(255, int(c * factor))) for c in rgb]
-        return "#{:02x}{:02x}{:02x}".format(*new_rgb)
+        return adjust_color(hex_color, factor)
 
     def choose_custom_color(self):
         color = colorchooser.askcolor(title="Select color")[1]
@@ -168,6 +2528,14 @@ class OuroMasterEditor(tk.Tk):
                                     relief="flat", bd=0, command=self.reset_dims, width=6)
         self.btn_reset.pack(side=tk.LEFT, padx=5)
 
+        # Формат глифов ввода: AUTO — по подсказке /* format: ... */ и числу байтов, иначе, например, 16x24 msb columns
+        tk.Label(left_box, text="FMT:", fg=self.C_TEXT_DIM, bg=self.C_TOPBAR_BG, font=("Arial", 9, "bold")).pack(side=tk.LEFT, padx=(5, 0))
+        self.fmt_entry = tk.Entry(left_box, width=16, bg=self.C_ENTRY_BG, fg=self.C_TEXT_MAIN, bd=0, highlightthickness=0,
+                                  insertbackground=self.C_TEXT_MAIN, justify="center")
+        self.fmt_entry.insert(0, "AUTO")
+        self.fmt_entry.pack(side=tk.LEFT, padx=5)
+        self.fmt_entry.bind("<Return>", self.parse_and_draw)
+
         center_box = tk.Frame(top, bg=self.C_TOPBAR_BG)
         center_box.place(relx=0.5, rely=0.5, anchor="center")
         
@@ -177,6 +2545,9 @@ class OuroMasterEditor(tk.Tk):
 
         self.pos_label = tk.Label(center_box, text="POS: 0,0", fg=self.C_TEXT_MAIN, bg=self.C_TOPBAR_BG, font=("Consolas", 11, "bold"))
         self.pos_label.pack(side=tk.LEFT, padx=10)
+        self.bbox_label = tk.Label(center_box, text="BOX: ---", fg=self.C_TEXT_DIM, bg=self.C_TOPBAR_BG, font=("Consolas", 10, "bold"))
+        self.bbox_label.pack(side=tk.LEFT, padx=(0, 10))
+        self.prof_label = tk.Label(center_box, text="", fg=self.C_TEXT_DIM, bg=self.C_TOPBAR_BG, font=("Consolas", 8))
         self.line_label = tk.Label(center_box, text="LINE: ---", fg=self.C_TEXT_MAIN, bg=self.C_TOPBAR_BG, font=("Consolas", 10, "bold"))
         self.line_label.pack(side=tk.LEFT, padx=10)
         self.btn_clear = tk.Button(center_box, text="CLEAN CANVAS", bg=self.C_BTN_DANGER, fg="white", font=("Arial", 9, "bold"), 
@@ -237,6 +2608,15 @@ class OuroMasterEditor(tk.Tk):
         self.spacing_entry.insert(0, "1")
         self.spacing_entry.pack(side=tk.RIGHT, padx=5)
         tk.Label(var_top_frame, text="SPACE:", fg=self.C_TEXT_DIM, bg=self.C_SIDEBAR_BG, font=("Arial", 8)).pack(side=tk.RIGHT)
+        self.btn_atlas = tk.Button(var_top_frame, text="ATLAS", bg=self.C_BTN_DARK, fg=self.C_BTN_TEXT, font=("Arial", 8, "bold"),
+                                    relief="flat", bd=0, command=self.open_atlas, padx=10)
+        self.btn_atlas.pack(side=tk.RIGHT, padx=(0, 10))
+        self.btn_layers = tk.Button(var_top_frame, text="LAYERS", bg=self.C_BTN_DARK, fg=self.C_BTN_TEXT, font=("Arial", 8, "bold"),
+                                    relief="flat", bd=0, command=self.open_layers, padx=10)
+        self.btn_layers.pack(side=tk.RIGHT, padx=(0, 6))
+        self.btn_project = tk.Button(var_top_frame, text="PROJECT", bg=self.C_BTN_DARK, fg=self.C_BTN_TEXT, font=("Arial", 8, "bold"),
+                                     relief="flat", bd=0, command=self.open_project, padx=10)
+        self.btn_project.pack(side=tk.RIGHT, padx=(0, 6))
 
         self.var_entry = tk.Entry(self.sidebar, bg=self.C_ENTRY_BG, font=("Consolas", 12), insertbackground=self.C_TEXT_MAIN, 
                                   borderwidth=0, highlightthickness=0)
@@ -248,6 +2628,20 @@ class OuroMasterEditor(tk.Tk):
         self.input_text.pack(padx=14, pady=3, fill=tk.X)
         self.input_text.bind("<<Paste>>", lambda e: self.after(50, self.parse_and_draw))
 
+        # --- ФАЙЛ ИСХОДНИКА: открыть .c/.h, следить за внешними правками, записать глиф на место ---
+        src_frame = tk.Frame(self.sidebar, bg=self.C_SIDEBAR_BG)
+        src_frame.pack(padx=15, pady=(4, 0), fill=tk.X)
+        self.btn_open_src = tk.Button(src_frame, text="OPEN SRC", fg="black", bd=0, font=("Arial", 9, "bold"), command=self.open_source)
+        self.btn_open_src.pack(side=tk.LEFT, padx=(0, 2))
+        self.btn_save_src = tk.Button(src_frame, text="SAVE SRC", fg="black", bd=0, font=("Arial", 9, "bold"), command=self.save_source)
+        self.btn_save_src.pack(side=tk.LEFT, padx=2)
+        self.btn_sheet = tk.Button(src_frame, text="SHEET", fg="black", bd=0, font=("Arial", 9, "bold"), command=self.export_sheet)
+        self.btn_sheet.pack(side=tk.RIGHT, padx=(2, 0))
+        self.btn_png = tk.Button(src_frame, text="PNG", fg="black", bd=0, font=("Arial", 9, "bold"), command=self.export_canvas)
+        self.btn_png.pack(side=tk.RIGHT, padx=2)
+        self.src_label = tk.Label(src_frame, text="NO FILE", fg=self.C_TEXT_DIM, bg=self.C_SIDEBAR_BG, font=("Consolas", 9), anchor="w")
+        self.src_label.pack(side=tk.LEFT, padx=(8, 0), fill=tk.X, expand=True)
+
         gen_frame = tk.Frame(self.sidebar, bg=self.C_SIDEBAR_BG)
         gen_frame.pack(padx=15, pady=10, fill=tk.X)
         
@@ -258,6 +2652,96 @@ class OuroMasterEditor(tk.Tk):
         self.btn_bin = tk.Button(gen_frame, text="BINARY", fg="black", bd=0, font=("Arial", 10, "bold"), command=lambda: self.crop_and_generate("BIN"))
         self.btn_bin.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=(2,0))
 
+        # --- СЖАТЫЙ ВЫВОД: CRLE/PRLE — выделение холста, DICT — вся таблица из ввода ---
+        pack_frame = tk.Frame(self.sidebar, bg=self.C_SIDEBAR_BG)
+        pack_frame.pack(padx=15, pady=(0, 6), fill=tk.X)
+        self.btn_crle = tk.Button(pack_frame, text="COL RLE", fg="black", bd=0, font=("Arial", 9, "bold"), command=lambda: self.crop_and_generate("CRLE"))
+        self.btn_crle.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=(0,2))
+        self.btn_prle = tk.Button(pack_frame, text="PAGE RLE", fg="black", bd=0, font=("Arial", 9, "bold"), command=lambda: self.crop_and_generate("PRLE"))
+        self.btn_prle.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=2)
+        self.btn_dict = tk.Button(pack_frame, text="DICT TABLE", fg="black", bd=0, font=("Arial", 9, "bold"), command=self.generate_dict)
+        self.btn_dict.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=(2,0))
+
+        # --- ИМПОРТ КАРТИНКИ: вписывается в рабочую область с поправкой на RATIO ---
+        import_frame = tk.Frame(self.sidebar, bg=self.C_SIDEBAR_BG)
+        import_frame.pack(padx=15, pady=(0, 6), fill=tk.X)
+        self.btn_import = tk.Button(import_frame, text="IMPORT IMAGE", fg="black", bd=0, font=("Arial", 9, "bold"), command=self.import_image)
+        self.btn_import.pack(side=tk.LEFT, expand=True, fill=tk.X)
+        self.thr_entry = tk.Entry(import_frame, width=4, bg=self.C_ENTRY_BG, fg=self.C_TEXT_MAIN, bd=0, highlightthickness=0, justify="center")
+        self.thr_entry.insert(0, "128")
+        self.thr_entry.pack(side=tk.RIGHT, padx=(5, 0))
+        tk.Label(import_frame, text="THR:", fg=self.C_TEXT_DIM, bg=self.C_SIDEBAR_BG, font=("Arial", 8)).pack(side=tk.RIGHT, padx=(5, 0))
+        self.btn_dither = tk.Button(import_frame, text=DITHER_MODES[0], bg=self.C_BTN_DARK, fg=self.C_BTN_TEXT, font=("Arial", 8, "bold"),
+                                    relief="flat", bd=0, width=7, command=self.cycle_dither)
+        self.btn_dither.pack(side=tk.RIGHT, padx=(5, 0))
+
+        # --- ТЕКСТ: шрифт = таблица во вводе (первый глиф — пробел), строка ставится щелчком ---
+        text_frame = tk.Frame(self.sidebar, bg=self.C_SIDEBAR_BG)
+        text_frame.pack(padx=15, pady=(0, 6), fill=tk.X)
+        self.btn_text = tk.Button(text_frame, text="TEXT", bg=self.C_BTN_DARK, fg=self.C_BTN_TEXT, font=("Arial", 8, "bold"),
+                                  relief="flat", bd=0, command=self.toggle_text, padx=10)
+        self.btn_text.pack(side=tk.LEFT)
+        self.btn_align = tk.Button(text_frame, text=TEXT_ALIGNS[0], bg=self.C_BTN_DARK, fg=self.C_BTN_TEXT, font=("Arial", 8, "bold"),
+                                   relief="flat", bd=0, width=7, command=self.cycle_align)
+        self.btn_align.pack(side=tk.RIGHT, padx=(5, 0))
+        self.text_entry = tk.Entry(text_frame, bg=self.C_ENTRY_BG, fg=self.C_TEXT_MAIN, font=("Consolas", 11), bd=0,
+                                   highlightthickness=0, insertbackground=self.C_TEXT_MAIN)
+        self.text_entry.insert(0, "Hello")
+        self.text_entry.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=(5, 0))
+
+        # --- ВЫДЕЛЕНИЕ: рамка мышью, перетаскивание, стрелки (Shift — циклический сдвиг внутри), Ctrl+C / Ctrl+V ---
+        sel_frame = tk.Frame(self.sidebar, bg=self.C_SIDEBAR_BG)
+        sel_frame.pack(padx=15, pady=(0, 6), fill=tk.X)
+        self.btn_select = tk.Button(sel_frame, text="SELECT", bg=self.C_BTN_DARK, fg=self.C_BTN_TEXT, font=("Arial", 8, "bold"),
+                                    relief="flat", bd=0, command=self.toggle_select, padx=10)
+        self.btn_select.pack(side=tk.LEFT)
+        for text, op in (("INV", invert_region), ("ROT", rotate_cw), ("FLIP V", flip_v), ("FLIP H", flip_h)):
+            tk.Button(sel_frame, text=text, bg=self.C_BTN_DARK, fg=self.C_BTN_TEXT, font=("Arial", 8, "bold"), relief="flat", bd=0,
+                      padx=6, command=lambda _op=op: self.edit_selection(_op)).pack(side=tk.RIGHT, padx=(4, 0))
+
+        # --- ПОВТОРЫ: точные дубликаты и похожие (до NEAR пикселей) глифы всех массивов ввода ---
+        dedup_frame = tk.Frame(self.sidebar, bg=self.C_SIDEBAR_BG)
+        dedup_frame.pack(padx=15, pady=(0, 6), fill=tk.X)
+        self.btn_dedup = tk.Button(dedup_frame, text="DEDUP GLYPHS", fg="black", bd=0, font=("Arial", 9, "bold"), command=self.generate_dedup)
+        self.btn_dedup.pack(side=tk.LEFT, expand=True, fill=tk.X)
+        self.near_entry = tk.Entry(dedup_frame, width=3, bg=self.C_ENTRY_BG, fg=self.C_TEXT_MAIN, bd=0, highlightthickness=0, justify="center")
+        self.near_entry.insert(0, "2")
+        self.near_entry.pack(side=tk.RIGHT, padx=(5, 0))
+        tk.Label(dedup_frame, text="NEAR:", fg=self.C_TEXT_DIM, bg=self.C_SIDEBAR_BG, font=("Arial", 8)).pack(side=tk.RIGHT, padx=(5, 0))
+
+        # --- АНИМАЦИЯ: кадры, калька, воспроизведение, экспорт целиком/дельтами ---
+        anim_frame = tk.Frame(self.sidebar, bg=self.C_SIDEBAR_BG)
+        anim_frame.pack(padx=15, pady=(0, 6), fill=tk.X)
+        self.btn_anim = tk.Button(anim_frame, text="ANIM", fg="black", bd=0, font=("Arial", 9, "bold"), command=self.generate_anim, padx=8)
+        self.btn_anim.pack(side=tk.LEFT)
+        self.frame_label = tk.Label(anim_frame, text="1/1", width=6, fg=self.C_TEXT_MAIN, bg=self.C_SIDEBAR_BG, font=("Consolas", 9, "bold"))
+        for text, cmd in (("<", lambda: self.show_frame(self.frame_index - 1)), (None, None),
+                          (">", lambda: self.show_frame(self.frame_index + 1)), ("+", self.add_frame), ("-", self.delete_frame),
+                          ("LOAD", self.load_frames)):
+            if text is None: self.frame_label.pack(side=tk.LEFT); continue
+            tk.Button(anim_frame, text=text, bg=self.C_BTN_DARK, fg=self.C_BTN_TEXT, font=("Arial", 8, "bold"), relief="flat", bd=0,
+                      padx=6, command=cmd).pack(side=tk.LEFT, padx=(4, 0))
+        self.fps_entry = tk.Entry(anim_frame, width=3, bg=self.C_ENTRY_BG, fg=self.C_TEXT_MAIN, bd=0, highlightthickness=0, justify="center")
+        self.fps_entry.insert(0, "8")
+        self.fps_entry.pack(side=tk.RIGHT, padx=(5, 0))
+        tk.Label(anim_frame, text="FPS:", fg=self.C_TEXT_DIM, bg=self.C_SIDEBAR_BG, font=("Arial", 8)).pack(side=tk.RIGHT, padx=(5, 0))
+        self.btn_play = tk.Button(anim_frame, text="PLAY", bg=self.C_BTN_DARK, fg=self.C_BTN_TEXT, font=("Arial", 8, "bold"), relief="flat", bd=0,
+                                  padx=6, command=self.toggle_play)
+        self.btn_play.pack(side=tk.RIGHT, padx=(4, 0))
+        self.btn_onion = tk.Button(anim_frame, text="ONION", bg=self.C_BTN_DARK, fg=self.C_BTN_TEXT, font=("Arial", 8, "bold"), relief="flat", bd=0,
+                                   padx=6, command=self.toggle_onion)
+        self.btn_onion.pack(side=tk.RIGHT, padx=(4, 0))
+
+        # --- ПАТЧ ЭКРАНА: ДО (ввод) -> ПОСЛЕ (второй блок ввода или холст) ---
+        patch_frame = tk.Frame(self.sidebar, bg=self.C_SIDEBAR_BG)
+        patch_frame.pack(padx=15, pady=(0, 6), fill=tk.X)
+        self.btn_patch = tk.Button(patch_frame, text="LCD PATCH", fg="black", bd=0, font=("Arial", 10, "bold"), command=self.generate_patch)
+        self.btn_patch.pack(side=tk.LEFT, expand=True, fill=tk.X)
+        self.gap_entry = tk.Entry(patch_frame, width=3, bg=self.C_ENTRY_BG, fg=self.C_TEXT_MAIN, bd=0, highlightthickness=0, justify="center")
+        self.gap_entry.insert(0, str(PATCH_OVERHEAD))
+        self.gap_entry.pack(side=tk.RIGHT, padx=(5, 0))
+        tk.Label(patch_frame, text="GAP:", fg=self.C_TEXT_DIM, bg=self.C_SIDEBAR_BG, font=("Arial", 8)).pack(side=tk.RIGHT, padx=(5, 0))
+
         self.output_text = tk.Text(self.sidebar, bg=self.C_ENTRY_BG, fg=self.C_TEXT_MAIN, font=("Consolas", 11), borderwidth=0, highlightthickness=0)
         height=6,  # <--- вывода
         self.output_text.pack(padx=15, pady=3, fill=tk.BOTH, expand=True)
@@ -265,34 +2749,85 @@ class OuroMasterEditor(tk.Tk):
         self.btn_copy = tk.Button(self.sidebar, text="COPY CODE", fg="black", font=("Arial", 11, "bold"), command=self.copy_to_clip, relief="flat", height=2, bd=0)
         self.btn_copy.pack(padx=15, pady=8, fill=tk.X)
         
-        self.action_buttons = [self.btn_hex, self.btn_status, self.btn_bin, self.btn_copy]
+        self.action_buttons = [self.btn_hex, self.btn_status, self.btn_bin, self.btn_crle, self.btn_prle, self.btn_dict,
+                               self.btn_import, self.btn_dedup, self.btn_patch, self.btn_copy,
+                               self.btn_open_src, self.btn_save_src, self.btn_anim, self.btn_png, self.btn_sheet]
 
         self.canvas.bind("<Button-1>", self.on_canvas_click)
         self.canvas.bind("<ButtonRelease-1>", self.on_release)
         self.canvas.bind("<MouseWheel>", self.on_zoom)
         self.canvas.bind("<Motion>", self.update_pos)
-        self.canvas.bind("<B1-Motion>", lambda e: self.paint(e, 1))
+        self.canvas.bind("<Configure>", lambda e: self.invalidate("geometry"))  # центровка по реальному размеру
+        self.canvas.bind("<B1-Motion>", lambda e: self.queue_stroke(e, 1))
         self.canvas.bind("<Button-3>", lambda e: self.paint(e, 0))
-        self.canvas.bind("<B3-Motion>", lambda e: self.paint(e, 0))
+        self.canvas.bind("<ButtonRelease-3>", self.on_release)
+        self.canvas.bind("<B3-Motion>", lambda e: self.queue_stroke(e, 0))
         
         self.bind("<KeyPress-w>", lambda e: self.set_theme('W'))
         self.bind("<KeyPress-o>", lambda e: self.set_theme('O'))
         self.bind("<KeyPress-b>", lambda e: self.set_theme('B'))
         self.bind("<KeyPress-i>", lambda e: self.toggle_invert())
         self.bind("<KeyPress-c>", lambda e: self.clear_all())
+        for key, dx, dy in (("Left", -1, 0), ("Right", 1, 0), ("Up", 0, -1), ("Down", 0, 1)):
+            self.bind(f"<{key}>", lambda e, _dx=dx, _dy=dy: self.nudge_selection(_dx, _dy, False))
+            self.bind(f"<Shift-{key}>", lambda e, _dx=dx, _dy=dy: self.nudge_selection(_dx, _dy, True))
+        self.bind("<Control-c>", self.copy_selection)
+        self.bind("<Control-v>", self.paste_selection)
+        self.bind("<Escape>", lambda e: self.set_selection(None))
         
         # --- ГОРЯЧАЯ КЛАВИША ОТМЕНЫ ---
         self.bind("<Control-z>", self.undo)
+        self.bind("<Control-y>", self.redo)
+        self.bind("<Control-s>", self.save_source)
+        self.bind("<F12>", self.toggle_profiler)
+        self.bind("<Shift-F12>", self.export_trace)
         
         for widget in (self.input_text, self.output_text, self.var_entry):
             widget.bind("<Button-3>", self.show_menu)
         self.set_theme('O')
 
+    def toggle_profiler(self, event=None):
+        prof = self.profiler
+        prof.enabled = not prof.enabled
+        if prof.enabled:
+            prof.reset()
+            self.prof_label.pack(side=tk.LEFT, padx=(0, 10), after=self.bbox_label)
+            self.after(250, self.update_profile_label)
+        else:
+            self.prof_label.pack_forget()
+
+    def profile_painted(self, start):
+        """Вызывается в простое Tk после обработчика: изменения уже отрисованы"""
+        prof = self.profiler
+        prof.record("event->paint", start, time.perf_counter())
+        prof.counter("canvas items", len(self.canvas.find_all()))
+
+    def update_profile_label(self):
+        prof = self.profiler
+        if not prof.enabled: return
+        parts = []
+        if prof.last:
+            p50, p99 = prof.percentiles(prof.last)
+            parts.append(f"{prof.last} {p50:.1f}/{p99:.1f}")
+            p50, p99 = prof.percentiles("event->paint")
+            parts.append(f"LAT {p50:.1f}/{p99:.1f}")
+        if prof.last_job:
+            p50, p99 = prof.percentiles(prof.last_job)
+            parts.append(f"{prof.last_job} {p50:.1f}/{p99:.1f}")
+        parts.append(f"ITEMS {len(self.canvas.find_all())}")
+        self.prof_label.config(text="P50/P99 ms: " + "  ".join(parts))
+        self.after(250, self.update_profile_label)
+
+    def export_trace(self, event=None):
+        path = filedialog.asksaveasfilename(parent=self, defaultextension=".json", initialfile="ouro_trace.json",
+                                            filetypes=[("Chrome trace", "*.json")])
+        if path: self.profiler.export(path)
+
     def toggle_line_grid(self):
         self.show_line_grid = not self.show_line_grid
         self.btn_lgrid.config(bg=self.themes[self.current_theme]['bg'] if self.show_line_grid else self.C_BTN_DARK,
                               fg="black" if self.show_line_grid else self.C_BTN_TEXT)
-        self.redraw_full()
+        self.invalidate("grid")
 
     def toggle_multi(self):
         self.multi_mode = not self.multi_mode
@@ -319,6 +2854,7 @@ class OuroMasterEditor(tk.Tk):
         if isinstance(w, tk.Text): w.delete("1.0", tk.END)
         elif isinstance(w, tk.Entry): w.delete(0, tk.END)
 
+    @profiled
     def set_theme(self, theme): 
         self.current_theme = theme
         t = self.themes[theme]
@@ -333,20 +2869,23 @@ class OuroMasterEditor(tk.Tk):
         for b in self.action_buttons:
             b.config(bg=color, fg="black", activebackground=self.C_MENU_ACTIVE, activeforeground=color)
         if self.show_line_grid: self.btn_lgrid.config(bg=color)
+        if self.onion_skin: self.btn_onion.config(bg=color)
         self.btn_reset.config(fg=color)
         self.btn_clear.config(bg=color, fg="black") 
-        self.redraw_full()
+        self.invalidate("palette")
 
+    @profiled
     def apply_settings(self, event=None):
         try:
             self.SCALE = max(1, int(self.scale_entry.get()))
             self.STRETCH_Y = max(0.1, float(self.ratio_entry.get()))
             self.work_w = max(1, min(self.WIDTH, int(self.w_entry.get())))
             self.work_h = max(1, min(self.HEIGHT, int(self.h_entry.get())))
-            self.redraw_full()
+            self.invalidate("geometry")
             self.focus_set()
         except ValueError: pass
 
+    @profiled
     def on_zoom(self, event):
         mx, my = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
         old_scale = self.SCALE
@@ -354,26 +2893,105 @@ class OuroMasterEditor(tk.Tk):
         else: self.SCALE = max(2, self.SCALE - 2)
         if old_scale == self.SCALE: return
         self.scale_entry.delete(0, tk.END); self.scale_entry.insert(0, str(self.SCALE))
-        self.redraw_full()
-        ratio = self.SCALE / old_scale
-        self.canvas.xview_moveto((mx * ratio - event.x) / (self.WIDTH * self.SCALE))
-        self.canvas.yview_moveto((my * ratio - event.y) / (self.HEIGHT * self.SCALE * self.STRETCH_Y))
+        # Серия щелчков колеса за кадр = одна перерисовка; якорь — точка под курсором до первого щелчка
+        if self._zoom_anchor is None: self._zoom_anchor = (mx, my, event.x, event.y, old_scale)
+        self.invalidate("geometry")
+
+    def invalidate(self, what="geometry", rect=None):
+        """Отмечаем, что изменилось: geometry / palette / grid — холст собирается заново,
+        pixels — только область rect (x, y, w, h) или, без rect, изменённые страницы буфера.
+        Всё накопленное рисуется одним проходом render() в простое Tk"""
+        if what == "pixels" and rect is not None: self._dirty_rects.append(rect)
+        else: self._invalid.add("pages" if what == "pixels" else what)
+        if self._render_job is None: self._render_job = self.after_idle(self.render)
+
+    @profiled
+    def render(self):
+        self._render_job = None
+        invalid, rects = self._invalid, self._dirty_rects
+        self._invalid, self._dirty_rects = set(), []
+        pages = self.fb.take_dirty()
+        if "palette" in invalid and not invalid - {"pages", "palette"}:
+            self.recolor(); invalid.discard("palette")
+        if invalid - {"pages"}:
+            self.redraw_full()
+            if self._zoom_anchor:
+                mx, my, ex, ey, old_scale = self._zoom_anchor
+                ratio = self.SCALE / old_scale
+                self.canvas.xview_moveto((mx * ratio - ex) / (self.WIDTH * self.SCALE))
+                self.canvas.yview_moveto((my * ratio - ey) / (self.HEIGHT * self.SCALE * self.STRETCH_Y))
+            self._zoom_anchor = None
+            return
+        if "pages" in invalid and pages:
+            p0, p1 = (pages & -pages).bit_length() - 1, pages.bit_length() - 1
+            rects.append((0, p0 * 8, self.WIDTH, (p1 - p0 + 1) * 8))
+        if not rects: return
+        # Все области кадра — одной рамкой, обрезанной по рабочей области
+        off_x, off_y = self.get_offsets()
+        x0 = max(off_x, min(r[0] for r in rects)); y0 = max(off_y, min(r[1] for r in rects))
+        x1 = min(off_x + self.work_w, max(r[0] + r[2] for r in rects))
+        y1 = min(off_y + self.work_h, max(r[1] + r[3] for r in rects))
+        if x1 <= x0 or y1 <= y0: return
+        if self.raster is None and (x1 - x0) * (y1 - y0) > 2048: self.redraw_full()
+        else: self.refresh_rect(x0, y0, x1 - x0, y1 - y0)
+
+    def canvas_colors(self):
+        """Текущие цвета холста: фон, пиксель, сетка, линии страниц"""
+        t = self.themes[self.current_theme]
+        key = (t["bg"], t["px"], t["inv_bg"], self.inverted)
+        colors = self._palettes.get(key)
+        if colors is None:
+            colors = theme_colors(t, self.inverted, self.GRID_BRIGHTNESS, self.INV_GRID_BRIGHTNESS)
+            colors["table"] = palette_table(colors)
+            self._palettes[key] = colors
+        return colors
 
+    @profiled
+    def recolor(self):
+        """Смена темы/инверсии: холст не пересобирается — только новые цвета у готовых элементов"""
+        colors = self.canvas_colors()
+        self.canvas.itemconfig("bg", fill=colors["bg"])
+        if self.phantom_line: self.canvas.itemconfig(self.phantom_line, fill=colors["px"])
+        if self.raster is not None:
+            self.photo.configure(data=self.raster.ppm(self.fb, 0, 0, colors, self.raster_body), format="PPM")
+            return
+        self.canvas.itemconfig("grid", fill=colors["grid"])
+        self.canvas.itemconfig("line_grid", fill=colors["lgrid"])
+        self.canvas.itemconfig("px", fill=colors["px"])
+
+    @profiled
     def redraw_full(self):
         cw = (self.work_w + self.PADDING * 2) * self.SCALE
         ch = int((self.work_h + self.PADDING * 2) * self.SCALE * self.STRETCH_Y)
-        self.canvas.update()
         v_w, v_h = self.canvas.winfo_width(), self.canvas.winfo_height()
-        self.canvas.delete("all")
+        self.canvas.delete("all"); self.phantom_line = self.text_preview = self.sel_item = None
         self.canvas.config(scrollregion=(0, 0, max(cw, v_w), max(ch, v_h)))
         dx = max(0, (v_w - cw) // 2) if v_w > 1 else 0
         dy = max(0, (v_h - ch) // 2) if v_h > 1 else 0
         self.canvas_offset = (dx, dy)
-        t = self.themes[self.current_theme]; bg_c = t["inv_bg"] if self.inverted else t["bg"]
-        grid_c = self.adjust_color(bg_c, self.INV_GRID_BRIGHTNESS if self.inverted else self.GRID_BRIGHTNESS)
-        self.canvas.create_rectangle(dx, dy, dx + cw, dy + ch, fill=bg_c, outline="", tags="bg")
+        colors = self.canvas_colors()
+        self.canvas.create_rectangle(dx, dy, dx + cw, dy + ch, fill=colors["bg"], outline="", tags="bg")
         px_off, py_off = dx + self.PADDING * self.SCALE, dy + int(self.PADDING * self.SCALE * self.STRETCH_Y)
-        
+
+        # --- РЕЖИМ КАРТИНКИ: вся рабочая область = один PhotoImage с запечённой сеткой ---
+        self.raster, self.photo, self.raster_body = None, None, None
+        if self.RENDER_MODE == "image":
+            raster = PixelRaster(self.work_w, self.work_h, self.SCALE, self.STRETCH_Y, line_grid=self.show_line_grid)
+            if raster.width * raster.height <= self.IMAGE_MAX_PIXELS:
+                try:
+                    off_x, off_y = self.get_offsets()
+                    body = raster.body(self.fb, off_x, off_y, self.onion)
+                    self.photo = tk.PhotoImage(master=self, data=raster.ppm(self.fb, off_x, off_y, colors, body), format="PPM")
+                    self.raster, self.raster_body = raster, body
+                    self.canvas.create_image(px_off, py_off, image=self.photo, anchor="nw", tags="img")
+                    self.draw_selection()
+                    return
+                except tk.TclError:
+                    self.RENDER_MODE = "items"  # Tk без PPM из памяти — остаёмся на прямоугольниках
+                    self.photo, self.raster_body = None, None
+
+        # --- РЕЖИМ ЭЛЕМЕНТОВ CANVAS (запасной) ---
+        grid_c = colors["grid"]
         if self.SCALE >= 4:
             for i in range(self.work_w + 1):
                 x = px_off + i * self.SCALE
@@ -383,32 +3001,54 @@ class OuroMasterEditor(tk.Tk):
                 self.canvas.create_line(px_off, y, px_off + self.work_w * self.SCALE, y, fill=grid_c, tags="grid")
         
         if self.show_line_grid:
-            l_color = self.adjust_color(grid_c, 1.5 if self.inverted else 0.5)
             for j in range(0, self.work_h + 1, 8):
                 y = py_off + int(j * self.SCALE * self.STRETCH_Y)
-                self.canvas.create_line(px_off, y, px_off + self.work_w * self.SCALE, y, fill=l_color, width=2, tags="line_grid")
+                self.canvas.create_line(px_off, y, px_off + self.work_w * self.SCALE, y, fill=colors["lgrid"], width=2, tags="line_grid")
         
-        for x in range(self.WIDTH):
-            for y in range(self.HEIGHT):
-                if self.pixels[x][y]: self.refresh_px(x, y)
+        for x, y in self.fb.lit(): self.refresh_px(x, y)
+        self.draw_selection()
 
     def refresh_px(self, x, y):
+        off_x, off_y = self.get_offsets()
+        if self.raster is not None:
+            # Патчим только одну клетку картинки
+            if off_x <= x < off_x + self.work_w and off_y <= y < off_y + self.work_h:
+                box = self.raster.cell_box(x - off_x, y - off_y)
+                if box:
+                    colors, lit = self.canvas_colors(), self.fb.get(x, y)
+                    ghost = not lit and self.onion is not None and self.onion.get(x, y)
+                    self.photo.put(colors["px"] if lit else colors["onion"] if ghost else colors["bg"], to=box)
+                    self.raster.patch(self.raster_body, x - off_x, y - off_y, lit, ghost)
+            return
         tag = f"p_{x}_{y}"
         self.canvas.delete(tag)
-        if not self.pixels[x][y]: return
-        t = self.themes[self.current_theme]; px_c = t["bg"] if self.inverted else t["px"]
+        if not self.fb.get(x, y): return
+        px_c = self.canvas_colors()["px"]
         dx, dy = getattr(self, 'canvas_offset', (0,0))
-        off_x, off_y = self.get_offsets()
         if off_x <= x < off_x + self.work_w and off_y <= y < off_y + self.work_h:
             rel_x, rel_y = x - off_x, y - off_y
             px_off, py_off = dx + self.PADDING * self.SCALE, dy + int(self.PADDING * self.SCALE * self.STRETCH_Y)
             x1, y1 = px_off + rel_x * self.SCALE, py_off + int(rel_y * self.SCALE * self.STRETCH_Y)
             x2, y2 = px_off + (rel_x + 1) * self.SCALE, py_off + int((rel_y + 1) * self.SCALE * self.STRETCH_Y)
-            self.canvas.create_rectangle(x1, y1, x2, y2, fill=px_c, outline="", tags=tag)
+            self.canvas.create_rectangle(x1, y1, x2, y2, fill=px_c, outline="", tags=(tag, "px"))
             self.canvas.tag_raise("grid"); self.canvas.tag_raise("line_grid")
 
+    @profiled
+    def refresh_rect(self, x, y, w, h):
+        """Перерисовка прямоугольной области холста"""
+        if self.raster is not None and w * h > 256:
+            # Крупную область дешевле пересобрать одной картинкой
+            off_x, off_y = self.get_offsets()
+            self.raster_body = self.raster.body(self.fb, off_x, off_y, self.onion)
+            self.photo.configure(data=self.raster.ppm(self.fb, off_x, off_y, self.canvas_colors(), self.raster_body), format="PPM")
+            return
+        for tx in range(max(0, x), min(self.WIDTH, x + w)):
+            for ty in range(max(0, y), min(self.HEIGHT, y + h)): self.refresh_px(tx, ty)
+
+    @profiled
     def on_canvas_click(self, event):
         self.focus_set()
+        if self._play_job is not None: self.toggle_play()  # рисуем только в остановленный кадр
         ex, ey = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
         dx, dy = self.canvas_offset
         px_off, py_off = dx + self.PADDING * self.SCALE, dy + int(self.PADDING * self.SCALE * self.STRETCH_Y)
@@ -419,6 +3059,14 @@ class OuroMasterEditor(tk.Tk):
         if self.line_just_finished:
             self.line_label.config(text="LINE: ---"); self.line_just_finished = False
 
+        if self.text_mode:
+            self.place_text(x, y)
+            return
+
+        if self.select_mode:
+            self.select_press(x, y)
+            return
+
         if self.multi_mode and self.pending_chars:
             self.save_history()
             try:
@@ -427,208 +3075,952 @@ class OuroMasterEditor(tk.Tk):
             
             cur_x = x
             for vals, cw, ch in self.pending_chars:
-                # Рисуем конкретный символ
-                for i in range(len(vals)):
-                    byte_val = vals[i]
-                    page_off = (i // cw) * 8
-                    col_x = cur_x + (i % cw)
-                    for b in range(8):
-                        if (byte_val >> b) & 1:
-                            tx, ty = col_x, y + page_off + b
-                            if 0 <= tx < self.WIDTH and 0 <= ty < self.HEIGHT:
-                                self.pixels[tx][ty] = 1
-                                self.refresh_px(tx, ty)
+                # Накладываем символ целыми байтами колонок
+                pages = (len(vals) + cw - 1) // cw
+                self.fb.insert(cur_x, y, cw, pages * 8, vals, op='or')
+                self.invalidate("pixels", (cur_x, y, cw, pages * 8))
                 # Сдвигаем X на ширину символа + пробел
                 cur_x += cw + space
             
-            self.canvas.update_idletasks()
+            self.commit_history()
             return
 
         if event.state & 0x0001: # SHIFT
             if self.line_start: 
                 self.save_history()
                 self.draw_line(self.line_start[0], self.line_start[1], x, y)
+                self.commit_history()
                 self.line_just_finished = True; self.line_start = None 
-            if self.phantom_line: self.canvas.delete(self.phantom_line)
+            if self.phantom_line: self.canvas.delete(self.phantom_line); self.phantom_line = None
         else: 
             self.line_start = (x, y)
             self.line_label.config(text=f"LINE: {x},{y} -> ...")
             self.paint(event, 1)
 
-    def on_release(self, event): pass 
+    def on_release(self, event):
+        """Конец штриха: всё нажатие-протяжка-отпускание = одна запись отмены"""
+        if self.sel_drag:
+            self.select_release(*self.event_cell(event))
+            return
+        if self._stroke_job is not None:
+            self.after_cancel(self._stroke_job); self.flush_stroke()
+        self.stroke_last = None
+        self.commit_history()
+
+    def cell_at(self, ex, ey):
+        """Координаты холста -> клетка рабочей области (rel_x, rel_y)"""
+        dx, dy = self.canvas_offset
+        px_off, py_off = dx + self.PADDING * self.SCALE, dy + int(self.PADDING * self.SCALE * self.STRETCH_Y)
+        return int((ex - px_off) // self.SCALE), int((ey - py_off) // (self.SCALE * self.STRETCH_Y))
 
     def update_pos(self, event):
         ex, ey = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
         dx, dy = self.canvas_offset
         px_off, py_off = dx + self.PADDING * self.SCALE, dy + int(self.PADDING * self.SCALE * self.STRETCH_Y)
-        rel_x, rel_y = int((ex - px_off) // self.SCALE), int((ey - py_off) // (self.SCALE * self.STRETCH_Y))
+        rel_x, rel_y = self.cell_at(ex, ey)
         off_x, off_y = self.get_offsets()
         x, y = rel_x + off_x, rel_y + off_y
+        self.last_cell = (x, y)
+        if self.text_mode: self.preview_text(x, y)
         if 0 <= rel_x < self.work_w and 0 <= rel_y < self.work_h:
             self.pos_label.config(text=f"POS: {x},{y}")
             if (event.state & 0x0001) and self.line_start:
-                if self.phantom_line: self.canvas.delete(self.phantom_line)
                 self.line_label.config(text=f"LINE: {self.line_start[0]},{self.line_start[1]} -> {x},{y}")
-                t = self.themes[self.current_theme]; color = t["bg"] if self.inverted else t["px"]
                 mx, my = self.SCALE // 2, int(self.SCALE * self.STRETCH_Y) // 2
                 lx_s = px_off + (self.line_start[0]-off_x)*self.SCALE + mx
                 ly_s = py_off + int((self.line_start[1]-off_y)*self.SCALE*self.STRETCH_Y) + my
                 lx_e = px_off + rel_x*self.SCALE + mx
                 ly_e = py_off + int(rel_y*self.SCALE*self.STRETCH_Y) + my
-                self.phantom_line = self.canvas.create_line(lx_s, ly_s, lx_e, ly_e, fill=color, dash=(4, 4))
+                if self.phantom_line:
+                    # Линия уже есть — только двигаем концы
+                    self.canvas.coords(self.phantom_line, lx_s, ly_s, lx_e, ly_e)
+                else:
+                    t = self.themes[self.current_theme]; color = t["bg"] if self.inverted else t["px"]
+                    self.phantom_line = self.canvas.create_line(lx_s, ly_s, lx_e, ly_e, fill=color, dash=(4, 4))
 
+    @profiled
     def paint(self, event, mode):
-        ex, ey = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
-        dx, dy = self.canvas_offset
-        px_off, py_off = dx + self.PADDING * self.SCALE, dy + int(self.PADDING * self.SCALE * self.STRETCH_Y)
-        rel_x, rel_y = int((ex - px_off) // self.SCALE), int((ey - py_off) // (self.SCALE * self.STRETCH_Y))
+        """Нажатие: ставим/стираем пиксель и запоминаем начало штриха"""
+        self.stroke_queue.clear()
+        rel_x, rel_y = self.cell_at(self.canvas.canvasx(event.x), self.canvas.canvasy(event.y))
+        off_x, off_y = self.get_offsets(); x, y = rel_x + off_x, rel_y + off_y
+        self.stroke_last = (x, y)
         if 0 <= rel_x < self.work_w and 0 <= rel_y < self.work_h:
-            off_x, off_y = self.get_offsets(); x, y = rel_x + off_x, rel_y + off_y
             if 0 <= x < self.WIDTH and 0 <= y < self.HEIGHT:
-                if self.pixels[x][y] != mode: 
-                    self.save_history() # СОХРАНЯЕМ ПЕРЕД КАЖДЫМ НОВЫМ ПИКСЕЛЕМ (ИЛИ МАЛКОМ)
-                    self.pixels[x][y] = mode; self.refresh_px(x, y)
+                if self.fb.get(x, y) != mode: 
+                    self.begin_edit() # ОТКРЫВАЕМ ЗАПИСЬ НА ВЕСЬ ШТРИХ (ЗАКРОЕТ on_release)
+                    self.fb.set(x, y, mode); self.refresh_px(x, y); self.show_bbox()
 
-    def draw_line(self, x0, y0, x1, y1):
+    def queue_stroke(self, event, mode):
+        """Протяжка: события мыши только копятся, рисуем не чаще одного раза за кадр"""
+        if self.sel_drag:
+            self.select_drag(*self.event_cell(event))
+            return
+        self.stroke_queue.append((self.canvas.canvasx(event.x), self.canvas.canvasy(event.y), mode))
+        if self._stroke_job is None: self._stroke_job = self.after(self.FRAME_MS, self.flush_stroke)
+
+    @profiled
+    def flush_stroke(self):
+        """Соединяем накопленные точки линиями Брезенхэма — на быстрой протяжке не остаётся дыр"""
+        self._stroke_job = None
+        if not self.stroke_queue: return
+        off_x, off_y = self.get_offsets()
+        changed = []
+        for ex, ey, mode in self.stroke_queue:
+            rel_x, rel_y = self.cell_at(ex, ey)
+            cur = (rel_x + off_x, rel_y + off_y)
+            start = self.stroke_last or cur
+            changed += self.draw_line(start[0], start[1], cur[0], cur[1], mode, refresh=False)
+            self.stroke_last = cur
+        self.stroke_queue.clear()
+        for x, y in changed: self.refresh_px(x, y)
+        if changed: self.show_bbox()
+
+    def draw_line(self, x0, y0, x1, y1, mode=1, refresh=True):
+        """Линия Брезенхэма внутри рабочей области; возвращает список изменённых пикселей"""
         line_dx, line_dy = abs(x1-x0), abs(y1-y0); sx = 1 if x0 < x1 else -1; sy = 1 if y0 < y1 else -1
         err = line_dx - line_dy; off_x, off_y = self.get_offsets()
+        changed = []
         while True:
             if off_x <= x0 < off_x + self.work_w and off_y <= y0 < off_y + self.work_h:
-                if 0 <= x0 < self.WIDTH and 0 <= y0 < self.HEIGHT: self.pixels[x0][y0] = 1; self.refresh_px(x0, y0)
+                if 0 <= x0 < self.WIDTH and 0 <= y0 < self.HEIGHT and self.fb.get(x0, y0) != mode:
+                    self.begin_edit()
+                    self.fb.set(x0, y0, mode); changed.append((x0, y0))
+                    if refresh: self.refresh_px(x0, y0)
             if x0 == x1 and y0 == y1: break
             e2 = 2 * err
             if e2 > -line_dy: err -= line_dy; x0 += sx
             if e2 < line_dx: err += line_dx; y0 += sy
+        return changed
 
     def clear_all(self):
         self.save_history() # СОХРАНЯЕМ ПЕРЕД ОЧИСТКОЙ
-        self.pixels = [[0 for _ in range(self.HEIGHT)] for _ in range(self.WIDTH)]
-        self.input_text.delete("1.0", tk.END); self.line_label.config(text="LINE: ---"); self.redraw_full()
+        self.fb.clear(); self.commit_history()
+        self.input_text.delete("1.0", tk.END); self.line_label.config(text="LINE: ---"); self.invalidate("pixels")
 
     def copy_to_clip(self):
         self.clipboard_clear(); self.clipboard_append(self.output_text.get("1.0", tk.END).strip())
         self.btn_copy.config(text="COPY OK!"); self.after(1000, lambda: self.btn_copy.config(text="COPY CODE"))
 
     def toggle_invert(self):
-        self.inverted = not self.inverted; self.redraw_full()
+        self.inverted = not self.inverted; self.invalidate("palette")
+
+    def submit(self, channel, fn, *args):
+        """Задача в фоновый поток; результат заберёт poll_worker (устаревшие отбрасываются)"""
+        self.worker.submit(channel, fn, *args)
+        if self._poll_job is None: self._poll_job = self.after(self.POLL_MS, self.poll_worker)
+
+    def poll_worker(self):
+        self._poll_job = None
+        for channel, result, err in self.worker.poll():
+            if channel.startswith("export:"): self.export_done(channel[7:], result, err)
+            elif err is not None: self.show_output(f"/* {channel}: {err} */")
+            elif channel == "parse": self.apply_parse(*result)
+            elif channel == "image": self.load_glyph(*result)
+            elif channel == "frames": self.set_frames(result[2])
+            elif result is not None: self.show_output(result)
+        if self.worker.busy: self._poll_job = self.after(self.POLL_MS, self.poll_worker)
+
+    def show_output(self, text):
+        self.output_text.delete("1.0", tk.END)
+        self.output_text.insert("1.0", text)
+
+    def format_override(self):
+        """Формат из поля FMT или None (AUTO / не разобрался)"""
+        return parse_format(self.fmt_entry.get())
 
     def parse_and_draw(self, event=None):
-        raw = self.input_text.get("1.0", tk.END)
-        
-        # 1. Вытаскиваем имя переменной (информативно)
-        var_match = re.search(r'/\s*([a-zA-Z0-9_]+)\s*/', raw) or \
-                    re.search(r'gStatusLine\[\s*([a-zA-Z0-9_]+)', raw) or \
-                    re.search(r'([a-zA-Z0-9_]+)\s*\[', raw)
-        if var_match: 
+        """Разбор ввода уходит в фоновый поток; на холст попадает только последний результат"""
+        self.submit("parse", parse_input, self.input_text.get("1.0", tk.END), self.multi_mode, self.format_override())
+
+    @profiled
+    def apply_parse(self, var_name, kind, data):
+        # 1. Имя переменной (информативно)
+        if var_name: 
             self.var_entry.delete(0, tk.END)
-            self.var_entry.insert(0, var_match.group(1))
+            self.var_entry.insert(0, var_name)
+        # 2. MULTI: только собираем символы, холст НЕ ТРОГАЕМ; иначе — глиф на холст
+        if kind == 'pending': self.pending_chars = [(list(v), w, h) for v, w, h in data]
+        elif data: self.load_glyph(*data)
 
-        # 2. Ищем блоки данных
-        char_blocks = re.findall(r'\{([^{}]+)\}', raw)
+    @profiled
+    def load_glyph(self, vals, cw, ch):
+        """Открывает глиф на холсте: рабочая область = размер глифа, глиф по центру"""
+        self.save_history()
+        self.layer_view = False  # на холсте больше не сведённый экран слоёв
+        self.work_w, self.work_h = cw, ch
+        self.w_entry.delete(0, tk.END); self.w_entry.insert(0, str(cw))
+        self.h_entry.delete(0, tk.END); self.h_entry.insert(0, str(ch))
         
-        if self.multi_mode:
-            # --- РЕЖИМ MULTI: Только собираем данные, холст НЕ ТРОГАЕМ ---
-            chars_found = []
-            blocks_to_process = char_blocks if char_blocks else [raw]
-            
-            for block in blocks_to_process:
-                # ВОТ ЗДЕСЬ ИСПРАВЛЕНИЕ: Удаляем комментарии внутри блока перед поиском HEX
-                clean_block = re.sub(r'/\*.*?\*/', '', block)
-                
-                found_hex = re.findall(r'0x[0-9A-Fa-f]{2}', clean_block)
-                found_bin = re.findall(r'0b[01]{8}', clean_block)
-                vals = [int(h, 16) for h in found_hex] if found_hex else [int(b, 2) for b in found_bin]
-                
-                if vals:
-                    # Авто-определение размеров для каждого символа в очереди
-                    cw = len(vals) if len(vals) <= 12 else len(vals) // 2
-                    ch = 8 if len(vals) <= 12 else 16
-                    chars_found.append((vals, cw, ch))
-            
-            self.pending_chars = chars_found
+        # Очищаем и центрируем
+        self.fb.clear()
+        sx, sy = self.get_offsets()
+        pages = (len(vals) + cw - 1) // cw
+        self.fb.insert(sx, sy, cw, pages * 8, vals)
+        self.commit_history()
+        self.invalidate("geometry")
+
+    def open_atlas(self):
+        if self.atlas is not None and self.atlas.winfo_exists():
+            self.atlas.reload(); self.atlas.lift()
         else:
-            # --- ОБЫЧНЫЙ РЕЖИМ: Старое доброе поведение ---
-            clean_raw = re.sub(r'/\*.*?\*/', '', raw)
-            hxs = re.findall(r'0x[0-9A-Fa-f]{2}', clean_raw)
-            bins = re.findall(r'0b[01]{8}', clean_raw)
-            all_vals = [int(h, 16) for h in hxs] if hxs else [int(b, 2) for b in bins]
-            
-            if all_vals:
-                total = len(all_vals)
-                if total == 14: cw, ch = 7, 16
-                elif total == 20: cw, ch = 10, 16
-                else: cw, ch = (total, 8) if total <= 12 else (total // 2, 16)
-                
-                self.save_history()
-                self.work_w, self.work_h = cw, ch
-                self.w_entry.delete(0, tk.END); self.w_entry.insert(0, str(cw))
-                self.h_entry.delete(0, tk.END); self.h_entry.insert(0, str(ch))
-                
-                # Очищаем и центрируем
-                self.pixels = [[0 for _ in range(self.HEIGHT)] for _ in range(self.WIDTH)]
-                sx, sy = self.get_offsets()
-                for i in range(len(all_vals)):
-                    page_off = (i // cw) * 8 if ch > 8 else 0
-                    col_x = i % cw
-                    for b in range(8):
-                        if (all_vals[i] >> b) & 1: 
-                            tx, ty = sx + col_x, sy + page_off + b
-                            if tx < self.WIDTH and ty < self.HEIGHT: self.pixels[tx][ty] = 1
-                self.redraw_full()
+            self.atlas = FontAtlas(self)
 
-    def crop_and_generate(self, mode):
-        raw_template = self.input_text.get("1.0", tk.END).strip()
-        clean_tmp = re.sub(r'/\*.*?\*/', '', raw_template)
-        hxs_in, bins_in = re.findall(r'0x[0-9A-Fa-f]{2}', clean_tmp), re.findall(r'0b[01]{8}', clean_tmp)
-        
-        if hxs_in or bins_in:
-            found_vals = hxs_in if hxs_in else bins_in
-            l = len(found_vals)
-            if l == 14: cw, ch = 7, 16
-            elif l == 20: cw, ch = 10, 16
-            elif l == 6: cw, ch = 6, 8
-            else: cw, ch = (l, 8) if l < 10 else (l//2, 16)
-            sx, sy = self.get_offsets(); data = []; pages = 1 if ch <= 8 else 2
-            for p in range(pages):
-                for x_rel in range(cw):
-                    byte, tx, ty_base = 0, sx + x_rel, sy + (p * 8)
-                    for b in range(8):
-                        ty = ty_base + b
-                        if 0 <= tx < self.WIDTH and 0 <= ty < self.HEIGHT and self.pixels[tx][ty]: byte |= (1 << b)
-                    data.append(byte)
+    def open_layers(self):
+        if self.layer_panel is not None and self.layer_panel.winfo_exists():
+            self.layer_panel.refresh(); self.layer_panel.lift()
         else:
-            min_x, max_x, min_y, max_y, found_px = self.WIDTH, -1, self.HEIGHT, -1, False
-            for x in range(self.WIDTH):
-                for y in range(self.HEIGHT):
-                    if self.pixels[x][y]: min_x, max_x, min_y, max_y, found_px = min(min_x, x), max(max_x, x), min(min_y, y), max(max_y, y), True
-            if not found_px: return
-            cw, ch_raw = max_x - min_x + 1, max_y - min_y + 1
-            pages, data = (1 if ch_raw <= 8 else 2), []
-            for p in range(pages):
-                for x in range(min_x, max_x + 1):
-                    byte = 0
-                    for b in range(8):
-                        cy = min_y + (p * 8) + b
-                        if cy < self.HEIGHT and self.pixels[x][cy]: byte |= (1 << b)
-                    data.append(byte)
+            self.layer_panel = LayerPanel(self)
 
-        self.output_text.delete("1.0", tk.END)
-        v_name = self.var_entry.get().strip() or "indicator_x"
-        if mode == "STATUS":
-            res = [f"gStatusLine[{v_name} + {i}] |= 0x{b:02X};" for i, b in enumerate(data)]
-            self.output_text.insert("1.0", "\n".join(res))
+    def open_project(self):
+        if self.project_panel is not None and self.project_panel.winfo_exists():
+            self.project_panel.refresh(); self.project_panel.lift()
         else:
-            fmt = "0x{:02X}" if mode == "HEX" else "0b{:08b}"
-            pattern = r'0x[0-9A-Fa-f]{2}' if mode == "HEX" else r'0b[01]{8}'
-            matches = list(re.finditer(pattern, raw_template))
-            if matches and "gStatusLine" not in raw_template:
-                t_list = list(raw_template)
-                for i in range(min(len(matches), len(data)) - 1, -1, -1):
-                    m = matches[i]; t_list[m.start():m.end()] = list(fmt.format(data[i]))
-                self.output_text.insert("1.0", "".join(t_list))
-            else:
-                if mode == "HEX": self.output_text.insert("1.0", "{" + ", ".join([fmt.format(b) for b in data]) + "}")
-                else: self.output_text.insert("1.0", ", ".join([fmt.format(b) for b in data]))
+            self.project_panel = ProjectPanel(self)
+
+    def session_state(self):
+        """Настройки редактора, которые проект запоминает вместе с активами"""
+        return {"theme": self.current_theme, "inverted": self.inverted, "scale": self.SCALE, "ratio": self.STRETCH_Y,
+                "fmt": self.fmt_entry.get().strip()}
+
+    def restore_session(self, session):
+        if session.get("theme") in self.themes: self.set_theme(session["theme"])
+        if "inverted" in session and session["inverted"] != self.inverted: self.toggle_invert()
+        for entry, key in ((self.scale_entry, "scale"), (self.ratio_entry, "ratio"), (self.fmt_entry, "fmt")):
+            if key in session:
+                entry.delete(0, tk.END); entry.insert(0, str(session[key]))
+        self.apply_settings()
+
+    # --- АНИМАЦИЯ ---
+    def store_frame(self):
+        self.frames[self.frame_index] = (self.fb.to_bytes(), self.journal)
+
+    def current_frames(self):
+        """Байты всех кадров; правки холста попадают в текущий кадр (во время PLAY буфер и так один из кадров)"""
+        if self._play_job is None: self.store_frame()
+        return [f[0] for f in self.frames]
+
+    def load_frame(self, n):
+        """Кадр n -> холст: подменяются байты буфера и журнал отмены, калька — предыдущий кадр"""
+        self.frame_index = n % len(self.frames)
+        data, self.journal = self.frames[self.frame_index]
+        self.fb.load(data)
+        prev = self.frames[self.frame_index - 1][0] if len(self.frames) > 1 else None
+        self.onion = FrameBuffer(self.WIDTH, self.HEIGHT, prev) if self.onion_skin and prev else None
+        self.frame_label.config(text=f"{self.frame_index + 1}/{len(self.frames)}")
+        self.invalidate("geometry")
+
+    def show_frame(self, n):
+        if self._play_job is not None: return
+        self.store_frame(); self.load_frame(n)
+
+    def add_frame(self):
+        """Копия текущего кадра сразу за ним"""
+        if self._play_job is not None: return
+        self.store_frame()
+        self.frames.insert(self.frame_index + 1, (self.fb.to_bytes(), UndoJournal(self.UNDO_BUDGET_KB * 1024)))
+        self.load_frame(self.frame_index + 1)
+
+    def delete_frame(self):
+        if self._play_job is not None or len(self.frames) < 2: return
+        self.frames.pop(self.frame_index)
+        self.load_frame(min(self.frame_index, len(self.frames) - 1))
+
+    def toggle_onion(self):
+        self.onion_skin = not self.onion_skin
+        self.btn_onion.config(bg=self.themes[self.current_theme]['bg'] if self.onion_skin else self.C_BTN_DARK,
+                              fg="black" if self.onion_skin else self.C_BTN_TEXT)
+        if self._play_job is None: self.show_frame(self.frame_index)
+
+    def load_frames(self):
+        """Кадры из ввода: блоки {...} или поток packed:anim (разбор — в фоновом потоке)"""
+        self.submit("frames", parse_input, self.input_text.get("1.0", tk.END), True, self.format_override())
+
+    def set_frames(self, glyphs):
+        """Новая последовательность: рабочая область по самому крупному кадру, кадры по центру"""
+        if not glyphs: return
+        if self._play_job is not None: self.toggle_play()
+        self.work_w, self.work_h = max(g[1] for g in glyphs), max(g[2] for g in glyphs)
+        self.w_entry.delete(0, tk.END); self.w_entry.insert(0, str(self.work_w))
+        self.h_entry.delete(0, tk.END); self.h_entry.insert(0, str(self.work_h))
+        sx, sy = self.get_offsets()
+        self.frames = []
+        for vals, w, h in glyphs:
+            fb = FrameBuffer(self.WIDTH, self.HEIGHT)
+            fb.insert(sx, sy, w, ((len(vals) + w - 1) // w) * 8, vals)
+            self.frames.append((fb.to_bytes(), UndoJournal(self.UNDO_BUDGET_KB * 1024)))
+        self.load_frame(0)
+
+    def toggle_play(self):
+        if self._play_job is not None:
+            self.after_cancel(self._play_job); self._play_job = None
+            self._play_cache.clear()
+            self.btn_play.config(text="PLAY")
+            self.load_frame(self.frame_index)  # журнал и калька этого кадра, растр собирается заново
+            return
+        if len(self.frames) < 2: return
+        self.store_frame()
+        self.onion = None
+        self.btn_play.config(text="STOP")
+        self.play_tick()
+
+    @profiled
+    def play_tick(self):
+        """Следующий кадр: байты буфера подменяются целиком, картинка берётся из кэша готовых PPM"""
+        try: fps = max(1, min(60, int(self.fps_entry.get())))
+        except ValueError: fps = 8
+        self._play_job = self.after(1000 // fps, self.play_tick)
+        self.frame_index = (self.frame_index + 1) % len(self.frames)
+        data = self.frames[self.frame_index][0]
+        self.fb.load(data)
+        self.frame_label.config(text=f"{self.frame_index + 1}/{len(self.frames)}")
+        if self.raster is None:
+            self.invalidate("geometry"); return
+        colors = self.canvas_colors()
+        key = (data, self.raster, colors["table"])
+        ppm = self._play_cache.get(key)
+        if ppm is None:
+            if len(self._play_cache) >= 2 * len(self.frames): self._play_cache.clear()  # сменились масштаб или тема
+            off_x, off_y = self.get_offsets()
+            ppm = self._play_cache[key] = self.raster.ppm(self.fb, off_x, off_y, colors)
+        self.photo.configure(data=ppm, format="PPM")
+
+    def generate_anim(self):
+        v_name = self.var_entry.get().strip() or "anim"
+        self.submit("generate", anim_code, self.current_frames(), self.get_offsets(), self.work_w, self.work_h,
+                    v_name, self.WIDTH, self.HEIGHT)
+
+    # --- ЭКСПОРТ PNG ---
+    def export_canvas(self):
+        """Рабочая область в PNG: цвета темы, SCALE, RATIO и сетка — как на холсте"""
+        path = filedialog.asksaveasfilename(parent=self, defaultextension=".png", filetypes=[("PNG", "*.png")],
+                                            initialfile=(self.var_entry.get().strip() or "screen") + ".png")
+        if not path: return
+        # Свой канал на каждый файл: запись PNG не отменяется ни следующим HEX/DICT/..., ни другим экспортом
+        self.submit(f"export:{path}", save_png, path, self.fb.copy(), self.get_offsets(), self.work_w, self.work_h,
+                    self.canvas_colors(), self.SCALE, self.STRETCH_Y, self.SCALE >= 4, self.show_line_grid)
+
+    def export_sheet(self):
+        """Все глифы таблицы из ввода — одним листом с номерами"""
+        path = filedialog.asksaveasfilename(parent=self, defaultextension=".png", filetypes=[("PNG", "*.png")],
+                                            initialfile=(self.var_entry.get().strip() or "font") + "_sheet.png")
+        if not path: return
+        self.submit(f"export:{path}", save_sheet, path, self.input_text.get("1.0", tk.END), self.canvas_colors(),
+                    max(1, self.SCALE // 2), self.STRETCH_Y, self.format_override())
+
+    def export_done(self, path, result, err):
+        """Итог записи файла в строке под кнопками; ошибка — ещё и в поле вывода"""
+        if err is not None:
+            self.show_output(f"/* {path}: {err} */")
+            text = f"NOT SAVED: {os.path.basename(path)}"
+        else: text = "SAVED: " + result.strip("/* ")
+        self.src_label.config(text=text)
+        self.after(3000, lambda: self.src_label.cget("text") == text and self.src_label.config(
+            text=f"WATCH: {os.path.basename(self.link.path)}" if self.link else "NO FILE"))
+
+    # --- ФАЙЛ ИСХОДНИКА ---
+    def open_source(self):
+        path = filedialog.askopenfilename(parent=self, filetypes=[("C sources", "*.c *.h"), ("All files", "*.*")])
+        if not path: return
+        try: self.link = SourceLink(path)
+        except OSError as e:
+            self.show_output(f"/* {e} */"); return
+        self.show_source()
+        self.open_atlas()
+        self.src_label.config(text=f"WATCH: {os.path.basename(path)}")
+        if self._watch_job is None: self._watch_job = self.after(self.WATCH_MS, self.watch_source)
+
+    def show_source(self):
+        """Текст файла -> поле ввода; прокрутка и курсор остаются на месте"""
+        view, cursor = self.input_text.yview()[0], self.input_text.index(tk.INSERT)
+        self.input_text.delete("1.0", tk.END)
+        self.input_text.insert("1.0", self.link.text.replace("\r\n", "\n"))
+        self.input_text.yview_moveto(view); self.input_text.mark_set(tk.INSERT, cursor)
+        self.shown_source = self.input_text.get("1.0", "end-1c")
+        name = guess_var_name(self.link.text)
+        if name: self.var_entry.delete(0, tk.END); self.var_entry.insert(0, name)
+
+    def watch_source(self):
+        """Опрос mtime/размера; при внешней правке заново разбираются только изменившиеся блоки"""
+        self._watch_job = None
+        if self.link is None: return
+        if self.link.changed():
+            try: changed = self.link.reload()
+            except OSError: changed = None
+            if changed: self.sync_source(set(changed))
+        self._watch_job = self.after(self.WATCH_MS, self.watch_source)
+
+    def source_edited(self, atlas):
+        """Есть несохранённое: поле ввода правили после загрузки файла или глиф на холсте отличается от своего блока"""
+        if self.input_text.get("1.0", "end-1c") != self.shown_source: return True
+        if atlas is None or atlas.current is None or atlas.current >= len(atlas.glyphs): return False
+        _, vals, w, h = atlas.glyphs[atlas.current]
+        sx, sy = self.get_offsets()
+        return glyph_format(w, h).decode(self.fb.extract(sx, sy, w, ((h + 7) // 8) * 8)) != bytes(vals)
+
+    def sync_source(self, changed):
+        atlas = self.atlas if self.atlas is not None and self.atlas.winfo_exists() else None
+        name = os.path.basename(self.link.path)
+        if self.source_edited(atlas) and not messagebox.askyesno(
+                "OURO", f"{name} changed on disk.\nDiscard unsaved edits and reload it?", parent=self):
+            # Правки остаются; SAVE SRC впишет глиф уже в новую версию файла
+            self.src_label.config(text=f"CHANGED ON DISK: {name}")
+            return
+        self.src_label.config(text=f"WATCH: {name}")
+        self.show_source()
+        if atlas is None: return
+        current = atlas.current
+        atlas.reload()  # неизменённые блоки — из кэша токенизатора
+        if current is not None and current < len(atlas.glyphs):
+            atlas.loaded_chunk = atlas.block_text(current)
+            if atlas.glyphs[current][0] in changed:
+                _, vals, w, h = atlas.glyphs[current]
+                self.load_glyph(list(vals), w, h)
+                atlas.redraw_cell(current)
+
+    def save_source(self, event=None):
+        """Глиф с холста -> литералы его блока в файле (склейка участков + атомарная подмена файла)"""
+        atlas = self.atlas if self.atlas is not None and self.atlas.winfo_exists() else None
+        if self.link is None or atlas is None or atlas.current is None: return
+        name = os.path.basename(self.link.path)
+        if self.link.changed():
+            # Файл правили снаружи, а опрос ещё не дошёл: сначала та же синхронизация, что и у опроса
+            try: changed = self.link.reload()
+            except OSError as e:
+                self.show_output(f"/* {e} */"); return
+            if changed: self.sync_source(set(changed))
+        if atlas.current is None or atlas.current >= len(atlas.glyphs): return
+        block_no, _, w, h = atlas.glyphs[atlas.current]
+        sx, sy = self.get_offsets()
+        data = self.fb.extract(sx, sy, w, ((h + 7) // 8) * 8)
+        try: written = self.link.write_glyph(block_no, data, self.format_override(), atlas.loaded_chunk)
+        except (OSError, IndexError, ValueError) as e:
+            self.show_output(f"/* {e} */")
+            self.src_label.config(text=f"NOT SAVED: {name}"); return
+        input_clean = self.input_text.get("1.0", "end-1c") == self.shown_source
+        atlas.save_glyph()
+        atlas.loaded_chunk = self.link.chunks[block_no]  # следующее сохранение сверяется уже с записанным блоком
+        if input_clean: self.shown_source = self.input_text.get("1.0", "end-1c")  # в файле то же, что в поле
+        self.src_label.config(text=f"SAVED: {name}" if written else f"WATCH: {name}")
+        self.after(1000, lambda: self.link and self.src_label.config(text=f"WATCH: {os.path.basename(self.link.path)}"))
+
+    def canvas_xy(self, x, y):
+        """Точка буфера -> координаты холста (левый верхний угол клетки)"""
+        off_x, off_y = self.get_offsets()
+        dx, dy = self.canvas_offset
+        px_off, py_off = dx + self.PADDING * self.SCALE, dy + int(self.PADDING * self.SCALE * self.STRETCH_Y)
+        return px_off + (x - off_x) * self.SCALE, py_off + int((y - off_y) * self.SCALE * self.STRETCH_Y)
+
+    def event_cell(self, event):
+        rel_x, rel_y = self.cell_at(self.canvas.canvasx(event.x), self.canvas.canvasy(event.y))
+        off_x, off_y = self.get_offsets()
+        return rel_x + off_x, rel_y + off_y
+
+    def keys_for_canvas(self):
+        """Стрелки и Ctrl+C/V относятся к холсту, только если фокус не в поле ввода"""
+        return not isinstance(self.focus_get(), (tk.Entry, tk.Text))
+
+    def toggle_select(self):
+        self.select_mode = not self.select_mode
+        if self.select_mode:
+            self.btn_select.config(bg=self.C_ACCENT, fg="black")
+        else:
+            self.btn_select.config(bg=self.C_BTN_DARK, fg=self.C_BTN_TEXT)
+            self.set_selection(None)
+
+    def set_selection(self, rect):
+        """Выделение (x, y, w, h), обрезанное по буферу; None — снять"""
+        if rect is not None:
+            x, y, w, h = rect
+            x0, y0 = max(0, x), max(0, y)
+            x1, y1 = min(self.WIDTH, x + w), min(self.HEIGHT, y + h)
+            rect = (x0, y0, x1 - x0, y1 - y0) if x1 > x0 and y1 > y0 else None
+        self.selection = rect
+        self.draw_selection()
+
+    def draw_selection(self, dx=0, dy=0):
+        """Пунктирная рамка выделения (при перетаскивании — со смещением dx, dy)"""
+        if self.selection is None:
+            if self.sel_item: self.canvas.delete(self.sel_item); self.sel_item = None
+            return
+        x, y, w, h = self.selection
+        box = self.canvas_xy(x + dx, y + dy) + self.canvas_xy(x + dx + w, y + dy + h)
+        if self.sel_item: self.canvas.coords(self.sel_item, *box)
+        else: self.sel_item = self.canvas.create_rectangle(*box, outline=self.C_ACCENT, dash=(4, 4), width=2)
+        self.canvas.tag_raise(self.sel_item)
+
+    def select_press(self, x, y):
+        s = self.selection
+        if s and s[0] <= x < s[0] + s[2] and s[1] <= y < s[1] + s[3]: self.sel_drag = ("move", x, y)
+        else:
+            self.sel_drag = ("new", x, y)
+            self.set_selection((x, y, 1, 1))
+
+    def select_drag(self, x, y):
+        kind, x0, y0 = self.sel_drag
+        if kind == "new": self.set_selection((min(x0, x), min(y0, y), abs(x - x0) + 1, abs(y - y0) + 1))
+        else: self.draw_selection(x - x0, y - y0)
+
+    def select_release(self, x, y):
+        kind, x0, y0 = self.sel_drag
+        self.sel_drag = None
+        if kind == "move" and (x, y) != (x0, y0): self.move_selection(x - x0, y - y0)
+
+    @profiled
+    def move_selection(self, dx, dy):
+        """Перенос содержимого выделения: вырезка байтами страниц, очистка, вставка на новое место"""
+        x, y, w, h = self.selection
+        data = self.fb.extract(x, y, w, h)
+        self.save_history()
+        self.fb.insert(x, y, w, h, bytes(len(data)))
+        self.fb.insert(x + dx, y + dy, w, h, data)
+        self.commit_history()
+        self.invalidate("pixels", (min(x, x + dx), min(y, y + dy), w + abs(dx), h + abs(dy)))
+        self.set_selection((x + dx, y + dy, w, h))
+
+    @profiled
+    def edit_selection(self, op, *args):
+        """op(байты, w, h, *args) -> байты или (байты, новая w, новая h); одна запись отмены"""
+        if self.selection is None: return
+        x, y, w, h = self.selection
+        res = op(self.fb.extract(x, y, w, h), w, h, *args)
+        data, nw, nh = res if isinstance(res, tuple) else (res, w, h)
+        self.save_history()
+        if (nw, nh) != (w, h): self.fb.insert(x, y, w, h, bytes(w * ((h + 7) // 8)))
+        self.fb.insert(x, y, nw, nh, data)
+        self.commit_history()
+        self.invalidate("pixels", (x, y, max(w, nw), max(h, nh)))
+        self.set_selection((x, y, nw, nh))
+
+    def nudge_selection(self, dx, dy, cyclic):
+        if self.selection is None or not self.keys_for_canvas(): return
+        if not cyclic: self.move_selection(dx, dy)
+        elif dx: self.edit_selection(shift_h, dx, True)
+        else: self.edit_selection(shift_v, dy, True)
+
+    def copy_selection(self, event=None):
+        if self.selection is None or not self.keys_for_canvas(): return
+        x, y, w, h = self.selection
+        self.sel_clip = (self.fb.extract(x, y, w, h), w, h)
+
+    def paste_selection(self, event=None):
+        """Вставка скопированного блока в клетку под курсором; вставленное становится выделением"""
+        if self.sel_clip is None or not self.keys_for_canvas(): return
+        data, w, h = self.sel_clip
+        x, y = self.last_cell
+        self.save_history()
+        self.fb.insert(x, y, w, h, data)
+        self.commit_history()
+        self.invalidate("pixels", (x, y, w, h))
+        self.set_selection((x, y, w, h))
+
+    def toggle_text(self):
+        self.text_mode = not self.text_mode
+        if self.text_mode:
+            self.btn_text.config(bg=self.C_ACCENT, fg="black")
+        else:
+            self.btn_text.config(bg=self.C_BTN_DARK, fg=self.C_BTN_TEXT)
+            if self.text_preview: self.canvas.delete(self.text_preview); self.text_preview = None
+
+    def cycle_align(self):
+        self.btn_align.config(text=TEXT_ALIGNS[(TEXT_ALIGNS.index(self.btn_align.cget("text")) + 1) % len(TEXT_ALIGNS)])
+
+    def current_font(self):
+        """Шрифт из таблицы во вводе; пока текст ввода не менялся — разобранный ранее"""
+        key = (self.input_text.get("1.0", tk.END), self.format_override())
+        if self.text_font[0] != key: self.text_font = (key, BitmapFont.from_text(key[0], override=key[1]))
+        return self.text_font[1]
+
+    def text_block(self, x, y):
+        """Строка из поля TEXT: (байты, w, h, левый край) с учётом выравнивания относительно точки x"""
+        font = self.current_font()
+        if font is None: return None
+        try: space = int(self.spacing_entry.get())
+        except ValueError: space = 1
+        align = self.btn_align.cget("text")
+        data, w, h = font.render(self.text_entry.get().replace("\\n", "\n"), space, align)
+        x0 = x if align == "LEFT" else x - w // 2 if align == "CENTER" else x - w + 1
+        return data, w, h, x0
+
+    def preview_text(self, x, y):
+        """Рамка будущего текста под курсором (двигается, а не пересоздаётся)"""
+        block = self.text_block(x, y)
+        if block is None: return
+        _, w, h, x0 = block
+        box = self.canvas_xy(x0, y) + self.canvas_xy(x0 + w, y + h)
+        if self.text_preview: self.canvas.coords(self.text_preview, *box)
+        else: self.text_preview = self.canvas.create_rectangle(*box, outline=self.canvas_colors()["px"], dash=(4, 4))
+        self.line_label.config(text=f"TEXT: {w}x{h}")
+
+    @profiled
+    def place_text(self, x, y):
+        """Вся строка накладывается за раз: блок обрезается по рабочей области и OR-ится целыми байтами"""
+        block = self.text_block(x, y)
+        if block is None: return
+        data, w, h, x0 = block
+        off_x, off_y = self.get_offsets()
+        clip = FrameBuffer(self.work_w, self.work_h)
+        clip.insert(x0 - off_x, y - off_y, w, h, data)
+        self.save_history()
+        self.fb.insert(off_x, off_y, self.work_w, self.work_h, clip.to_bytes(), op='or')
+        self.commit_history()
+        self.invalidate("pixels", (x0, y, w, h))
+
+    def cycle_dither(self):
+        mode = DITHER_MODES[(DITHER_MODES.index(self.btn_dither.cget("text")) + 1) % len(DITHER_MODES)]
+        self.btn_dither.config(text=mode)
+
+    def import_image(self):
+        path = filedialog.askopenfilename(parent=self, filetypes=[("Images", "*.png *.bmp *.pgm"), ("All files", "*.*")])
+        if not path: return
+        try: threshold = max(0, min(256, int(self.thr_entry.get())))
+        except ValueError: threshold = 128
+        self.submit("image", image_to_glyph, path, (self.work_w, self.work_h), self.STRETCH_Y,
+                    self.btn_dither.cget("text"), threshold)
+
+    def generate_patch(self):
+        """Минимальный набор участков страниц между двумя полными кадрами 128x64"""
+        try: gap = max(0, int(self.gap_entry.get()))
+        except ValueError: gap = PATCH_OVERHEAD
+        v_name = (self.var_entry.get().strip() or "screen") + "_patch"
+        self.submit("generate", patch_code, self.input_text.get("1.0", tk.END), self.fb.to_bytes(), gap, v_name, self.WIDTH, self.HEIGHT)
+
+    @profiled
+    def crop_and_generate(self, mode):
+        v_name = self.var_entry.get().strip() or "indicator_x"
+        self.submit("generate", crop_code, self.input_text.get("1.0", tk.END).strip(), self.fb.copy(), self.get_offsets(), mode, v_name,
+                    self.format_override())
+
+    def generate_dedup(self):
+        try: near = max(0, int(self.near_entry.get()))
+        except ValueError: near = 0
+        self.submit("generate", dedup_source, self.input_text.get("1.0", tk.END), near)
+
+    def generate_dict(self):
+        v_name = self.var_entry.get().strip() or "font"
+        self.submit("generate", dict_code, self.input_text.get("1.0", tk.END), self.fb.copy(), v_name, self.format_override())
+
+# --- ПАКЕТНЫЙ РЕЖИМ (CLI) ---
+SOURCE_EXTS = ('.c', '.h')
+
+def convert_file(job):
+    """Конвертирует один файл (выполняется в пуле процессов). Возвращает (сводка, [ошибки])"""
+    path, root, out_dir, to, img, fmt_spec = job
+    override = parse_format(fmt_spec) if fmt_spec else None
+    rel = os.path.relpath(path, root)
+    stem = os.path.splitext(rel)[0]
+    errors, written = [], 0
+    try:
+        if path.lower().endswith(IMAGE_EXTS):
+            data, w, h = image_to_glyph(path, *img)
+            name = os.path.basename(stem)
+            dst = os.path.join(out_dir, stem + '.txt')
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            pages = (h + 7) // 8
+            if to == 'DICT': text = format_dict([data], name, w, pages)
+            elif to in ('CRLE', 'PRLE'): text = format_packed(data, to, name, w, pages)
+            else: text = format_code(data, to, name)
+            with open(dst, 'w', encoding='utf-8') as f: f.write(text + "\n")
+            return f"{rel}: {w}x{h} -> {to}", errors
+        with open(path, encoding='utf-8', errors='replace') as f: source = f.read()
+        arrays = find_bitmap_arrays(source)
+        glyph_total, code = 0, []
+        for name, glyphs in arrays:
+            if to == 'DICT':
+                # Вся таблица одним словарём: размер берётся по первому корректному глифу
+                good = [vals for vals, err in glyphs if not err]
+                errors += [f"{rel}: {name}_{i}: {err}" for i, (vals, err) in enumerate(glyphs) if err]
+                if good:
+                    fmt = detect_format(len(good[0]), source, override)
+                    glyph_total += len(good)
+                    code.append(format_dict([fmt.decode(g) for g in good], name, fmt.w, fmt.pages))
+                continue
+            for i, (vals, err) in enumerate(glyphs):
+                g_name = name if len(glyphs) == 1 else f"{name}_{i}"
+                if err: errors.append(f"{rel}: {g_name}: {err}"); continue
+                glyph_total += 1
+                fmt = detect_format(len(vals), source, override)
+                w, h = fmt.w, fmt.h
+                if to == 'png':
+                    dst = os.path.join(out_dir, stem, g_name + '.png')
+                    os.makedirs(os.path.dirname(dst), exist_ok=True)
+                    write_png(dst, w, h, glyph_to_rows(fmt.decode(vals), w, h)); written += 1
+                elif to in ('CRLE', 'PRLE'):
+                    code.append(format_packed(fmt.decode(vals), to, g_name, w, fmt.pages))
+                else:
+                    code.append(f"/* {g_name} {w}x{h} */\n" + format_code(vals, to, g_name))
+        if code:
+            dst = os.path.join(out_dir, stem + '.txt')
+            os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+            with open(dst, 'w', encoding='utf-8') as f: f.write("\n\n".join(code) + "\n"); written += 1
+        return f"{rel}: {len(arrays)} arrays, {glyph_total} glyphs, {written} files, {len(errors)} errors", errors
+    except (OSError, ValueError, KeyError, struct.error, zlib.error) as e:
+        errors.append(f"{rel}: {e}")
+        return f"{rel}: FAILED", errors
+
+def run_batch(args):
+    src = os.path.abspath(args.src)
+    files = []
+    for d, _, names in os.walk(src):
+        for n in sorted(names):
+            ext = os.path.splitext(n)[1].lower()
+            if ext in SOURCE_EXTS or ext in IMAGE_EXTS: files.append(os.path.join(d, n))
+    if os.path.isfile(src): files, src = [src], os.path.dirname(src)
+    fit = tuple(int(v) for v in args.fit.lower().split('x')) if args.fit else None
+    img = (fit, args.stretch, args.dither.upper(), args.threshold, args.invert)
+    jobs = []
+    for f in sorted(files):
+        is_image = f.lower().endswith(IMAGE_EXTS)
+        to = args.to.upper() if args.to != 'png' else 'png'
+        if is_image and to == 'png': to = 'HEX'
+        jobs.append((f, src, args.out, to, img, args.format))
+    t0 = time.perf_counter()
+    if len(jobs) > 1 and args.jobs != 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs or None) as pool:
+            results = list(pool.map(convert_file, jobs, chunksize=max(1, len(jobs) // 32)))
+    else:
+        results = [convert_file(j) for j in jobs]
+    all_errors = []
+    for summary, errors in results:
+        print(summary)
+        for e in errors: print("  ! " + e)
+        all_errors += errors
+    print(f"{len(jobs)} files in {time.perf_counter() - t0:.2f}s, {len(all_errors)} malformed blocks")
+    return 1 if all_errors else 0
+
+def run_sheet(args):
+    """Лист PNG на каждый массив глифов: <out>/<файл>_<массив>.png"""
+    colors = theme_colors(THEMES[args.theme], args.invert)
+    override = parse_format(args.format) if args.format else None
+    os.makedirs(args.out, exist_ok=True)
+    t0, count = time.perf_counter(), 0
+    for path in args.files:
+        with open(path, encoding='utf-8', errors='replace') as f: source = f.read()
+        stem = os.path.splitext(os.path.basename(path))[0]
+        for name, glyphs in find_bitmap_arrays(source):
+            good = [vals for vals, err in glyphs if not err]
+            if not good: continue
+            fmt = detect_format(len(good[0]), source, override)
+            dst = os.path.join(args.out, f"{stem}_{name}.png")
+            size = contact_sheet(dst, [fmt.decode(v) for v in good], fmt.w, fmt.h, colors, args.scale, args.stretch,
+                                 args.grid, args.cols, True, args.first)
+            print(f"{dst}: {len(good)} glyphs {fmt}, {size[0]}x{size[1]}")
+            count += 1
+    print(f"{count} sheets in {time.perf_counter() - t0:.2f}s")
+    return 0 if count else 1
+
+def run_project(args):
+    """Список активов проекта; --add дописывает массивы из исходников (шрифт, если глифов больше одного)"""
+    project = Project(args.file)
+    override = parse_format(args.format) if args.format else None
+    for path in args.add:
+        with open(path, encoding='utf-8', errors='replace') as f: source = f.read()
+        for name, glyphs in find_bitmap_arrays(source):
+            good = [vals for vals, err in glyphs if not err]
+            if not good: continue
+            fmt = detect_format(len(good[0]), source, override)
+            data = b''.join(fmt.decode(v) for v in good)
+            kind = "font" if len(good) > 1 else "screen" if (fmt.w, fmt.h) == (128, 64) else "glyph"
+            project.save(name, kind, data, fmt.w, fmt.h, len(good), format=str(fmt))
+    if args.compact: project.compact()
+    for name in project.names():
+        e = project.assets[name]
+        print(f"{name:<24} {e['kind']:<6} {e['w']}x{e['h']} x{e['count']:<4} {e['raw']:>6}B -> {e['size']:>6}B v{len(e['history']) + 1}")
+    print(f"{len(project.assets)} assets, {os.path.getsize(args.file)} bytes, {project.garbage()} unused")
+    project.close()
+    return 0
+
+def run_dedup(args):
+    sources = []
+    for path in args.files:
+        with open(path, encoding='utf-8', errors='replace') as f: sources.append(f.read())
+    code = dedup_source("\n".join(sources), args.near)
+    if code is None:
+        print("no bitmap arrays found", file=sys.stderr)
+        return 1
+    print(code)
+    return 0
+
+def run_patch(args):
+    screens = []
+    for path in (args.before, args.after):
+        with open(path, encoding='utf-8', errors='replace') as f:
+            screens.append(FrameBuffer(128, 64, byte_values(f.read())).to_bytes())
+    runs = lcd_patch(screens[0], screens[1], 128, args.gap)
+    print(format_patch(runs, screens[1], args.name, 128))
+    return 0
+
+# --- ЗАМЕРЫ ПРОИЗВОДИТЕЛЬНОСТИ (CLI bench) ---
+def bench_inputs():
+    """Фиксированные входные данные: шрифт 95 глифов 7x16, полный экран 128x64, блок gStatusLine на 200 строк"""
+    seq = [(i * 2654435761 >> 7) & 0xFF for i in range(1, 95 * 14 + 1024 + 200 + 1)]  # детерминированный «шум»
+    font = seq[:95 * 14]
+    screen = bytes(seq[95 * 14:95 * 14 + 1024])
+    status = seq[-200:]
+    font_text = "const uint8_t gFontBig[95][14] = {\n" + "".join(
+        "    {" + ", ".join(HEX_LITERALS[v] for v in font[g * 14:(g + 1) * 14]) + f"}}, // {chr(32 + g)!r}\n" for g in range(95)) + "};\n"
+    screen_text = format_code(screen, "HEX", "screen")
+    status_text = "\n".join(f"gStatusLine[BATTERY_X + {i}] |= {HEX_LITERALS[v]};" for i, v in enumerate(status))
+    return {"font": font_text, "screen": screen_text, "status": status_text, "screen_bytes": screen}
+
+def bench_time(fn, repeat=15, setup=None):
+    """Медиана и минимум по repeat прогонам (мс); setup выполняется вне замера"""
+    times = []
+    for _ in range(repeat):
+        if setup: setup()
+        t0 = time.perf_counter(); fn(); times.append((time.perf_counter() - t0) * 1000)
+    times.sort()
+    return {"median_ms": round(times[len(times) // 2], 4), "min_ms": round(times[0], 4), "runs": repeat}
+
+def bench_core(inp, repeat):
+    res = {}
+    for key in ("font", "screen", "status"):
+        text = inp[key]
+        res[f"parse.{key}.cold"] = bench_time(lambda: BitmapTokenizer().values(text), repeat)
+        TOKENIZER.values(text)
+        res[f"parse.{key}.warm"] = bench_time(lambda: TOKENIZER.values(text), repeat)
+    fb = FrameBuffer(128, 64, inp["screen_bytes"])
+    for mode in ("HEX", "STATUS", "BIN"):
+        res[f"generate.{mode.lower()}"] = bench_time(lambda: format_code(fb.extract(0, 0, 128, 64), mode, "screen", ""), repeat)
+    res["generate.hex.template"] = bench_time(lambda: format_code(fb.extract(0, 0, 128, 64), "HEX", "screen", inp["screen"]), repeat)
+    def autocrop():
+        # Загрузка экрана (полный пересчёт счётчиков) + рамка + вырезка — как в SMART CROP после вставки
+        fb.load(inp["screen_bytes"])
+        x0, y0, x1, y1 = fb.bbox()
+        return fb.extract(x0, y0, x1 - x0 + 1, ((y1 - y0) // 8 + 1) * 8)
+    res["autocrop"] = bench_time(autocrop, repeat)
+    colors = theme_colors(THEMES['O'])
+    sheet = [bytes(inp["screen_bytes"][g * 4:g * 4 + 16]) for g in range(256)]  # 256 глифов 8x16
+    path = os.path.join(tempfile.gettempdir(), "ouro_bench_sheet.png")
+    res["png.sheet256"] = bench_time(lambda: contact_sheet(path, sheet, 8, 16, colors, 4, 1.45, True), repeat)
+    res["png.screen"] = bench_time(lambda: export_png(path, fb, 0, 0, 128, 64, colors, 8, 1.45), repeat)
+    return res
+
+def bench_ui(inp, repeat):
+    """Замеры окна редактора; нужен дисплей (на сервере — под Xvfb: xvfb-run python ... bench)"""
+    try: editor = OuroMasterEditor()
+    except tk.TclError as e:
+        print(f"UI benchmarks skipped: {e}")
+        return {}
+    res = {}
+    try:
+        editor.update()
+        editor.fb.load(inp["screen_bytes"])
+        for scale in (4, 8, 20):
+            editor.SCALE = scale
+            res[f"ui.redraw.scale{scale}"] = bench_time(lambda: (editor.redraw_full(), editor.update_idletasks()), repeat)
+        editor.SCALE = 8
+        editor.FRAME_MS = 0  # кадр = один update() ниже, без ожидания таймера
+        editor.redraw_full(); editor.update()
+        dx, dy = editor.canvas_offset
+        px_off = dx + editor.PADDING * editor.SCALE - editor.canvas.canvasx(0)
+        py_off = dy + int(editor.PADDING * editor.SCALE * editor.STRETCH_Y) - editor.canvas.canvasy(0)
+        step_y = editor.SCALE * editor.STRETCH_Y
+        # 500 точек мыши по синусоиде через всю ширину, по 8 событий на кадр — через обработчики событий холста
+        samples = [(int(px_off + (i * 127 / 499 + 0.5) * editor.SCALE),
+                    int(py_off + (32 + 28 * ((i % 100) / 50 - 1)) * step_y)) for i in range(500)]
+        canvas = editor.canvas
+        def reset():
+            editor.journal.clear(); editor.fb.clear(); editor.redraw_full(); editor.update_idletasks()
+        def stroke():
+            canvas.event_generate("<Button-1>", x=samples[0][0], y=samples[0][1])
+            for k in range(0, 500, 8):
+                for x, y in samples[k:k + 8]: canvas.event_generate("<B1-Motion>", x=x, y=y, state=0x100)
+                editor.update()
+            canvas.event_generate("<ButtonRelease-1>", x=samples[-1][0], y=samples[-1][1])
+            editor.update_idletasks()
+        res["ui.stroke500"] = bench_time(stroke, repeat, setup=reset)
+        res["ui.undo"] = bench_time(lambda: (editor.undo(), editor.update_idletasks()), repeat, setup=lambda: (reset(), stroke()))
+    finally:
+        editor.destroy()
+    return res
+
+def compare_bench(results, baseline, threshold):
+    """Печатает сравнение с эталоном; возвращает список замедлившихся замеров"""
+    slow = []
+    for name, cur in sorted(results.items()):
+        old = baseline.get(name)
+        if not old: print(f"{name:28s} {cur['median_ms']:10.3f} ms   (new)"); continue
+        ratio = cur["median_ms"] / max(old["median_ms"], 1e-6)
+        flag = ratio > 1 + threshold
+        if flag: slow.append(name)
+        print(f"{name:28s} {cur['median_ms']:10.3f} ms  {old['median_ms']:10.3f} ms  x{ratio:5.2f}{'  SLOWER' if flag else ''}")
+    return slow
+
+def run_bench(args):
+    inp = bench_inputs()
+    results = bench_core(inp, args.repeat)
+    if not args.no_ui: results.update(bench_ui(inp, max(3, args.repeat // 3)))
+    report = {"python": sys.version.split()[0], "platform": sys.platform, "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+              "results": results}
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f: json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f: baseline = json.load(f)["results"]
+        slow = compare_bench(results, baseline, args.threshold)
+        if slow: print(f"{len(slow)} benchmarks slower than baseline by more than {args.threshold:.0%}")
+        return 1 if slow else 0
+    for name, r in sorted(results.items()): print(f"{name:28s} {r['median_ms']:10.3f} ms  (min {r['min_ms']:.3f})")
+    return 0
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        OuroMasterEditor().mainloop()
+        return 0
+    ap = argparse.ArgumentParser(prog="К1_5_UI_DEV.py", description="K1/K5 UI editor. Without arguments starts the GUI.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("batch", help="convert bitmap arrays in .c/.h files to PNG/code, or PNG/BMP/PGM images to code")
+    b.add_argument("src", help="source directory (or a single file)")
+    b.add_argument("-o", "--out", default="ouro_out", help="output directory (default: ouro_out)")
+    b.add_argument("--to", choices=["png", "hex", "bin", "status", "crle", "prle", "dict"], default="png",
+                   help="C sources: png or re-emitted code; images are always encoded (png means hex)")
+    b.add_argument("--fit", metavar="WxH", help="images: scale to fit WxH LCD pixels (default: keep size)")
+    b.add_argument("--stretch", type=float, default=1.0, help="images: LCD pixel aspect (height/width) used with --fit")
+    b.add_argument("--dither", choices=["thresh", "floyd", "bayer"], default="thresh", help="images: binarization")
+    b.add_argument("--threshold", type=int, default=128, help="images: gray level below which a pixel is lit")
+    b.add_argument("--invert", action="store_true", help="images: light pixels are lit")
+    b.add_argument("--format", metavar="WxH[ msb][ columns]",
+                   help="glyph format of source arrays (default: /* format: ... */ hint in the file, else guessed from size)")
+    b.add_argument("-j", "--jobs", type=int, default=0, help="worker processes (0 = all cores, 1 = no pool)")
+    b.set_defaults(func=run_batch)
+    pt = sub.add_parser("patch", help="minimal LCD update between two full 128x64 framebuffers")
+    pt.add_argument("before", help="file with the 1024-byte 'before' screen (C array)")
+    pt.add_argument("after", help="file with the 1024-byte 'after' screen (C array)")
+    pt.add_argument("--gap", type=int, default=PATCH_OVERHEAD, help="merge runs separated by at most this many columns")
+    pt.add_argument("--name", default="screen_patch", help="C array name")
+    pt.set_defaults(func=run_patch)
+    dd = sub.add_parser("dedup", help="find duplicate and near-duplicate glyphs across bitmap arrays")
+    dd.add_argument("files", nargs="+", help=".c/.h files with bitmap arrays")
+    dd.add_argument("--near", type=int, default=0, help="also list glyph pairs that differ in at most N pixels")
+    dd.set_defaults(func=run_dedup)
+    sh = sub.add_parser("sheet", help="render every glyph table to a PNG contact sheet with index labels")
+    sh.add_argument("files", nargs="+", help=".c/.h files with bitmap arrays")
+    sh.add_argument("-o", "--out", default="ouro_sheets", help="output directory (default: ouro_sheets)")
+    sh.add_argument("--scale", type=int, default=4, help="pixels per LCD pixel (default: 4)")
+    sh.add_argument("--stretch", type=float, default=1.0, help="LCD pixel aspect, height/width (editor RATIO)")
+    sh.add_argument("--theme", choices=sorted(THEMES), default="O", help="color theme")
+    sh.add_argument("--invert", action="store_true", help="inverted theme colors")
+    sh.add_argument("--grid", action="store_true", help="draw the pixel grid (scale >= 4)")
+    sh.add_argument("--cols", type=int, default=16, help="glyphs per row (default: 16)")
+    sh.add_argument("--first", type=int, default=0, help="label of the first glyph, e.g. 32 for ASCII fonts")
+    sh.add_argument("--format", metavar="WxH[ msb][ columns]", help="glyph format (default: hint in the file, else guessed)")
+    sh.set_defaults(func=run_sheet)
+    pj = sub.add_parser("project", help="list a .ouro project file, add bitmap arrays to it, or compact it")
+    pj.add_argument("file", help="project file (created if missing)")
+    pj.add_argument("--add", nargs="+", default=[], metavar="SRC", help=".c/.h files whose bitmap arrays are stored as assets")
+    pj.add_argument("--format", metavar="WxH[ msb][ columns]", help="glyph format of added arrays (default: hint, else guessed)")
+    pj.add_argument("--compact", action="store_true", help="rewrite the file without unused asset versions")
+    pj.set_defaults(func=run_project)
+    bn = sub.add_parser("bench", help="time parse/encode/redraw hot paths on fixed inputs")
+    bn.add_argument("-o", "--out", help="write results to this JSON file")
+    bn.add_argument("--compare", metavar="BASELINE", help="compare with a stored JSON baseline (exit code 1 on slowdown)")
+    bn.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown vs baseline (default: 0.2 = 20%%)")
+    bn.add_argument("--repeat", type=int, default=15, help="runs per benchmark (median is reported)")
+    bn.add_argument("--no-ui", action="store_true", help="skip the Tk benchmarks (no display needed)")
+    bn.set_defaults(func=run_bench)
+    args = ap.parse_args(argv)
+    return args.func(args)
 
 if __name__ == "__main__":
-    OuroMasterEditor().mainloop()
\ No newline at end of file
+    sys.exit(main())